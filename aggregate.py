@@ -0,0 +1,129 @@
+""" Сводные значения по столбцам файла (параметр agg запроса).
+
+Функции через запятую: 'count' - число строк, 'count:имя' - число непустых значений, 'sum:имя', 'avg:имя' - сумма
+и среднее числовых значений, 'min:имя', 'max:имя' - наименьшее и наибольшее значение с учётом типа столбца,
+'distinct:имя' - различные значения по возрастанию. Например: 'count,sum:price,distinct:region'.
+Пустые значения и значения, не приводимые к нужному типу, функциями со столбцом не учитываются.
+Строки обрабатываются порциями за один проход, в памяти хранятся только промежуточные значения.
+"""
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+import schema
+
+# Разделитель функций.
+function_separator: str = ','
+# Разделитель функции и столбца.
+column_separator: str = ':'
+
+FUNC_COUNT: str = 'count'
+FUNC_SUM: str = 'sum'
+FUNC_AVG: str = 'avg'
+FUNC_MIN: str = 'min'
+FUNC_MAX: str = 'max'
+FUNC_DISTINCT: str = 'distinct'
+FUNCTIONS: Tuple[str, ...] = (FUNC_COUNT, FUNC_SUM, FUNC_AVG, FUNC_MIN, FUNC_MAX, FUNC_DISTINCT)
+
+
+def parse_agg(agg: str) -> List[Tuple[str, Optional[str]]]:
+    """ Разбор значения параметра agg.
+
+    :return: Список пар (функция, имя столбца или None).
+    :raises ValueError: Функция не распознана или для неё не указан столбец.
+    """
+    specs: List[Tuple[str, Optional[str]]] = []
+    for spec in agg.split(function_separator):
+        func, _, colname = spec.partition(column_separator)
+        if func not in FUNCTIONS:
+            raise ValueError("Неизвестная функция: {}".format(spec))
+        if not colname and func != FUNC_COUNT:
+            raise ValueError("Не указан столбец: {}".format(spec))
+        specs.append((func, colname or None))
+    return specs
+
+
+def agg_columns(specs: List[Tuple[str, Optional[str]]]) -> List[str]:
+    """ Имена столбцов, используемых функциями (без повторов). """
+    return list(dict.fromkeys(colname for _, colname in specs if colname))
+
+
+def _convert_all(values: Iterable[str], convert: Callable[[str], Any]) -> List[Tuple[Any, str]]:
+    """ Пары (приведённое значение, значение) для приводимых значений. """
+    result: List[Tuple[Any, str]] = []
+    for value in values:
+        try:
+            number = convert(value)
+        except ValueError:
+            continue
+        if number == number:
+            # NaN не учитывается.
+            result.append((number, value))
+    return result
+
+
+class Aggregator:
+    """ Вычисление сводных значений по порциям строк. """
+    def __init__(self, specs: List[Tuple[str, Optional[str]]], header: Sequence[str],
+                 types: Optional[Dict[str, str]] = None):
+        """
+
+        :param specs: Функции (см. parse_agg).
+        :param header: Заголовок строк, передаваемых в update.
+        :param types: Типы столбцов файла {'имя столбца': 'тип'}. Для отсутствующих - строковый.
+        :raises ValueError: Столбца нет в заголовке.
+        """
+        self.__specs = specs
+        self.__index: List[Optional[int]] = [header.index(colname) if colname else None for _, colname in specs]
+        self.__types: List[str] = [(types or {}).get(colname, schema.TYPE_STR) if colname else schema.TYPE_STR
+                                   for _, colname in specs]
+        self.__rows: int = 0
+        # Промежуточные значения функций: счётчик, сумма и число слагаемых, (ключ, значение), множество.
+        self.__state: List[Any] = [None if func in (FUNC_MIN, FUNC_MAX) else set() if func == FUNC_DISTINCT else
+                                   [0, 0] if func in (FUNC_SUM, FUNC_AVG) else 0 for func, _ in specs]
+
+    def update(self, rows: List[Sequence[str]]) -> None:
+        """ Учёт порции строк. """
+        self.__rows += len(rows)
+        columns: Dict[int, List[str]] = {}
+        for num, ((func, _), idx, type_name) in enumerate(zip(self.__specs, self.__index, self.__types)):
+            if idx is None:
+                continue
+            if idx not in columns:
+                # Непустые значения столбца порции (в коротких строках значения нет).
+                columns[idx] = [row[idx] for row in rows if idx < len(row) and row[idx]]
+            values = columns[idx]
+
+            if func == FUNC_COUNT:
+                self.__state[num] += len(values)
+            elif func == FUNC_DISTINCT:
+                self.__state[num].update(values)
+            elif func in (FUNC_SUM, FUNC_AVG):
+                numbers = _convert_all(values, schema.value_converter(schema.TYPE_NUM))
+                self.__state[num][0] += sum(number for number, _ in numbers)
+                self.__state[num][1] += len(numbers)
+            else:
+                choose = min if func == FUNC_MIN else max
+                if type_name == schema.TYPE_STR:
+                    candidates: List[Tuple[Any, str]] = [(choose(values),) * 2] if values else []
+                else:
+                    candidates = _convert_all(values, schema.value_converter(type_name))
+                if self.__state[num] is not None:
+                    candidates.insert(0, self.__state[num])
+                if candidates:
+                    # При равных ключах остаётся значение, встретившееся первым.
+                    self.__state[num] = choose(candidates, key=lambda pair: pair[0])
+
+    def result(self) -> Dict[str, Any]:
+        """ Сводные значения: {'функция[:столбец]': значение}. """
+        result: Dict[str, Any] = {}
+        for (func, colname), state in zip(self.__specs, self.__state):
+            name = func + column_separator + colname if colname else func
+            if func == FUNC_COUNT:
+                result[name] = state if colname else self.__rows
+            elif func == FUNC_SUM:
+                result[name] = state[0]
+            elif func == FUNC_AVG:
+                result[name] = state[0] / state[1] if state[1] else None
+            elif func == FUNC_DISTINCT:
+                result[name] = sorted(state)
+            else:
+                result[name] = state[1] if state is not None else None
+        return result
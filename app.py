@@ -0,0 +1,123 @@
+""" Постоянно работающий сервер: обслуживает запросы /get_cgi.py и /auth_cgi.py без запуска интерпретатора
+на каждый запрос. Соединения с БД, кэши и импортированные модули живут между запросами.
+
+WSGI-приложение - application, asyncio-вариант (ASGI) - asgi_application.
+Пути к файлам относительные, поэтому сервер запускается из директории cgi-bin:
+    python app.py [-host=...] [-port=...]     - встроенный многопоточный WSGI-сервер
+    uvicorn app:asgi_application              - любой ASGI-сервер
+"""
+import asyncio
+import sys
+import threading
+from socketserver import ThreadingMixIn
+from typing import Any, Callable, Dict, Iterable, Optional
+from urllib.parse import parse_qs
+from wsgiref.simple_server import WSGIServer, make_server
+import auth_cgi
+import get_cgi
+from common import Answer
+from db import UsersDBInterface, SessionCache
+from result_cache import FileBody, read_chunk_size
+
+# Адрес и порт встроенного сервера по умолчанию.
+default_host: str = '127.0.0.1'
+default_port: int = 8000
+
+# Интерфейс доступа к базе данных пользователей, общий для всех запросов процесса (см. users_db())
+_db: Optional[UsersDBInterface] = None
+_db_lock = threading.Lock()
+
+
+def users_db() -> UsersDBInterface:
+    """ Интерфейс доступа к базе данных пользователей, создаётся при первом запросе.
+    Проверки токенов кэшируются, обновления времени обращения записываются в БД пачками. """
+    global _db
+    with _db_lock:
+        if _db is None:
+            _db = SessionCache(get_cgi.make_db())
+    return _db
+
+
+def dispatch(path: str, query_string: str, content_type: Optional[str], if_none_match: Optional[str] = None,
+             accept_encoding: Optional[str] = None) -> Answer:
+    """ Выбор обработчика по пути запроса.
+
+    :param path: Путь запроса, вида '/cgi-bin/get_cgi.py'
+    :param query_string: Строка параметров запроса.
+    :param content_type: Заголовок Content-Type запроса.
+    :param if_none_match: Заголовок If-None-Match запроса.
+    :param accept_encoding: Заголовок Accept-Encoding запроса.
+    :return: Ответ обработчика.
+    """
+    request = parse_qs(query_string, keep_blank_values=True)
+    if path.endswith('/get_cgi.py'):
+        return get_cgi.handle(request, users_db(), content_type, if_none_match, accept_encoding)
+    if path.endswith('/auth_cgi.py'):
+        return auth_cgi.handle(request, users_db())
+    return Answer([('Content-Type', 'text/plain')], [b'Not Found'], '404 Not Found')
+
+
+def application(environ: Dict[str, Any], start_response: Callable) -> Iterable[bytes]:
+    """ WSGI-приложение. """
+    answer = dispatch(environ.get('PATH_INFO', ''), environ.get('QUERY_STRING', ''), environ.get('CONTENT_TYPE'),
+                      environ.get('HTTP_IF_NONE_MATCH'), environ.get('HTTP_ACCEPT_ENCODING'))
+    start_response(answer.status, answer.headers)
+    if isinstance(answer.body, FileBody) and 'wsgi.file_wrapper' in environ:
+        # Ответ из кэша: сервер может отправить файл напрямую, без чтения в память (sendfile).
+        return environ['wsgi.file_wrapper'](answer.body.file, read_chunk_size)
+    return answer.body
+
+
+async def asgi_application(scope: Dict[str, Any], receive: Callable, send: Callable) -> None:
+    """ ASGI-приложение. Обработчики синхронные, поэтому они и чтение частей ответа выполняются в пуле потоков,
+    не блокируя цикл событий. """
+    if scope['type'] == 'lifespan':
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    if scope['type'] != 'http':
+        return
+
+    loop = asyncio.get_running_loop()
+    headers = {name.decode('latin-1').lower(): value.decode('latin-1') for name, value in scope['headers']}
+    answer = await loop.run_in_executor(None, dispatch, scope['path'], scope['query_string'].decode('latin-1'),
+                                        headers.get('content-type'), headers.get('if-none-match'),
+                                        headers.get('accept-encoding'))
+
+    await send({'type': 'http.response.start', 'status': int(answer.status.split()[0]),
+                'headers': [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                            for name, value in answer.headers]})
+    body = iter(answer.body)
+    try:
+        while True:
+            part = await loop.run_in_executor(None, next, body, None)
+            if part is None:
+                break
+            await send({'type': 'http.response.body', 'body': part, 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+    finally:
+        close = getattr(body, 'close', None)
+        if close:
+            close()
+
+
+class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    """ Встроенный WSGI-сервер, обрабатывающий каждый запрос в отдельном потоке. """
+    daemon_threads = True
+
+
+def serve(host: str = default_host, port: int = default_port) -> None:
+    """ Запуск встроенного WSGI-сервера. """
+    with make_server(host, port, application, server_class=ThreadingWSGIServer) as server:
+        print("Serving on http://{}:{}/".format(host, port))
+        server.serve_forever()
+
+
+if __name__ == '__main__':
+    params: Dict[str, str] = dict(arg.split('=', 1) for arg in sys.argv[1:] if '=' in arg)
+    serve(params.get('-host', default_host), int(params.get('-port', default_port)))
@@ -0,0 +1,336 @@
+""" Асинхронная пакетная загрузка файлов (main.py -async).
+
+Получение ответа из сети, расшифровка кадров и запись строк на диск идут одновременно, а запрос списка файлов
+(-list -info) отправляется вместе с запросами файлов; при -all загрузки начинаются, как только получен список.
+
+requests - блокирующая библиотека, поэтому её вызовы и запись на диск выполняются в пуле потоков, а цикл событий
+asyncio связывает их: для каждого файла чтение ответа кладёт куски в ограниченную очередь (asyncio.Queue),
+а расшифровка и запись забирают их оттуда. Пока очередная порция строк расшифровывается и пишется, следующие куски
+уже принимаются; если очередь заполнена, чтение ждёт, поэтому память ограничена queue_chunks кусками на файл.
+
+Сохранение файлов, манифест, повторные попытки и результаты (main.Download) - те же, что у main.receive_files.
+"""
+import asyncio
+import csv
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, NamedTuple, Optional, Set, Tuple, Union
+import requests
+import requests.adapters
+import common
+import main
+import protocol
+import timing
+
+# Наибольшее число кусков ответа (по main.read_chunk_size) в очереди между чтением из сети и расшифровкой,
+# для каждого загружаемого файла.
+queue_chunks: int = 16
+
+
+class Listing(NamedTuple):
+    """ Результат запроса списка файлов. """
+    # Статус запроса (None - ответ не получен)
+    status: Optional[common.RequestStatus]
+    # Список файлов: {'имя файла': сведения о столбцах} (None - при ошибке)
+    content: Optional[dict]
+    # Замеры этапов запроса (см. main.send_request)
+    timings: timing.Timings = timing.NULL
+    # Ошибка, из-за которой ответ не получен (None - запрос завершился ответом сервера)
+    error: Optional[Exception] = None
+
+
+class _LegacyDecoder:
+    """ Пошаговый разбор ответа в прежнем формате (строки вида repr(pickle)) на кадры, как protocol.FrameDecoder.
+    Ответ заканчивается вместе с потоком, без кадра конца. """
+
+    def __init__(self):
+        self.__tail: bytes = b''
+        self.__is_status_read: bool = False
+        self.finished: bool = False
+
+    def feed(self, chunk: bytes) -> List[Tuple[int, Any]]:
+        lines: List[bytes] = (self.__tail + chunk).split(b'\n')
+        self.__tail = lines.pop()
+        frames: List[Tuple[int, Any]] = []
+        for line in lines:
+            line = line.rstrip(b'\r')
+            if not line:
+                continue
+            answer: dict = main.decode_line(line)
+            if not self.__is_status_read:
+                frames += [(protocol.FRAME_STATUS, answer['status'].value), (protocol.FRAME_HEADER, answer['content'])]
+                self.__is_status_read = True
+            else:
+                frames.append((protocol.FRAME_ROWS, answer['content']))
+        return frames
+
+    def close(self) -> List[Tuple[int, Any]]:
+        """ Конец потока: последняя строка ответа может быть без перевода строки. """
+        frames = self.feed(b'\n')
+        self.finished = True
+        return frames
+
+
+class _Pipeline:
+    """ Общее для всех загрузок пакета: цикл событий, пул потоков, сессия requests, токен. """
+
+    def __init__(self, executor: ThreadPoolExecutor, session: requests.Session, token: str, timed: bool):
+        self.loop = asyncio.get_running_loop()
+        self.executor = executor
+        self.session = session
+        self.token = token
+        self.timed = timed
+
+    def run(self, func: Callable, *args: Any, **kwargs: Any) -> 'asyncio.Future[Any]':
+        """ Вызов блокирующей функции в пуле потоков. """
+        return self.loop.run_in_executor(self.executor, partial(func, *args, **kwargs))
+
+
+async def _read_chunks(pipeline: _Pipeline, chunks: Iterator[bytes], queue: 'asyncio.Queue[Any]',
+                       stop: asyncio.Event) -> None:
+    """ Чтение кусков ответа в пуле потоков в очередь. Конец ответа - None, ошибка сети - исключение в очереди. """
+    try:
+        while not stop.is_set():
+            chunk: Optional[bytes] = await pipeline.run(next, chunks, None)
+            if chunk is None:
+                break
+            await queue.put(chunk)
+    except Exception as e:
+        # Ошибка выбрасывается при расшифровке, которая иначе ждала бы конца ответа.
+        await queue.put(e)
+        return
+    await queue.put(None)
+
+
+async def _take_chunks(queue: 'asyncio.Queue[Any]') -> Tuple[bytes, bool]:
+    """ Все куски, накопившиеся в очереди (не меньше одного), одним куском: если расшифровка и запись отстают
+    от сети, они обрабатывают сразу несколько кусков за одно обращение к пулу потоков.
+
+    :return: Данные и признак конца ответа. Ошибка чтения ответа выбрасывается.
+    """
+    items: List[Any] = [await queue.get()]
+    while items[-1] is not None and not isinstance(items[-1], Exception) and not queue.empty():
+        items.append(queue.get_nowait())
+    if isinstance(items[-1], Exception):
+        raise items[-1]
+    is_end: bool = items[-1] is None
+    return b''.join(items[:-1] if is_end else items), is_end
+
+
+def _decode(decoder: Any, data: bytes, is_end: bool, timings: timing.Timings) -> List[Tuple[int, Any]]:
+    """ Расшифровка кадров (в пуле потоков). """
+    with timings.span('decode'):
+        frames: List[Tuple[int, Any]] = decoder.feed(data)
+        if is_end and not decoder.finished:
+            frames += decoder.close()
+    return frames
+
+
+def _write_frames(csvwriter: Any, frames: List[Tuple[int, Any]], is_resumed: bool, timings: timing.Timings) -> None:
+    """ Запись кадров заголовка и строк в файл (в пуле потоков). """
+    with timings.span('write'):
+        for frame_type, value in frames:
+            if frame_type == protocol.FRAME_HEADER and not is_resumed:
+                csvwriter.writerow(value)
+            elif frame_type == protocol.FRAME_ROWS:
+                csvwriter.writerows(value)
+                timings.count('rows', len(value))
+
+
+def _decode_and_write(decoder: Any, data: bytes, is_end: bool, csvwriter: Any, is_resumed: bool,
+                      timings: timing.Timings) -> None:
+    _write_frames(csvwriter, _decode(decoder, data, is_end, timings), is_resumed, timings)
+
+
+async def receive_file(pipeline: _Pipeline, url: str, params: Dict[str, str], headers: Dict[str, str],
+                       filename: str, resume: bool = False, timings: timing.Timings = timing.NULL) -> \
+        Tuple[common.RequestStatus, Optional[str]]:
+    """ Потоковая загрузка файла: то же, что main.receive_file, но чтение из сети идёт одновременно
+    с расшифровкой и записью на диск.
+
+    :param timings: замеры этапов: 'network' (ожидание и чтение ответа), 'decode', 'write'; счётчики 'bytes',
+        'rows'. Этапы идут одновременно, поэтому их сумма может быть больше общего времени.
+    :return: статус запроса, имя сохранённого файла (None, если файл не сохранён)
+    """
+    key, entry, request_headers, is_resumed = main.prepare_file_request(params, headers, resume)
+    params['token'] = pipeline.token
+    params['stream'] = ''
+
+    # Чтение ответа идёт в своём потоке, одновременно с расшифровкой, и замеряется отдельно.
+    network: timing.Timings = timing.Timings() if pipeline.timed else timing.NULL
+    with network.span('network'):
+        response: requests.Response = await pipeline.run(pipeline.session.get, url, params=params,
+                                                         headers=request_headers, stream=True)
+    queue: 'asyncio.Queue[Any]' = asyncio.Queue(maxsize=queue_chunks)
+    stop = asyncio.Event()
+    reader: Optional[asyncio.Task] = None
+    try:
+        if response.status_code == 304:
+            # Результат не изменился.
+            return common.RequestStatus.NOT_MODIFIED, entry['file']
+
+        decoder: Any = protocol.FrameDecoder() if main.is_binary(response) else _LegacyDecoder()
+        chunks = network.iterate('network', response.iter_content(chunk_size=main.read_chunk_size))
+        reader = asyncio.ensure_future(_read_chunks(pipeline, network.counted('bytes', chunks, len), queue, stop))
+
+        # Первый кадр - статус запроса.
+        frames: List[Tuple[int, Any]] = []
+        is_end: bool = False
+        while not frames and not is_end:
+            data, is_end = await _take_chunks(queue)
+            frames = await pipeline.run(_decode, decoder, data, is_end, timings)
+        if not frames:
+            raise ValueError("Ответ без статуса.")
+        status = common.RequestStatus(frames.pop(0)[1])
+        if status == common.RequestStatus.BAD_REQUEST and is_resumed:
+            # Файл на сервере изменён не дописыванием: загружается заново целиком.
+            del params['from_byte']
+            return await receive_file(pipeline, url, params, request_headers, filename, timings=timings)
+        if status != common.RequestStatus.OK:
+            return status, None
+
+        filename = entry['file'] if entry is not None else main.unic_filename(filename)
+        # Новый файл пишется во временный и заменяет прежний только после полной загрузки.
+        target: str = filename if is_resumed else filename + '.part'
+        size: int = 0
+        try:
+            if is_resumed:
+                size = os.path.getsize(target)
+            with open(target, 'a' if is_resumed else 'w', newline='') as csvfile:
+                csvwriter = csv.writer(csvfile)
+                # Отмена задачи не останавливает запись в пуле потоков, поэтому она не отменяется (shield),
+                # а дожидается окончания до закрытия и отката файла.
+                writing: 'asyncio.Future[None]' = pipeline.run(_write_frames, csvwriter, frames, is_resumed, timings)
+                try:
+                    await asyncio.shield(writing)
+                    while not decoder.finished:
+                        data, is_end = await _take_chunks(queue)
+                        writing = pipeline.run(_decode_and_write, decoder, data, is_end, csvwriter, is_resumed,
+                                               timings)
+                        await asyncio.shield(writing)
+                finally:
+                    await asyncio.wait([writing])
+            if not is_resumed:
+                os.replace(target, filename)
+        except BaseException as e:
+            # Загрузка прервана (в том числе отменена): файл возвращается к состоянию до неё.
+            main.discard_download(target, is_resumed, size)
+            if isinstance(e, OSError) and not isinstance(e, requests.RequestException):
+                # Не удалось записать файл (ошибки сети не относятся к записи).
+                return common.RequestStatus.OK, None
+            raise
+
+        record: dict = {'file': filename, 'etag': response.headers.get('ETag'),
+                        'end': int(response.headers.get('X-End-Offset', 0))}
+    finally:
+        if reader is not None:
+            # Чтение останавливается, очередь освобождается, чтобы оно не ждало места в ней.
+            stop.set()
+            while not reader.done():
+                while not queue.empty():
+                    queue.get_nowait()
+                await asyncio.wait([reader], timeout=0.01)
+        response.close()
+        if network is not timing.NULL:
+            for name, seconds in network.spans.items():
+                timings.spans[name] = timings.spans.get(name, 0.0) + seconds
+            for name, value in network.counters.items():
+                timings.count(name, value)
+
+    await pipeline.run(main.save_manifest_record, key, record)
+    return common.RequestStatus.OK, filename
+
+
+async def receive_one(pipeline: _Pipeline, limit: asyncio.Semaphore, url: str, params: Dict[str, str],
+                      headers: Dict[str, str], name: str, resume: bool) -> main.Download:
+    """ Загрузка одного файла пакета с повторными попытками при ошибках сети и оборванных ответах
+    (см. main.receive_one).
+
+    :param limit: ограничение числа одновременных загрузок
+    :return: результат загрузки; исключения (кроме отмены задачи) возвращаются в Download.error
+    """
+    timings: timing.Timings = timing.Timings() if pipeline.timed else timing.NULL
+    error: Optional[Exception] = None
+    async with limit:
+        for attempt in range(main.download_retries + 1):
+            if attempt:
+                await asyncio.sleep(main.retry_delay * attempt)
+            try:
+                status, filename = await receive_file(pipeline, url, dict(params, file=name), headers,
+                                                      main.saved_filename(name, params), resume, timings)
+            except (requests.RequestException, ValueError) as e:
+                # Ошибка сети или ответ, который не удалось расшифровать (оборван или пуст): попытка повторяется.
+                error = e
+                continue
+            except Exception as e:
+                return main.Download(name, None, None, 0, e, timings)
+            is_received: bool = status == common.RequestStatus.OK and filename is not None
+            return main.Download(name, status, filename, os.path.getsize(filename) if is_received else 0,
+                                 timings=timings)
+    return main.Download(name, None, None, 0, error, timings)
+
+
+async def receive_list(pipeline: _Pipeline, url: str, params: Dict[str, str], headers: Dict[str, str]) -> Listing:
+    """ Запрос списка файлов (в пуле потоков, см. main.send_request). Ошибка возвращается в Listing.error. """
+    timings: timing.Timings = timing.Timings() if pipeline.timed else timing.NULL
+    try:
+        status, content = await pipeline.run(main.send_request, url, dict(params), headers, pipeline.session,
+                                             pipeline.token, timings)
+    except Exception as e:
+        return Listing(None, None, timings, e)
+    return Listing(status, content, timings)
+
+
+async def iter_results(url: str, params: Dict[str, str], headers: Dict[str, str], names: Optional[List[str]],
+                       list_params: Optional[Dict[str, str]] = None, resume: bool = False,
+                       workers: Optional[int] = None, token: Optional[str] = None, timed: bool = False) -> \
+        AsyncIterator[Union[Listing, main.Download]]:
+    """ Асинхронная загрузка нескольких файлов с одинаковыми параметрами запроса и, при необходимости, списка файлов.
+
+    :param url: адрес запроса.
+    :param params: параметры запроса без имени файла (cols, sort, where)
+    :param headers: заголовок запроса. Обязательно с 'Content-Type': 'application/octet-stream'
+    :param names: имена файлов на сервере; None - все файлы из списка (он запрашивается в любом случае)
+    :param list_params: параметры запроса списка файлов ({'list': '', 'info': ''}); None - список не нужен
+        (при names=None - запрос без сведений о столбцах)
+    :param resume: дозагрузить только строки, дописанные в файлы после прошлой загрузки (см. main.receive_file)
+    :param workers: число одновременных загрузок (None - main.download_workers)
+    :param token: токен сеанса, None - прочитать из файла
+    :param timed: замерять время этапов (Listing.timings, Download.timings)
+    :return: Асинхронный итератор по результатам в порядке их завершения: Listing и main.Download. Ошибки
+        отдельных запросов возвращаются в результатах (Listing.error, Download.error) и не прерывают остальные.
+    """
+    workers = workers or main.download_workers
+    token = token or main.read_token()
+    if names is None and list_params is None:
+        list_params = {'list': ''}
+    with requests.Session() as session, ThreadPoolExecutor(max_workers=2 * workers + 1) as executor:
+        # Пул соединений сессии - на все одновременные загрузки и запрос списка.
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=workers + 1)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        pipeline = _Pipeline(executor, session, token, timed)
+        limit = asyncio.Semaphore(workers)
+
+        def start(name: str) -> asyncio.Task:
+            return asyncio.ensure_future(receive_one(pipeline, limit, url, params, headers, name, resume))
+
+        pending: Set[asyncio.Future] = set()
+        if list_params is not None:
+            pending.add(asyncio.ensure_future(receive_list(pipeline, url, list_params, headers)))
+        pending.update(start(name) for name in names or [])
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    result = task.result()
+                    if isinstance(result, Listing) and names is None and result.status == common.RequestStatus.OK:
+                        pending.update(start(name) for name in sorted(result.content))
+                    yield result
+        finally:
+            # Прерванная загрузка: незавершённые задачи отменяются (их потоки дочитывают текущий кусок),
+            # их файлы откатываются (см. main.discard_download).
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
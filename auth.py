@@ -1,6 +1,3 @@
-import re
-import unittest
-import requests
 import os
 import sys
 from common import RequestStatus
@@ -93,6 +90,8 @@ if __name__ == '__main__':
         # разбор команд не удался
         exit()
 
+    # requests импортируется только для запроса: разбор параметров и -help обходятся без него.
+    import requests
     # Получение токена
     response: requests.Response = requests.\
         get(url + '?login={0}&password={1}'.format(login, password))
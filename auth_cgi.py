@@ -1,10 +1,11 @@
 #!E:\miniconda3\envs\csv_test\python
 from urllib.parse import parse_qs
 import os
-from common import RequestStatus, TokenType
-import unittest
+from common import RequestStatus, TokenType, Answer, write_answer
+from typing import Dict, List, Tuple
 from db import UsersDBInterface, SQL, SESSION_WAITING_TIME
 import db_data
+import timing
 
 
 def check_query(query: dict) -> RequestStatus:
@@ -20,32 +21,16 @@ def check_query(query: dict) -> RequestStatus:
         return RequestStatus.BAD_REQUEST
 
 
-def auth(db: UsersDBInterface, login: str, password: str) -> RequestStatus:
-    """ Аутентификация пользователя.
+def auth(db: UsersDBInterface, login: str, password: str) -> Tuple[RequestStatus, TokenType]:
+    """ Аутентификация пользователя и получение нового токена сессии (одной операцией с БД).
 
     :param db: Интерфейс доступа к базе данных с пользователями.
     :param login: Логин пользователя.
     :param password: Пароль пользователя.
-    :return: Статус обработки.
+    :return: Статус обработки, токен сеанса (0, если аутентификация не удалась).
     """
     # Возможны три возвращаемых значения: RequestStatus.OK, RequestStatus.USER_NOT_FOUND, RequestStatus.WRONG_PASSWORD
-    if db.is_real_user(login):
-        if not db.login(login, password):
-            return RequestStatus.WRONG_PASSWORD
-        return RequestStatus.OK
-    else:
-        return RequestStatus.USER_NON_FOUND
-
-
-def get_token(db: UsersDBInterface, login: str) -> TokenType:
-    """ Получение токена сессии из БД.
-
-    :param db: Интерфейс доступа к базе данных пользователей.
-    :param login: Логин пользователя.
-    :return: Токен сеанса данного пользователя.
-    """
-    token = db.get_token(login)
-    return token
+    return db.authenticate_and_issue_token(login, password)
 
 
 # @unittest.skip
@@ -59,34 +44,45 @@ def get_token(db: UsersDBInterface, login: str) -> TokenType:
 #                          RequestStatus.BAD_REQUEST)
 
 
-if __name__ == "__main__":
-    # unittest.main()
+def make_db() -> UsersDBInterface:
+    """ Интерфейс доступа к базе данных пользователей с параметрами из db_data. """
+    return SQL(SESSION_WAITING_TIME, db_data.USER_NAME, db_data.USER_PASSWORD, db_data.DB_NAME,
+               db_data.TABLE_NAME, db_data.DB_IP)
 
-    print("Content-Type: text/plain")
-    print()
 
-    db: UsersDBInterface = SQL(SESSION_WAITING_TIME, db_data.USER_NAME, db_data.USER_PASSWORD, db_data.DB_NAME,
-                                 db_data.TABLE_NAME, db_data.DB_IP)
+def handle(request: Dict[str, List[str]], db: UsersDBInterface) -> Answer:
+    """ Обработка запроса к auth_cgi.py. Используется и CGI-скриптом, и постоянно работающим сервером (app.py).
 
+    :param request: Запрос, разобранный parse_qs.
+    :param db: Интерфейс доступа к базе данных с пользователями.
+    :return: Ответ: две строки - статус запроса и токен.
+    """
+    # Замеры (см. timing): этап 'db' - аутентификация и выдача токена.
+    timings = timing.start()
     # Дефолтные значения.
     status: RequestStatus = RequestStatus.OK
     token: TokenType = 0
 
-    # Выделение запроса
-    request = parse_qs(os.environ['QUERY_STRING'], keep_blank_values=True)
-    # request = {'login': ['foo_login'], 'password': ['12345']}
-
     status = check_query(request)
 
     if status != RequestStatus.BAD_REQUEST:
         # Если запрос не какой-то "кривой"
         # аутентификация
-        status = auth(db, request['login'][0], request['password'][0])
-        if status == RequestStatus.OK:
-            # Если аутентификация прошла успешно.
-            token = get_token(db, request['login'][0])
+        # и, если она прошла успешно, получение токена
+        with timings.span('db'):
+            status, token = auth(db, request['login'][0], request['password'][0])
 
-    # Отправляем две строки: статус запроса, и токен
+    # Отправляем две строки: статус запроса, и токен (клиент делит ответ по '\r\n')
     # Если статус отрицательный, то токен будет пустой строкой.
-    print(status.value)
-    print(token)
+    response = Answer([('Content-Type', 'text/plain')], ["{}\r\n{}\r\n".format(status.value, token).encode()])
+    return timing.finish(timings, response, {'handler': 'auth_cgi', 'result': status.name})
+
+
+if __name__ == "__main__":
+    # unittest.main()
+
+    # Выделение запроса
+    request = parse_qs(os.environ['QUERY_STRING'], keep_blank_values=True)
+    # request = {'login': ['foo_login'], 'password': ['12345']}
+
+    write_answer(handle(request, make_db()))
@@ -0,0 +1,126 @@
+""" Пакетная загрузка файлов клиентом: последовательно, в пуле потоков (main.receive_files) и асинхронно
+(async_client, main.py -async), в том числе вместе с запросом списка файлов (-list -info).
+
+Сервер - встроенный WSGI-сервер (app.py) на локальном адресе в отдельном процессе (чтобы он не делил с клиентом
+GIL) с базой пользователей в памяти (db.MemoryDB). Задержку сети можно имитировать: -latency - пауза перед ответом,
+-part_delay - пауза перед каждой частью ответа (порцией строк), с.
+
+Запуск: python benchmarks/bench_client.py [-files=...] [-rows=...] [-cols=...] [-workers=...] [-repeat=...]
+                                          [-latency=...] [-part_delay=...]
+"""
+import asyncio
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+# bench_util добавляет в sys.path директорию с модулями проекта.
+from bench_util import best_time
+from bench_server import QuietHandler
+import synth
+import app
+import async_client
+import db
+import get_cgi
+import main
+import protocol
+
+
+def delayed(application: Callable, latency: float, part_delay: float) -> Callable:
+    """ WSGI-приложение с паузой перед ответом и перед каждой частью ответа (имитация сети). """
+
+    def body(parts: Iterable[bytes]) -> Iterator[bytes]:
+        try:
+            for part in parts:
+                time.sleep(part_delay)
+                yield part
+        finally:
+            close = getattr(parts, 'close', None)
+            if close:
+                close()
+
+    def wrapped(environ: Dict[str, Any], start_response: Callable) -> Iterable[bytes]:
+        time.sleep(latency)
+        parts = application(environ, start_response)
+        return body(parts) if part_delay else parts
+
+    return wrapped
+
+
+def serve(files_dir: str, cache_dir: str, latency: float, part_delay: float, address: Any) -> None:
+    """ Сервер для замера (в отдельном процессе): в address передаются порт и токен. """
+    get_cgi.files_dir = files_dir
+    get_cgi.cache_dir = cache_dir
+    # Замеряется передача, а не готовые ответы.
+    get_cgi.result_cache_bytes = 0
+    users = db.MemoryDB(users={'bench': 'bench'})
+    _, token = users.authenticate_and_issue_token('bench', 'bench')
+    app._db = users
+    server = app.make_server('127.0.0.1', 0, delayed(app.application, latency, part_delay),
+                             server_class=app.ThreadingWSGIServer, handler_class=QuietHandler)
+    address.put((server.server_address[1], str(token)))
+    server.serve_forever()
+
+
+def run(files: int, rows: int, cols: int, workers: int, repeat: int, latency: float, part_delay: float) -> None:
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        files_dir = os.path.join(tmp_dir, 'files')
+        os.mkdir(files_dir)
+        names: List[str] = []
+        for num in range(files):
+            names.append('synth{}.csv'.format(num))
+            synth.make_csv(os.path.join(files_dir, names[-1]), rows, cols, 1000, seed=num)
+        address: Any = multiprocessing.Queue()
+        server = multiprocessing.Process(target=serve, args=(files_dir, os.path.join(tmp_dir, 'cache'), latency,
+                                                             part_delay, address), daemon=True)
+        server.start()
+        port, token = address.get()
+        url = 'http://127.0.0.1:{}/cgi-bin/get_cgi.py'.format(port)
+        headers: Dict[str, str] = {'Content-Type': protocol.CONTENT_TYPE, 'Accept-Encoding': 'gzip'}
+        list_params: Dict[str, str] = {'list': '', 'info': ''}
+        main.saved_dir = os.path.join(tmp_dir, 'saved')
+
+        def clean() -> None:
+            # Каждая загрузка - с пустой директорией: иначе сервер ответит 304 по манифесту.
+            shutil.rmtree(main.saved_dir, ignore_errors=True)
+            os.mkdir(main.saved_dir)
+
+        def threads(count: int, with_list: bool = False) -> None:
+            clean()
+            if with_list:
+                main.send_request(url, dict(list_params), headers, token=token)
+            for download in main.receive_files(url, {}, headers, names, workers=count, token=token):
+                assert download.filename, download
+
+        def asynchronous(list_request: Optional[Dict[str, str]] = None) -> None:
+            clean()
+
+            async def receive() -> None:
+                async for result in async_client.iter_results(url, {}, headers, names, list_request, workers=workers,
+                                                              token=token):
+                    assert isinstance(result, async_client.Listing) or result.filename, result
+
+            asyncio.run(receive())
+
+        cases: Dict[str, Callable[[], None]] = {
+            'последовательно': lambda: threads(1),
+            'потоки ({})'.format(workers): lambda: threads(workers),
+            'async ({})'.format(workers): asynchronous,
+            'список + потоки ({})'.format(workers): lambda: threads(workers, with_list=True),
+            'список + async ({})'.format(workers): lambda: asynchronous(list_params),
+        }
+        print("{} файлов x {} строк x {} столбцов, задержка {} с, пауза перед частью ответа {} с".format(
+            files, rows, cols, latency, part_delay))
+        for name, case in cases.items():
+            print("{:<30}{:>10.3f} с".format(name, best_time(case, repeat)))
+        server.terminate()
+        server.join()
+
+
+if __name__ == '__main__':
+    params: Dict[str, str] = dict(arg.split('=', 1) for arg in sys.argv[1:] if '=' in arg)
+    run(int(params.get('-files', 20)), int(params.get('-rows', 20000)), int(params.get('-cols', 8)),
+        int(params.get('-workers', 4)), int(params.get('-repeat', 3)), float(params.get('-latency', 0.02)),
+        float(params.get('-part_delay', 0.0)))
@@ -0,0 +1,46 @@
+""" Выбор и сортировка столбцов: разбор csv-файла и чтение из поколоночной копии (columnar).
+
+Запуск: python benchmarks/bench_columnar.py [строк] [столбцов]
+"""
+import csv
+import os
+import sys
+import tempfile
+from bench_util import make_rows, best_time
+import columnar
+import get_cgi
+
+
+def select(filepath: str, cols: str, sort_spec: str, use_columnar: bool) -> int:
+    get_cgi.use_columnar = use_columnar
+    _, _, rows = get_cgi.select_rows(filepath, cols, sort_spec)
+    return sum(1 for _ in rows)
+
+
+def run(rows: int, cols: int) -> None:
+    header, content = make_rows(rows, cols)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        filepath = os.path.join(tmp_dir, 'wide.csv')
+        with open(filepath, 'w', newline='') as csvfile:
+            csvwriter = csv.writer(csvfile)
+            csvwriter.writerow(header)
+            csvwriter.writerows(content)
+        del content
+        get_cgi.cache_dir = tmp_dir
+        build_time = best_time(lambda: columnar.build(os.path.join(tmp_dir, columnar.columnar_dir_name), filepath,
+                                                      get_cgi.file_encoding), 1)
+
+        print("{} строк x {} столбцов, файл {:.1f} МБ, копия построена за {:.2f} с, numpy: {}".format(
+            rows, cols, os.path.getsize(filepath) / (1024 * 1024), build_time, columnar.load_numpy() is not None))
+        print("{:<36}{:>10}{:>10}".format('запрос', 'csv, с', 'копия, с'))
+        for cols_param, sort_spec in ((header[1] + ',' + header[2], None), (header[1] + ',' + header[2], header[1]),
+                                      (header[1] + ',' + header[2], header[2] + ':desc,' + header[1]),
+                                      (None, header[1])):
+            name = 'cols={} sort={}'.format(cols_param or '*', sort_spec or '-')
+            print("{:<36}{:>10.4f}{:>10.4f}".format(
+                name, best_time(lambda: select(filepath, cols_param, sort_spec, False), 3),
+                best_time(lambda: select(filepath, cols_param, sort_spec, True), 3)))
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 200000, int(sys.argv[2]) if len(sys.argv) > 2 else 20)
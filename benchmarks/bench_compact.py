@@ -0,0 +1,74 @@
+""" Память под строки файла и сортировка: список кортежей против компактного хранилища (compact.CompactTable).
+
+Память замеряется tracemalloc: пик при чтении файла (get_cgi.get_file) и объём, занятый результатом. Сортировка -
+get_cgi.sort со сортировкой в хранилище (use_compact_sort) и без неё (строки с ключами, extsort) при одном и том же
+sort_memory_budget: без хранилища строки большого файла выгружаются во временные файлы.
+
+Запуск: python benchmarks/bench_compact.py [-rows=...] [-cols=...] [-cardinality=...] [-repeat=...] [-budget=МБ]
+"""
+import gc
+import os
+import sys
+import tempfile
+import tracemalloc
+from typing import Any, Callable, Dict, Tuple
+# bench_util добавляет в sys.path директорию с модулями проекта.
+from bench_util import best_time
+import synth
+import columnar
+import get_cgi
+
+MB: int = 1024 * 1024
+
+
+def measure_memory(load: Callable[[], Any]) -> Tuple[int, int]:
+    """ Пик памяти при вызове load и память, занятая его результатом, байт. """
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = load()
+        kept, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+    return peak, kept
+
+
+def sort_time(header: tuple, content: Any, spec: str, types: Dict[str, str], compact_sort: bool, repeat: int) -> \
+        float:
+    get_cgi.use_compact_sort = compact_sort
+    return best_time(lambda: sum(1 for _ in get_cgi.sort(header, content, spec.split(','), types)[1]), repeat)
+
+
+def run(rows: int, cols: int, cardinality: int, repeat: int, budget: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        filepath = os.path.join(tmp_dir, 'synth.csv')
+        header = synth.make_csv(filepath, rows, cols, cardinality)
+        get_cgi.cache_dir = tmp_dir
+        get_cgi.sort_tmp_dir = tmp_dir
+        get_cgi.sort_memory_budget = budget
+        types = get_cgi.schema_cache().get(filepath).column_types()
+        print("{} строк x {} столбцов, {} различных значений, файл {:.1f} МБ, numpy: {}".format(
+            rows, cols, cardinality, os.path.getsize(filepath) / MB, columnar.load_numpy() is not None))
+
+        print("{:<24}{:>12}{:>12}{:>12}".format('get_file', 'пик, МБ', 'итог, МБ', 'время, с'))
+        for name, compact_rows in (('список кортежей', False), ('compact', True)):
+            peak, kept = measure_memory(lambda: get_cgi.get_file(filepath, compact_rows=compact_rows))
+            seconds = best_time(lambda: get_cgi.get_file(filepath, compact_rows=compact_rows), repeat)
+            print("{:<24}{:>12.1f}{:>12.1f}{:>12.3f}".format(name, peak / MB, kept / MB, seconds))
+        _, _, table = get_cgi.get_file(filepath, compact_rows=True)
+        print("хранение столбцов:", ', '.join(table.column_kinds()))
+
+        _, _, content = get_cgi.get_file(filepath)
+        print("sort (бюджет {:.0f} МБ){:>20}{:>12}".format(budget / MB, 'extsort, с', 'compact, с'))
+        for spec in (header[0], header[min(3, cols - 1)], header[1] + ':desc', header[-1] + ',' + header[0] + ':desc'):
+            print("{:<36}{:>12.3f}{:>12.3f}".format(spec, sort_time(header, content, spec, types, False, repeat),
+                                                    sort_time(header, content, spec, types, True, repeat)))
+        get_cgi.schema_cache().close()
+        get_cgi._schema_cache = None
+
+
+if __name__ == '__main__':
+    params: Dict[str, str] = dict(arg.split('=', 1) for arg in sys.argv[1:] if '=' in arg)
+    run(int(params.get('-rows', 200000)), int(params.get('-cols', 8)), int(params.get('-cardinality', 1000)),
+        int(params.get('-repeat', 3)), int(float(params.get('-budget', 64)) * MB))
@@ -0,0 +1,92 @@
+""" Сжатие ответов: объём переданных данных и время загрузки файла с распаковкой при разных сжатиях.
+
+Сервер (app.py) запускается в этом же процессе с базой пользователей в памяти (db.MemoryDB), кэш ответов отключён.
+Запуск: python benchmarks/bench_compression.py [строк] [столбцов]
+"""
+import csv
+import http.client
+import os
+import sys
+import tempfile
+import threading
+import zlib
+from typing import List, Optional, Tuple
+# bench_util добавляет в sys.path директорию с модулями проекта.
+from bench_util import make_rows, best_time
+from bench_server import QuietHandler
+import app
+import content_encoding
+import db
+import get_cgi
+import protocol
+
+
+def download(port: int, query: str, encoding: Optional[str]) -> int:
+    """ Загрузка ответа с распаковкой. Возвращает число байт, переданных по сети. """
+    connection = http.client.HTTPConnection('127.0.0.1', port)
+    connection.request('GET', '/cgi-bin/get_cgi.py?' + query,
+                       headers={'Content-Type': protocol.CONTENT_TYPE, 'Accept-Encoding': encoding or 'identity'})
+    response = connection.getresponse()
+    if response.getheader('Content-Encoding') == content_encoding.ENCODING_ZSTD:
+        decompressor = content_encoding.load_zstandard().ZstdDecompressor().decompressobj()
+    elif response.getheader('Content-Encoding') == content_encoding.ENCODING_GZIP:
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    else:
+        decompressor = None
+    received: int = 0
+    while True:
+        chunk = response.read(64 * 1024)
+        if not chunk:
+            break
+        received += len(chunk)
+        if decompressor is not None:
+            decompressor.decompress(chunk)
+    connection.close()
+    return received
+
+
+def run(rows: int, cols: int) -> None:
+    header, content = make_rows(rows, cols)
+    # (сжатие, степень): gzip - всегда, zstd - если установлен модуль zstandard.
+    variants: List[Tuple[Optional[str], int]] = [(None, 0)] + \
+        [(content_encoding.ENCODING_GZIP, level) for level in (1, 6, 9)]
+    if content_encoding.load_zstandard() is not None:
+        variants += [(content_encoding.ENCODING_ZSTD, 1), (content_encoding.ENCODING_ZSTD, 3)]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        with open(os.path.join(tmp_dir, 'bench.csv'), 'w', newline='') as csvfile:
+            csvwriter = csv.writer(csvfile)
+            csvwriter.writerow(header)
+            csvwriter.writerows(content)
+        del content
+        get_cgi.files_dir = tmp_dir
+        get_cgi.cache_dir = os.path.join(tmp_dir, 'cache')
+        get_cgi.result_cache_bytes = 0
+        app._db = db.MemoryDB(users={'bench': 'bench'})
+        _, token = app._db.authenticate_and_issue_token('bench', 'bench')
+
+        server = app.make_server('127.0.0.1', 0, app.application, server_class=app.ThreadingWSGIServer,
+                                 handler_class=QuietHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        port = server.server_address[1]
+        query = 'file=bench.csv&token={}'.format(token)
+
+        print("{} строк x {} столбцов, файл {:.1f} МБ".format(
+            rows, cols, os.path.getsize(os.path.join(tmp_dir, 'bench.csv')) / (1024 * 1024)))
+        print("{:<12}{:>8}{:>14}{:>10}{:>10}".format('сжатие', 'степень', 'передано, МБ', 'доля', 'время, с'))
+        plain: int = 0
+        for encoding, level in variants:
+            content_encoding.gzip_level = level if encoding == content_encoding.ENCODING_GZIP else \
+                content_encoding.gzip_level
+            content_encoding.zstd_level = level if encoding == content_encoding.ENCODING_ZSTD else \
+                content_encoding.zstd_level
+            size = download(port, query, encoding)
+            plain = plain or size
+            print("{:<12}{:>8}{:>14.2f}{:>10.3f}{:>10.4f}".format(
+                encoding or 'identity', level or '-', size / (1024 * 1024), size / plain,
+                best_time(lambda: download(port, query, encoding), 3)))
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 100000, int(sys.argv[2]) if len(sys.argv) > 2 else 10)
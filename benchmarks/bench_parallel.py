@@ -0,0 +1,54 @@
+""" Отбор и сортировка строк большого файла в 1..N процессах (parallel): время и ускорение относительно одного процесса.
+
+Запуск: python benchmarks/bench_parallel.py [строк] [столбцов] [наибольшее число процессов]
+"""
+import os
+import sys
+import tempfile
+from typing import Dict, List, Optional, Tuple
+# bench_util добавляет в sys.path директорию с модулями проекта.
+from bench_util import best_time
+import synth
+import get_cgi
+
+
+def select(filepath: str, cols: Optional[str], sort_spec: Optional[str], where: Optional[str]) -> int:
+    _, _, rows = get_cgi.select_rows(filepath, cols, sort_spec, 0, None, where)
+    return sum(1 for _ in rows)
+
+
+def run(rows: int, cols: int, max_workers: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        filepath = os.path.join(tmp_dir, 'bench.csv')
+        header = synth.make_csv(filepath, rows, cols, 1000)
+        get_cgi.cache_dir = os.path.join(tmp_dir, 'cache')
+        get_cgi.use_columnar = False
+        get_cgi.hot_sort_threshold = 0
+        get_cgi.parallel_min_bytes = 0
+        # (описание, cols, sort, where)
+        queries: List[Tuple[str, Optional[str], Optional[str], Optional[str]]] = [
+            ('все столбцы, where', None, None, header[0] + '>0'),
+            ('2 столбца, where', header[0] + ',' + header[3], None, header[0] + '>0'),
+            ('сортировка int', None, header[0], None),
+            ('сортировка str,int:desc', None, header[3] + ',' + header[0] + ':desc', None),
+        ]
+        workers: List[int] = sorted({1, *range(2, max_workers + 1, 2), max_workers})
+
+        print("{} строк x {} столбцов, файл {:.1f} МБ, процессоров: {}".format(
+            rows, cols, os.path.getsize(filepath) / (1024 * 1024), os.cpu_count()))
+        print("{:<28}".format('запрос') + ''.join("{:>14}".format('{} проц.'.format(count)) for count in workers))
+        for name, cols_param, sort_spec, where in queries:
+            times: Dict[int, float] = {}
+            for count in workers:
+                get_cgi.parallel_workers = count
+                # Первый запуск создаёт пул процессов и в замер не входит.
+                select(filepath, cols_param, sort_spec, where)
+                times[count] = best_time(lambda: select(filepath, cols_param, sort_spec, where), 3)
+            print("{:<28}".format(name) + ''.join("{:>14}".format('{:.3f} x{:.2f}'.format(times[count],
+                                                                                         times[1] / times[count]))
+                                                  for count in workers))
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 500000, int(sys.argv[2]) if len(sys.argv) > 2 else 10,
+        int(sys.argv[3]) if len(sys.argv) > 3 else os.cpu_count() or 1)
@@ -0,0 +1,52 @@
+""" Выбор нескольких столбцов широкого файла: прежний цикл по всем значениям строки, itemgetter, чтение из mmap.
+
+Запуск: python benchmarks/bench_projection.py [строк] [столбцов] [выбрано столбцов]
+"""
+import csv
+import os
+import sys
+import tempfile
+from bench_util import make_rows, best_time
+import get_cgi
+
+
+def loop_projection(filepath: str, cols: list) -> int:
+    """ Выбор столбцов так, как он был сделан до появления itemgetter и mmap. """
+    with open(filepath) as csvfile:
+        csvreader = csv.reader(csvfile)
+        header = next(csvreader)
+        index = {header.index(colname) for colname in cols}
+        return sum(1 for row in csvreader for _ in (tuple(value for idx, value in enumerate(row) if idx in index),))
+
+
+def iter_file_projection(filepath: str, cols: list, use_mmap: bool) -> int:
+    get_cgi.use_mmap = use_mmap
+    _, _, rows = get_cgi.iter_file(filepath, cols)
+    return sum(1 for _ in rows)
+
+
+def run(rows: int, cols: int, selected: int) -> None:
+    header, content = make_rows(rows, cols)
+    # Выбранные столбцы равномерно распределены по строке.
+    chosen = [header[i * cols // selected] for i in range(selected)]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        filepath = os.path.join(tmp_dir, 'wide.csv')
+        with open(filepath, 'w', newline='') as csvfile:
+            csvwriter = csv.writer(csvfile)
+            csvwriter.writerow(header)
+            csvwriter.writerows(content)
+        del content
+
+        print("{} строк x {} столбцов, выбрано {}, файл {:.1f} МБ".format(
+            rows, cols, selected, os.path.getsize(filepath) / (1024 * 1024)))
+        print("{:<12}{:>12}".format('способ', 'время, с'))
+        print("{:<12}{:>12.4f}".format('цикл', best_time(lambda: loop_projection(filepath, chosen), 3)))
+        print("{:<12}{:>12.4f}".format('itemgetter', best_time(lambda: iter_file_projection(filepath, chosen, False),
+                                                               3)))
+        print("{:<12}{:>12.4f}".format('mmap', best_time(lambda: iter_file_projection(filepath, chosen, True), 3)))
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 20000, int(sys.argv[2]) if len(sys.argv) > 2 else 300,
+        int(sys.argv[3]) if len(sys.argv) > 3 else 3)
@@ -0,0 +1,42 @@
+""" Сравнение двоичного протокола с прежним форматом repr(pickle): размер ответа и время кодирования/декодирования.
+
+Запуск: python benchmarks/bench_protocol.py [строк] [столбцов]
+"""
+import sys
+from bench_util import make_rows, best_time
+import get_cgi
+import main
+import protocol
+from common import RequestStatus
+
+
+def run(rows: int, cols: int) -> None:
+    header, content = make_rows(rows, cols)
+
+    def legacy_encode() -> bytes:
+        return b''.join(get_cgi.encode_answer_stream(RequestStatus.OK, header, content, protocol.LEGACY_VERSION))
+
+    def binary_encode() -> bytes:
+        return b''.join(get_cgi.encode_answer_stream(RequestStatus.OK, header, content, protocol.PROTOCOL_VERSION))
+
+    legacy_body = legacy_encode()
+    binary_body = binary_encode()
+
+    def legacy_decode() -> None:
+        for _ in main.iter_legacy_frames(legacy_body.split(b'\n')):
+            pass
+
+    def binary_decode() -> None:
+        for _ in protocol.iter_frames([binary_body]):
+            pass
+
+    print("{} строк x {} столбцов".format(rows, cols))
+    print("{:<10}{:>14}{:>14}{:>14}".format('формат', 'байт', 'кодир., с', 'декодир., с'))
+    print("{:<10}{:>14}{:>14.4f}{:>14.4f}".format('repr', len(legacy_body), best_time(legacy_encode),
+                                                best_time(legacy_decode)))
+    print("{:<10}{:>14}{:>14.4f}{:>14.4f}".format('binary', len(binary_body), best_time(binary_encode),
+                                                best_time(binary_decode)))
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 100000, int(sys.argv[2]) if len(sys.argv) > 2 else 10)
@@ -0,0 +1,67 @@
+""" Сравнение пропускной способности CGI (процесс на каждый запрос) и постоянно работающего WSGI-сервера (app.py).
+
+Запуск: python benchmarks/bench_server.py [-requests=...] [-threads=...] [-query=...]
+По умолчанию запрос без токена: он отклоняется check_query и не требует БД, поэтому замер показывает
+накладные расходы на запуск процесса и импорт модулей. Для полного пути укажите -query='list=&token=...'
+(нужна настроенная БД).
+"""
+import http.client
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict
+from wsgiref.simple_server import WSGIRequestHandler
+# bench_util добавляет в sys.path директорию с модулями проекта.
+import bench_util
+import app
+import protocol
+
+# Директория с серверными скриптами.
+scripts_dir: str = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def requests_per_second(request: Callable[[], None], count: int, threads: int) -> float:
+    """ Число запросов в секунду при count запросах из threads потоков. """
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        for future in [pool.submit(request) for _ in range(count)]:
+            future.result()
+    return count / (time.perf_counter() - start)
+
+
+def cgi_request(query: str) -> None:
+    """ Запрос в режиме CGI: новый процесс интерпретатора. """
+    env = dict(os.environ, QUERY_STRING=query, CONTENT_TYPE=protocol.CONTENT_TYPE)
+    subprocess.run([sys.executable, 'get_cgi.py'], cwd=scripts_dir, env=env, stdout=subprocess.DEVNULL, check=True)
+
+
+def run(count: int, threads: int, query: str) -> None:
+    server = app.make_server('127.0.0.1', 0, app.application, server_class=app.ThreadingWSGIServer,
+                             handler_class=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_address[1]
+
+    def wsgi_request() -> None:
+        connection = http.client.HTTPConnection('127.0.0.1', port)
+        connection.request('GET', '/cgi-bin/get_cgi.py?' + query, headers={'Content-Type': protocol.CONTENT_TYPE})
+        connection.getresponse().read()
+        connection.close()
+
+    print("{} запросов, {} потоков, запрос '{}'".format(count, threads, query))
+    print("CGI:  {:10.1f} запросов/с".format(requests_per_second(lambda: cgi_request(query), count, threads)))
+    print("WSGI: {:10.1f} запросов/с".format(requests_per_second(wsgi_request, count, threads)))
+    server.shutdown()
+
+
+class QuietHandler(WSGIRequestHandler):
+    """ Обработчик запросов без журнала в stderr. """
+    def log_message(self, *args) -> None:
+        pass
+
+
+if __name__ == '__main__':
+    params: Dict[str, str] = dict(arg.split('=', 1) for arg in sys.argv[1:] if '=' in arg)
+    run(int(params.get('-requests', 200)), int(params.get('-threads', 4)), params.get('-query', 'list='))
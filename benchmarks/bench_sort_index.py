@@ -0,0 +1,53 @@
+""" Запрос с сортировкой: сортировка при каждом запросе и чтение по индексу сортировки (sort_index).
+
+Запуск: python benchmarks/bench_sort_index.py [строк] [столбцов]
+"""
+import csv
+import os
+import shutil
+import sys
+import tempfile
+import time
+from bench_util import make_rows, best_time
+import get_cgi
+
+
+def select(filepath: str, cols: str, sort_spec: str, end: int) -> int:
+    _, _, rows = get_cgi.select_rows(filepath, cols, sort_spec, 0, end)
+    return sum(1 for _ in rows)
+
+
+def run(rows: int, cols: int) -> None:
+    header, content = make_rows(rows, cols)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        filepath = os.path.join(tmp_dir, 'bench.csv')
+        with open(filepath, 'w', newline='') as csvfile:
+            csvwriter = csv.writer(csvfile)
+            csvwriter.writerow(header)
+            csvwriter.writerows(content)
+        del content
+        with open(filepath, 'rb') as csvfile:
+            end = get_cgi.data_end(csvfile, os.path.getsize(filepath))
+        get_cgi.cache_dir = os.path.join(tmp_dir, 'cache')
+        get_cgi.use_columnar = False
+        index_dir = os.path.join(get_cgi.cache_dir, 'sort_index')
+
+        print("{} строк x {} столбцов, файл {:.1f} МБ".format(rows, cols, os.path.getsize(filepath) / (1024 * 1024)))
+        print("{:<40}{:>12}{:>12}{:>12}".format('запрос', 'сортировка', 'построение', 'индекс'))
+        for cols_param, sort_spec in ((None, header[1]), (header[1] + ',' + header[2], header[2] + ':desc'),
+                                      (header[1] + ',' + header[2], header[1] + ',' + header[2])):
+            get_cgi.hot_sort_threshold = 0
+            plain = best_time(lambda: select(filepath, cols_param, sort_spec, end), 3)
+            # Первый запрос после порога строит индекс, следующие читают по нему.
+            shutil.rmtree(index_dir, ignore_errors=True)
+            get_cgi.hot_sort_threshold = 1
+            started = time.perf_counter()
+            select(filepath, cols_param, sort_spec, end)
+            build = time.perf_counter() - started
+            indexed = best_time(lambda: select(filepath, cols_param, sort_spec, end), 3)
+            print("{:<40}{:>12.4f}{:>12.4f}{:>12.4f}".format(
+                'cols={} sort={}'.format(cols_param or '*', sort_spec), plain, build, indexed))
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 200000, int(sys.argv[2]) if len(sys.argv) > 2 else 10)
@@ -0,0 +1,88 @@
+""" Время запуска CGI-сценариев и клиента: каждый CGI-запрос и каждый вызов main.py - новый процесс Python,
+и импорт модулей повторяется при каждом запуске.
+
+Замеряются в отдельных процессах: импорт модулей get_cgi, auth_cgi, main, auth (по -X importtime, вместе с
+импортируемыми ими модулями) и время работы процессов целиком - запрос к get_cgi.py без параметров (ответ
+BAD_REQUEST, база пользователей не нужна) и main.py -help.
+
+Запуск: python benchmarks/bench_startup.py [-repeat=...] [-top=...]
+"""
+import os
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+# bench_util добавляет в sys.path директорию с модулями проекта.
+from bench_util import best_time
+
+# Директория с модулями проекта
+PROJECT_DIR: str = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Модули, время импорта которых замеряется
+MODULES: Tuple[str, ...] = ('get_cgi', 'auth_cgi', 'main', 'auth')
+
+
+def _python(args: List[str], env: Optional[Dict[str, str]] = None) -> subprocess.CompletedProcess:
+    return subprocess.run([sys.executable] + args, cwd=PROJECT_DIR, env=dict(os.environ, **(env or {})),
+                          stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+
+
+def import_times(module: str) -> Dict[str, int]:
+    """ Время импорта модуля и всех импортированных при этом модулей, мкс (по -X importtime).
+
+    Модули, импортированные при запуске интерпретатора (site и т. п.), не учитываются.
+
+    :return: {'имя модуля': время вместе с вложенными импортами}
+    """
+    stderr = _python(['-X', 'importtime', '-c', 'import ' + module]).stderr.decode()
+    times: Dict[str, int] = {}
+    for line in stderr.splitlines():
+        # import time: собственное | вместе с вложенными | имя (с отступом по вложенности)
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if not cumulative.strip().isdigit():
+            continue
+        times[name.strip()] = int(cumulative)
+        # Вложенные импорты выводятся перед импортом верхнего уровня, который их вызвал.
+        if len(name) - len(name.lstrip()) == 1:
+            if name.strip() == module:
+                return times
+            times = {}
+    raise RuntimeError('нет времени импорта модуля ' + module)
+
+
+def process_time(args: List[str], env: Optional[Dict[str, str]] = None, repeat: int = 5) -> float:
+    """ Лучшее время работы процесса Python с аргументами args, с. """
+    return best_time(lambda: _python(args, env), repeat)
+
+
+def run(repeat: int = 5) -> Dict[str, float]:
+    """ Замеры для набора замеров (bench_suite): время импорта модулей и запуска процессов, с. """
+    results: Dict[str, float] = {}
+    for module in MODULES:
+        results['startup_import_' + module] = min(import_times(module)[module] for _ in range(repeat)) / 1e6
+    results['startup_python'] = process_time(['-c', 'pass'], repeat=repeat)
+    results['startup_cgi_bad_request'] = process_time(['get_cgi.py'], {'QUERY_STRING': ''}, repeat)
+    results['startup_main_help'] = process_time(['main.py', '-help'], repeat=repeat)
+    return results
+
+
+if __name__ == '__main__':
+    params: Dict[str, str] = dict(arg.split('=', 1) for arg in sys.argv[1:] if '=' in arg)
+    repeat = int(params.get('-repeat', 5))
+    top = int(params.get('-top', 8))
+    # Первый запуск компилирует изменённые модули в байт-код, он не замеряется.
+    for module in MODULES:
+        import_times(module)
+
+    for module in MODULES:
+        times = min((import_times(module) for _ in range(repeat)), key=lambda found: found[module])
+        print("import {}: {:.1f} мс".format(module, times[module] / 1000))
+        slowest = sorted((item for item in times.items() if item[0] != module), key=lambda item: -item[1])
+        for name, microseconds in slowest[:top]:
+            print("    {:<40}{:>10.1f} мс".format(name, microseconds / 1000))
+
+    started = time.perf_counter()
+    for name, seconds in run(repeat).items():
+        print("{:<40}{:>10.1f} мс".format(name, seconds * 1000))
+    print("всего {:.1f} с".format(time.perf_counter() - started))
@@ -0,0 +1,124 @@
+""" Набор замеров основных операций сервера и клиента на синтетическом файле (synth.py), результат - JSON.
+
+Замеряются: список файлов (get_list, с информацией о столбцах и без), чтение файла (get_file, все столбцы
+и выбранные, списком кортежей и в компактном хранилище compact), сортировка (sort), сериализация ответа
+(encode_answer, encode_answer_stream) и его расшифровка на клиенте (как в send_request и receive_file), обработка
+запроса целиком (handle) с базой пользователей в памяти (db.MemoryDB) вместо MySQL, в том числе с включёнными
+замерами этапов (timing), а также время импорта модулей и запуска CGI-сценария и клиента в новом процессе
+(bench_startup).
+
+Запуск: python benchmarks/bench_suite.py [-rows=...] [-cols=...] [-cardinality=...] [-files=...] [-repeat=...]
+                                         [-out=результат.json] [-baseline=прошлый.json]
+С -baseline для каждого замера выводится отношение времени к прошлому запуску (больше 1 - медленнее).
+"""
+import json
+import os
+import platform
+import sys
+import tempfile
+from typing import Callable, Dict, List
+# bench_util добавляет в sys.path директорию с модулями проекта.
+from bench_util import best_time
+import synth
+import bench_startup
+import db
+import get_cgi
+import main
+import protocol
+import timing
+from common import RequestStatus
+
+
+def consume(rows) -> int:
+    """ Полное чтение итератора (строк или частей ответа). """
+    return sum(1 for _ in rows)
+
+
+def run(rows: int, cols: int, cardinality: int, files: int, repeat: int) -> dict:
+    """ Замеры.
+
+    :param rows: Число строк основного файла.
+    :param cols: Число столбцов.
+    :param cardinality: Число различных значений в столбце.
+    :param files: Число дополнительных небольших файлов в директории (для get_list).
+    :param repeat: Число повторов каждого замера (берётся лучшее время).
+    :return: Описание запуска и времена замеров, с.
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        filepath = os.path.join(tmp_dir, 'synth.csv')
+        header = synth.make_csv(filepath, rows, cols, cardinality)
+        for num in range(files):
+            synth.make_csv(os.path.join(tmp_dir, 'small{}.csv'.format(num)), 100, cols, cardinality, seed=num + 1)
+
+        get_cgi.files_dir = tmp_dir
+        get_cgi.cache_dir = os.path.join(tmp_dir, 'cache')
+        # Замеряются вычисления, а не готовые ответы и индексы.
+        get_cgi.result_cache_bytes = 0
+        get_cgi.hot_sort_threshold = 0
+        users = db.MemoryDB(users={'bench': 'bench'})
+        _, token = users.authenticate_and_issue_token('bench', 'bench')
+        chosen: List[str] = [header[0], header[len(header) // 2]]
+        types = get_cgi.schema_cache().get(filepath).column_types()
+        _, _, content = get_cgi.get_file(filepath)
+        legacy_body: bytes = get_cgi.encode_answer(RequestStatus.OK, [header] + content, protocol.LEGACY_VERSION)
+        binary_body: bytes = b''.join(get_cgi.encode_answer_stream(RequestStatus.OK, header, content,
+                                                                   protocol.PROTOCOL_VERSION))
+
+        def handle(params: Dict[str, List[str]], content_type: str) -> int:
+            return consume(get_cgi.handle(dict(params, token=[str(token)]), users, content_type).body)
+
+        def handle_timed(params: Dict[str, List[str]], content_type: str) -> int:
+            # Обработка запроса с включёнными замерами этапов (журнал не записывается).
+            timing.enabled, timing.log_path = True, os.devnull
+            try:
+                return handle(params, content_type)
+            finally:
+                timing.enabled, timing.log_path = False, None
+
+        cases: Dict[str, Callable[[], object]] = {
+            'get_list': lambda: get_cgi.get_list(tmp_dir),
+            'get_list_info': lambda: get_cgi.get_list(tmp_dir, with_info=True, cache=get_cgi.schema_cache()),
+            'get_file': lambda: get_cgi.get_file(filepath),
+            'get_file_cols': lambda: get_cgi.get_file(filepath, chosen),
+            'get_file_compact': lambda: get_cgi.get_file(filepath, compact_rows=True),
+            'sort_int': lambda: consume(get_cgi.sort(header, content, [header[0]], types)[1]),
+            'sort_str': lambda: consume(get_cgi.sort(header, content, [header[min(3, cols - 1)]], types)[1]),
+            'sort_two_keys': lambda: consume(get_cgi.sort(header, content, [header[-1], header[0] + ':desc'],
+                                                          types)[1]),
+            'encode_legacy': lambda: get_cgi.encode_answer(RequestStatus.OK, [header] + content,
+                                                           protocol.LEGACY_VERSION),
+            'encode_legacy_stream': lambda: consume(get_cgi.encode_answer_stream(RequestStatus.OK, header, content,
+                                                                                 protocol.LEGACY_VERSION)),
+            'encode_binary': lambda: consume(get_cgi.encode_answer_stream(RequestStatus.OK, header, content,
+                                                                          protocol.PROTOCOL_VERSION)),
+            'decode_legacy': lambda: main.decode_line(legacy_body),
+            'decode_binary': lambda: consume(protocol.iter_frames([binary_body])),
+            'handle_legacy': lambda: handle({'file': ['synth.csv']}, 'application/octet-stream'),
+            'handle_binary': lambda: handle({'file': ['synth.csv']}, protocol.CONTENT_TYPE),
+            'handle_sorted': lambda: handle({'file': ['synth.csv'], 'sort': [header[0]]}, protocol.CONTENT_TYPE),
+            'handle_binary_timed': lambda: handle_timed({'file': ['synth.csv']}, protocol.CONTENT_TYPE),
+        }
+        results: Dict[str, float] = {name: best_time(case, repeat) for name, case in cases.items()}
+        get_cgi.schema_cache().close()
+        get_cgi._schema_cache = None
+    results.update(bench_startup.run(repeat))
+
+    return {'params': {'rows': rows, 'cols': cols, 'cardinality': cardinality, 'files': files, 'repeat': repeat},
+            'python': platform.python_version(), 'platform': platform.platform(), 'results': results}
+
+
+if __name__ == '__main__':
+    params: Dict[str, str] = dict(arg.split('=', 1) for arg in sys.argv[1:] if '=' in arg)
+    report = run(int(params.get('-rows', 100000)), int(params.get('-cols', 10)), int(params.get('-cardinality', 1000)),
+                 int(params.get('-files', 20)), int(params.get('-repeat', 3)))
+    if '-baseline' in params:
+        with open(params['-baseline']) as baseline_file:
+            baseline: Dict[str, float] = json.load(baseline_file)['results']
+        report['ratio'] = {name: round(seconds / baseline[name], 3)
+                           for name, seconds in report['results'].items() if baseline.get(name)}
+
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if '-out' in params:
+        with open(params['-out'], 'w') as out_file:
+            out_file.write(text + '\n')
+    print(text)
@@ -0,0 +1,37 @@
+""" Общие функции для сценариев замеров производительности. """
+import os
+import random
+import string
+import sys
+import time
+from typing import Callable, List, Tuple
+
+# Сценарии замеров запускаются из каталога benchmarks, модули проекта лежат уровнем выше.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def make_rows(rows: int, cols: int, seed: int = 0) -> Tuple[tuple, List[tuple]]:
+    """ Синтетическое содержимое csv-файла: строковые и числовые столбцы вперемешку.
+
+    :param rows: Число строк.
+    :param cols: Число столбцов.
+    :param seed: Начальное значение генератора случайных чисел.
+    :return: Заголовок, список строк.
+    """
+    rnd = random.Random(seed)
+    header = tuple('col{}'.format(i) for i in range(cols))
+    content: List[tuple] = []
+    for _ in range(rows):
+        content.append(tuple(str(rnd.randint(0, 10 ** 6)) if i % 2 else
+                             ''.join(rnd.choices(string.ascii_letters, k=8)) for i in range(cols)))
+    return header, content
+
+
+def best_time(func: Callable[[], object], repeat: int = 5) -> float:
+    """ Лучшее из repeat время выполнения func, сек. """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
@@ -0,0 +1,64 @@
+""" Синтетические csv-файлы для замеров: заданное число строк, столбцов и различных значений в столбце.
+
+Типы столбцов чередуются: целые, дробные, даты, строки. Значения каждого столбца выбираются из набора
+cardinality различных значений, поэтому от cardinality зависят и сортировка (много равных ключей), и сжатие.
+
+Запуск: python benchmarks/synth.py файл.csv [-rows=...] [-cols=...] [-cardinality=...] [-seed=...]
+"""
+import csv
+import random
+import string
+import sys
+from datetime import date, timedelta
+from typing import Callable, Dict, Iterator, List, Tuple
+
+# Порядок типов столбцов.
+COLUMN_TYPES: Tuple[str, ...] = ('int', 'float', 'date', 'str')
+
+
+def _value_makers(rnd: random.Random) -> Dict[str, Callable[[], str]]:
+    first_day = date(2000, 1, 1)
+    return {'int': lambda: str(rnd.randint(-10 ** 6, 10 ** 6)),
+            'float': lambda: '{:.3f}'.format(rnd.uniform(-1000, 1000)),
+            'date': lambda: (first_day + timedelta(days=rnd.randint(0, 9000))).strftime('%d.%m.%Y'),
+            'str': lambda: ''.join(rnd.choices(string.ascii_letters, k=rnd.randint(4, 12)))}
+
+
+def make_header(cols: int) -> tuple:
+    """ Заголовок: имя столбца содержит его тип (int0, float1, date2, str3, int4, ...). """
+    return tuple('{}{}'.format(COLUMN_TYPES[i % len(COLUMN_TYPES)], i) for i in range(cols))
+
+
+def iter_rows(rows: int, cols: int, cardinality: int, seed: int = 0) -> Iterator[tuple]:
+    """ Строки синтетического файла.
+
+    :param rows: Число строк.
+    :param cols: Число столбцов.
+    :param cardinality: Число различных значений в каждом столбце.
+    :param seed: Начальное значение генератора случайных чисел.
+    """
+    rnd = random.Random(seed)
+    makers = _value_makers(rnd)
+    pools: List[List[str]] = [[makers[COLUMN_TYPES[i % len(COLUMN_TYPES)]]() for _ in range(cardinality)]
+                              for i in range(cols)]
+    for _ in range(rows):
+        yield tuple(rnd.choice(pool) for pool in pools)
+
+
+def make_csv(path: str, rows: int, cols: int, cardinality: int, seed: int = 0) -> tuple:
+    """ Запись синтетического csv-файла.
+
+    :return: Заголовок файла.
+    """
+    header = make_header(cols)
+    with open(path, 'w', newline='') as csvfile:
+        csvwriter = csv.writer(csvfile)
+        csvwriter.writerow(header)
+        csvwriter.writerows(iter_rows(rows, cols, cardinality, seed))
+    return header
+
+
+if __name__ == '__main__':
+    params: Dict[str, str] = dict(arg.split('=', 1) for arg in sys.argv[2:] if '=' in arg)
+    make_csv(sys.argv[1], int(params.get('-rows', 100000)), int(params.get('-cols', 10)),
+             int(params.get('-cardinality', 1000)), int(params.get('-seed', 0)))
@@ -0,0 +1,350 @@
+""" Поколоночная копия csv-файла: значения каждого столбца в отдельном файле, без разбора csv при запросе.
+
+Копия строится заранее (конвертером, см. refresh и запуск модуля) в каталоге
+<directory>/<sha1 пути к файлу>-<mtime_ns>-<размер>-<версия правил типов>/, поэтому копия изменённого файла
+(или построенная с типами по прежним правилам, см. schema.INFERENCE_VERSION) просто не находится:
+    meta.json                    - заголовок, типы столбцов, число строк, типы сохранённых ключей сортировки
+    <i>.txt                      - значения столбца i в utf-8, каждое завершается символом '\0'
+    <i>.key.npy, <i>.bad.npy     - числовые ключи сортировки столбца и признаки значений, не приводимых к его типу
+                                   (только если установлен numpy)
+Копия строится только для файлов, во всех строках которых столько же значений, сколько в заголовке, и в значениях
+нет символа '\0'. Для остальных файлов (и пока копии нет) запросы обслуживаются разбором csv.
+Сортировка по копии выполняется numpy.lexsort; без numpy строки из копии сортируются как обычно.
+
+Запуск конвертера из директории cgi-bin:
+    python columnar.py [-files=../files] [-cache=../cache] [-encoding=...] [-interval=секунд]
+"""
+import csv
+import hashlib
+import json
+import locale
+import os
+import shutil
+import sys
+import tempfile
+import time
+from operator import itemgetter
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+import schema
+
+# Имя директории поколоночных копий в каталоге кэша.
+columnar_dir_name: str = "columns"
+# Число строк, накапливаемых в памяти перед дозаписью в файлы столбцов при построении копии.
+build_block_rows: int = 10000
+# Оценка памяти на одно значение столбца сверх его длины, байт (объект str).
+value_overhead: int = 56
+# Типы столбцов, для которых сохраняются числовые ключи сортировки.
+KEY_TYPES: Tuple[str, ...] = (schema.TYPE_INT, schema.TYPE_NUM, schema.TYPE_FLOAT, schema.TYPE_DATE)
+# Завершитель значения в файле столбца.
+TERMINATOR: str = '\0'
+# Целые, точно представимые в float64.
+_FLOAT_EXACT: int = 2 ** 53
+
+# Модуль numpy (см. load_numpy): None - ещё не импортирован или не установлен.
+numpy: Any = None
+# Была ли попытка импорта numpy.
+_numpy_loaded: bool = False
+
+
+def load_numpy() -> Any:
+    """ Модуль numpy или None, если он не установлен. Импортируется при первом вызове: импорт numpy дольше
+    обработки большинства запросов, а нужен он только для ключей сортировки. Без numpy копии строятся
+    без ключей сортировки. """
+    global numpy, _numpy_loaded
+    if not _numpy_loaded:
+        try:
+            import numpy as module
+        except ImportError:
+            module = None
+        numpy = module
+        _numpy_loaded = True
+    return numpy
+
+
+def _file_key(filepath: str) -> str:
+    return hashlib.sha1(os.path.abspath(filepath).encode()).hexdigest()
+
+
+def table_dir(directory: str, filepath: str, stat: os.stat_result) -> str:
+    """ Каталог копии данной версии файла. """
+    return os.path.join(directory, '{}-{}-{}-{}'.format(_file_key(filepath), stat.st_mtime_ns, stat.st_size,
+                                                        schema.INFERENCE_VERSION))
+
+
+def numeric_key(values: Sequence[str], type_name: str) -> Optional[Tuple[Any, Any]]:
+    """ Числовые ключи сортировки значений столбца (numpy).
+
+    :return: Массив ключей (0 для неприводимых значений) и массив признаков неприводимых значений;
+        None - numpy не установлен или числа не представимы точно.
+    """
+    if load_numpy() is None:
+        return None
+    convert = schema.value_converter(type_name)
+    # Ключи столбца num - целые, пока в нём не встретится дробное значение.
+    is_int: bool = type_name in (schema.TYPE_INT, schema.TYPE_NUM)
+    keys = numpy.zeros(len(values), dtype=numpy.int64 if is_int else numpy.float64)
+    bad = numpy.zeros(len(values), dtype=bool)
+    # Наибольшее по модулю целое среди ключей
+    int_max: int = 0
+    for idx, value in enumerate(values):
+        try:
+            number = convert(value)
+        except ValueError:
+            bad[idx] = True
+            continue
+        if number != number:
+            # NaN не упорядочивается.
+            bad[idx] = True
+            continue
+        if isinstance(number, int):
+            if not is_int and abs(number) >= _FLOAT_EXACT:
+                return None
+            int_max = max(int_max, abs(number))
+        elif is_int:
+            # Первое дробное значение столбца num: ключи переводятся в float64, если целые в нём точны.
+            if int_max >= _FLOAT_EXACT:
+                return None
+            keys = keys.astype(numpy.float64)
+            is_int = False
+        try:
+            keys[idx] = number
+        except OverflowError:
+            return None
+    return keys, bad
+
+
+def _iter_lines(csvfile: Any, size: int, encoding: str, flags: Dict[str, bool]) -> Iterator[str]:
+    """ Строки файла в пределах size байт (как при полном чтении, см. get_cgi.read_end);
+    flags['bad'] - в значениях встретился '\0'. """
+    position: int = 0
+    for line in csvfile:
+        position += len(line)
+        if position > size:
+            # Строка, продолженная после определения размера: копия - для версии файла размером size.
+            if position - len(line) < size:
+                flags['bad'] = True
+            return
+        text = line.decode(encoding)
+        if TERMINATOR in text:
+            flags['bad'] = True
+            return
+        yield text
+
+
+def build(directory: str, filepath: str, encoding: str = 'utf-8') -> Optional[str]:
+    """ Построение копии файла (если копии этой версии файла ещё нет).
+
+    Копия пишется во временный каталог и переименовывается по готовности, поэтому запросы не видят недописанных копий.
+
+    :param directory: Каталог копий.
+    :param filepath: Имя csv-файла с путём.
+    :param encoding: Кодировка csv-файла.
+    :return: Каталог копии или None, если копия для этого файла не строится.
+    """
+    stat = os.stat(filepath)
+    target = table_dir(directory, filepath, stat)
+    if os.path.isdir(target):
+        return target
+
+    os.makedirs(directory, exist_ok=True)
+    tmp = tempfile.mkdtemp(dir=directory, prefix='.build')
+    try:
+        flags: Dict[str, bool] = {'bad': False}
+        with open(filepath, 'rb') as csvfile:
+            csvreader = csv.reader(_iter_lines(csvfile, stat.st_size, encoding, flags))
+            header: tuple = tuple(next(csvreader, ()))
+            width: int = len(header)
+            if not width:
+                return None
+            rows: int = 0
+            sample: List[tuple] = []
+            block: List[List[str]] = []
+            for row in csvreader:
+                if len(row) != width:
+                    # Строки разной длины: копия не строится.
+                    return None
+                block.append(row)
+                if len(sample) < schema.sample_rows:
+                    sample.append(tuple(row))
+                if len(block) >= build_block_rows:
+                    _append_block(tmp, block)
+                    rows += len(block)
+                    block = []
+            if flags['bad']:
+                return None
+            _append_block(tmp, block, width)
+            rows += len(block)
+
+        types: Tuple[str, ...] = schema.infer_types(header, sample)
+        keys: Dict[str, str] = {}
+        for idx, type_name in enumerate(types):
+            if type_name not in KEY_TYPES or load_numpy() is None:
+                continue
+            key = numeric_key(_read_column(tmp, idx), type_name)
+            if key is None:
+                continue
+            numpy.save(os.path.join(tmp, '{}.key.npy'.format(idx)), key[0])
+            numpy.save(os.path.join(tmp, '{}.bad.npy'.format(idx)), key[1])
+            keys[str(idx)] = type_name
+
+        with open(os.path.join(tmp, 'meta.json'), 'w') as meta:
+            json.dump({'header': header, 'types': types, 'rows': rows, 'keys': keys}, meta, ensure_ascii=False)
+        try:
+            os.rename(tmp, target)
+        except OSError:
+            # Копию этой версии уже построил другой процесс.
+            pass
+        return target if os.path.isdir(target) else None
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def _append_block(path: str, block: List[List[str]], width: int = 0) -> None:
+    """ Дозапись блока строк в файлы столбцов (width - число столбцов для пустого блока). """
+    columns = list(zip(*block)) if block else [()] * width
+    for idx, values in enumerate(columns):
+        with open(os.path.join(path, '{}.txt'.format(idx)), 'a', encoding='utf-8', newline='') as column:
+            if values:
+                column.write(TERMINATOR.join(values) + TERMINATOR)
+
+
+def _read_column(path: str, idx: int) -> List[str]:
+    with open(os.path.join(path, '{}.txt'.format(idx)), encoding='utf-8', newline='') as column:
+        values = column.read().split(TERMINATOR)
+    # После последнего значения - завершитель.
+    values.pop()
+    return values
+
+
+class ColumnTable:
+    """ Поколоночная копия файла. """
+    def __init__(self, path: str):
+        """
+
+        :param path: Каталог копии.
+        """
+        self.__path: str = path
+        with open(os.path.join(path, 'meta.json')) as meta_file:
+            meta: dict = json.load(meta_file)
+        self.header: tuple = tuple(meta['header'])
+        self.types: Dict[str, str] = dict(zip(self.header, meta['types']))
+        self.rows: int = meta['rows']
+        self.__keys: Dict[int, str] = {int(idx): type_name for idx, type_name in meta['keys'].items()}
+
+    def memory_estimate(self, index: Sequence[int]) -> int:
+        """ Оценка памяти под значения столбцов с индексами index, байт. """
+        return sum(os.path.getsize(os.path.join(self.__path, '{}.txt'.format(idx))) for idx in index) + \
+            self.rows * len(index) * value_overhead
+
+    def column(self, idx: int) -> List[str]:
+        """ Значения столбца. """
+        return _read_column(self.__path, idx)
+
+    def __key(self, idx: int, type_name: str, values: Sequence[str]) -> Optional[Tuple[Any, Any]]:
+        if self.__keys.get(idx) == type_name:
+            return (numpy.load(os.path.join(self.__path, '{}.key.npy'.format(idx))),
+                    numpy.load(os.path.join(self.__path, '{}.bad.npy'.format(idx))))
+        return numeric_key(values, type_name)
+
+    def sort_order(self, columns: Dict[int, List[str]], specs: List[Tuple[int, str, bool]]) -> Optional[Any]:
+        """ Порядок строк при сортировке (как у schema.make_sort_key и устойчивой сортировки).
+
+        :param columns: Загруженные значения столбцов {индекс: значения}.
+        :param specs: Столбцы сортировки: (индекс, тип, признак сортировки по убыванию).
+        :return: Массив номеров строк в порядке сортировки или None, если без numpy или ключи не строятся.
+        """
+        return sort_order([(type_name, descending) for _, type_name, descending in specs],
+                          lambda num: columns[specs[num][0]],
+                          lambda num: self.__key(specs[num][0], specs[num][1], columns[specs[num][0]]))
+
+
+def sort_order(specs: List[Tuple[str, bool]], values: Callable[[int], Sequence[str]],
+               numeric: Callable[[int], Optional[Tuple[Any, Any]]]) -> Optional[Any]:
+    """ Порядок строк при сортировке по столбцам (numpy.lexsort), как у schema.make_sort_key и устойчивой сортировки.
+
+    Значения и ключи столбцов запрашиваются только по мере надобности: значения числового столбца - лишь если
+    в нём есть неприводимые к типу значения.
+
+    :param specs: Столбцы сортировки от главного: (тип, признак сортировки по убыванию).
+    :param values: Значения столбца сортировки с данным номером (в specs).
+    :param numeric: Числовые ключи столбца сортировки с данным номером (см. numeric_key) или None, если не строятся.
+    :return: Массив номеров строк в порядке сортировки или None, если без numpy или ключи не строятся.
+    """
+    if load_numpy() is None:
+        return None
+    # Ключи от главного к второстепенному.
+    keys: List[Any] = []
+    for num, (type_name, descending) in enumerate(specs):
+        if type_name == schema.TYPE_STR:
+            ranks = numpy.unique(numpy.array(values(num), dtype=object), return_inverse=True)[1]
+            keys.append(-ranks if descending else ranks)
+            continue
+
+        key = numeric(num)
+        if key is None:
+            return None
+        number, bad = key
+        if descending:
+            number = -number
+        if not bad.any():
+            keys.append(number)
+            continue
+        # Неприводимые значения - после приводимых, между собой по возрастанию строк.
+        ranks = numpy.unique(numpy.array(values(num), dtype=object), return_inverse=True)[1]
+        keys.extend((bad, numpy.where(bad, 0, number), numpy.where(bad, ranks, 0)))
+
+    if len(keys) == 1:
+        return numpy.argsort(keys[0], kind='stable')
+    # lexsort устойчив; главный ключ у него последний.
+    return numpy.lexsort(keys[::-1])
+
+
+def reorder(values: List[str], order: Sequence[int]) -> Sequence[str]:
+    """ Значения столбца в заданном порядке строк. """
+    if len(order) < 2:
+        return [values[idx] for idx in order]
+    return itemgetter(*order)(values)
+
+
+def open_table(directory: str, filepath: str) -> Optional[ColumnTable]:
+    """ Копия текущей версии файла или None, если её нет. """
+    try:
+        path = table_dir(directory, filepath, os.stat(filepath))
+        return ColumnTable(path)
+    except (OSError, ValueError):
+        return None
+
+
+def refresh(files_dir: str, directory: str, encoding: str = 'utf-8') -> Dict[str, Optional[str]]:
+    """ Построение копий всех файлов директории и удаление копий изменённых и удалённых файлов.
+
+    :return: Словарь {'имя файла': каталог копии или None, если копия не строится}
+    """
+    result: Dict[str, Optional[str]] = {}
+    with os.scandir(files_dir) as entries:
+        for entry in entries:
+            if entry.is_file():
+                result[entry.name] = build(directory, entry.path, encoding)
+
+    actual = {os.path.basename(path) for path in result.values() if path}
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.is_dir() and not entry.name.startswith('.') and entry.name not in actual:
+                shutil.rmtree(entry.path, ignore_errors=True)
+    return result
+
+
+if __name__ == '__main__':
+    params: Dict[str, str] = dict(arg.split('=', 1) for arg in sys.argv[1:] if '=' in arg)
+    files_dir: str = params.get('-files', '../files')
+    directory: str = os.path.join(params.get('-cache', '../cache'), columnar_dir_name)
+    encoding: str = params.get('-encoding', locale.getpreferredencoding(False))
+    interval: float = float(params.get('-interval', 0))
+    while True:
+        started = time.perf_counter()
+        built = refresh(files_dir, directory, encoding)
+        print("Копии: {} из {} файлов, {:.2f} с".format(sum(1 for path in built.values() if path), len(built),
+                                                       time.perf_counter() - started))
+        if interval <= 0:
+            break
+        time.sleep(interval)
@@ -1,14 +1,22 @@
+import sys
 from enum import Enum
+from typing import Iterable, List, NamedTuple, Tuple
 
 
 # Тип токена, идентифицирующего сеанс
 TokenType = int
+# Строка статуса успешного HTTP-ответа.
+HTTP_OK: str = '200 OK'
+# Строка статуса ответа "результат не изменился" (на запрос с If-None-Match).
+HTTP_NOT_MODIFIED: str = '304 Not Modified'
 
 
 class RequestStatus(Enum):
     """ Результаты обработки запросов. """
     # Результат обработки - успешно
     OK = 200
+    # Результат не изменился с прошлой загрузки
+    NOT_MODIFIED = 304
     # Сервер не понял запроса
     BAD_REQUEST = 400
     # Требуется авторизация
@@ -22,3 +30,30 @@ class RequestStatus(Enum):
     USER_NON_FOUND = 4010
     # Неверный пароль
     WRONG_PASSWORD = 4011
+
+
+class Answer(NamedTuple):
+    """ Ответ серверного обработчика запроса, не зависящий от способа запуска (CGI или WSGI). """
+    # Заголовки HTTP-ответа: [('имя', 'значение'), ...]
+    headers: List[Tuple[str, str]]
+    # Части тела ответа.
+    body: Iterable[bytes]
+    # Строка статуса HTTP-ответа.
+    status: str = HTTP_OK
+
+
+def write_answer(answer: Answer) -> None:
+    """ Отправка ответа в stdout (режим CGI). Вывод сбрасывается после каждой части ответа, поэтому веб-сервер
+    может отдавать ответ клиенту по частям (chunked transfer encoding), а память скрипта не зависит от размера файла.
+
+    :param answer: Ответ обработчика.
+    """
+    if answer.status != HTTP_OK:
+        print("Status: {}".format(answer.status))
+    for name, value in answer.headers:
+        print("{}: {}".format(name, value))
+    print("")
+    sys.stdout.flush()
+    for part in answer.body:
+        sys.stdout.buffer.write(part)
+        sys.stdout.buffer.flush()
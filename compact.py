@@ -0,0 +1,358 @@
+""" Компактное хранение строк файла в памяти: каждый столбец - один буфер, а не объект str на каждое значение.
+
+Список кортежей строк занимает в памяти в несколько раз больше самого файла: каждое значение - отдельный объект str
+(49 байт сверх символов) и указатель в кортеже строки (ещё 8 байт и заголовок кортежа на строку). В CompactTable
+столбец хранится одним из способов:
+    - целые числа (все значения - каноническая запись int64: '42', '-7') - array('q'), 8 байт на значение;
+    - дробные числа (все значения - repr(float) или запись с одним числом знаков после точки: '12.500') -
+      array('d'), 8 байт на значение;
+    - остальные - все значения одной строкой str и array('q') границ значений (8 байт на значение сверх символов).
+Значения выдаются в точности как в файле. Один символ вне latin-1 в столбце расширяет всю его строку до 2-4 байт
+на символ, но и тогда столбец обычно меньше отдельных объектов str.
+
+Сортировка (sort_order) не перемещает значения, а вычисляет перестановку номеров строк, и строки выдаются
+(iter_rows) в её порядке. Порядок тот же, что у get_cgi.sort (schema.make_sort_key и устойчивая сортировка).
+Ключи числовых столбцов - сами числа из буферов, без разбора значений. С numpy порядок вычисляет numpy.lexsort
+(см. columnar.sort_order), без numpy - устойчивые сортировки номеров строк по одному столбцу. Строки,
+не умещающиеся в памяти, сортируются порциями с выгрузкой во временные файлы (sort_rows), как в extsort.
+"""
+import heapq
+import sys
+from array import array
+from itertools import accumulate, chain, islice, repeat
+from operator import itemgetter
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+import columnar
+import extsort
+import schema
+
+# Число строк, разбираемых по столбцам за раз при загрузке.
+block_rows: int = 10000
+# Оценка памяти на сортировку одной строки сверх хранимых значений, байт: номер строки, значение и ключ одного
+# столбца сортировки (столбцы обрабатываются по одному) и, с numpy, элементы массивов ключей каждого столбца.
+sort_row_bytes: int = 160
+numpy_key_bytes: int = 16
+
+# Способы хранения столбца.
+_INT: str = 'int'
+_FLOAT: str = 'float'
+_TEXT: str = 'text'
+# Целые, точно представимые в float64.
+_FLOAT_EXACT: int = 2 ** 53
+
+
+def _as_ints(values: Sequence[str]) -> Optional[array]:
+    """ Целые числа, если все значения - их каноническая запись и умещаются в int64, иначе None. """
+    try:
+        numbers = list(map(int, values))
+        if list(map(str, numbers)) != list(values):
+            return None
+        return array('q', numbers)
+    except (ValueError, OverflowError):
+        return None
+
+
+def _float_format(value: str) -> Callable[[float], str]:
+    """ Запись дробного числа по образцу value: с тем же числом знаков после точки или repr. """
+    point = value.find('.')
+    if point < 0 or 'e' in value or 'E' in value:
+        return repr
+    return '{{:.{}f}}'.format(len(value) - point - 1).format
+
+
+def _as_floats(values: Sequence[str], format_float: Callable[[float], str]) -> Optional[array]:
+    """ Дробные числа, если все значения записаны как format_float(число), иначе None. """
+    try:
+        numbers = list(map(float, values))
+    except ValueError:
+        return None
+    if list(map(format_float, numbers)) != list(values):
+        return None
+    return array('d', numbers)
+
+
+class _Column:
+    """ Значения одного столбца. """
+
+    def __init__(self):
+        # Способ хранения (None - значений ещё нет)
+        self.kind: Optional[str] = None
+        # Числа (_INT, _FLOAT)
+        self.numbers: array = array('q')
+        # Запись дробного числа (_FLOAT)
+        self.__format: Callable[[float], str] = repr
+        # Значения подряд (_TEXT): части при загрузке, после finish - одна строка
+        self.__parts: List[str] = []
+        self.__text: str = ''
+        # Границы значений в строке: значение i - text[offsets[i]:offsets[i + 1]] (_TEXT)
+        self.__offsets: array = array('q', [0])
+
+    def extend(self, values: Sequence[str]) -> None:
+        """ Добавление значений; столбец переходит к хранению строкой, если числа больше не подходят. """
+        if self.kind is None:
+            self.__format = _float_format(values[0]) if values else repr
+            self.kind = _INT if _as_ints(values) is not None else \
+                _FLOAT if _as_floats(values, self.__format) is not None else _TEXT
+            if self.kind == _FLOAT:
+                self.numbers = array('d')
+        if self.kind != _TEXT:
+            numbers = _as_ints(values) if self.kind == _INT else _as_floats(values, self.__format)
+            if numbers is not None:
+                self.numbers.extend(numbers)
+                return
+            # Значения, которые не записываются числом, - и все прежние хранятся строкой.
+            previous = self.values()
+            self.kind = _TEXT
+            self.numbers = array('q')
+            self.__append_text(previous)
+        self.__append_text(values)
+
+    def __append_text(self, values: Sequence[str]) -> None:
+        self.__parts.append(''.join(values))
+        # Первая граница новых значений - последняя из прежних.
+        self.__offsets.extend(islice(accumulate(map(len, values), initial=self.__offsets[-1]), 1, None))
+
+    def finish(self) -> None:
+        """ Окончание загрузки. """
+        if self.__parts:
+            self.__text = ''.join(self.__parts)
+            self.__parts = []
+
+    @property
+    def nbytes(self) -> int:
+        """ Память под значения, байт. """
+        return sys.getsizeof(self.numbers) + sys.getsizeof(self.__offsets) + sys.getsizeof(self.__text) + \
+            sum(map(sys.getsizeof, self.__parts))
+
+    def take(self, order: Iterable[int]) -> List[str]:
+        """ Значения строк с номерами order. """
+        if self.kind == _TEXT:
+            text, offsets = self.__text, self.__offsets
+            return [text[offsets[idx]:offsets[idx + 1]] for idx in order]
+        return list(map(str if self.kind == _INT else self.__format, map(self.numbers.__getitem__, order)))
+
+    def values(self) -> List[str]:
+        """ Все значения по порядку. """
+        if self.kind == _TEXT:
+            self.finish()
+            return self.take(range(len(self.__offsets) - 1))
+        return list(map(str if self.kind == _INT else self.__format, self.numbers))
+
+    def number_keys(self, type_name: str) -> Optional[array]:
+        """ Числа столбца, если они и есть ключи сортировки типа type_name (все значения приводятся к нему, без NaN).
+        """
+        if self.kind == _INT and type_name in (schema.TYPE_INT, schema.TYPE_NUM):
+            return self.numbers
+        if self.kind == _FLOAT and type_name in (schema.TYPE_FLOAT, schema.TYPE_NUM) and \
+                all(number == number for number in self.numbers):
+            return self.numbers
+        return None
+
+    def numeric_key(self, type_name: str) -> Optional[Tuple[Any, Any]]:
+        """ Числовые ключи сортировки из буфера чисел (как columnar.numeric_key) или None, если их так не получить. """
+        numpy = columnar.numpy
+        if self.kind == _INT and type_name in (schema.TYPE_INT, schema.TYPE_FLOAT, schema.TYPE_NUM):
+            keys = numpy.frombuffer(self.numbers, dtype=numpy.int64)
+            if type_name == schema.TYPE_FLOAT:
+                # Как в columnar.numeric_key: целые, не представимые точно в float64, так не сортируются.
+                if keys.min() <= -_FLOAT_EXACT or keys.max() >= _FLOAT_EXACT:
+                    return None
+                keys = keys.astype(numpy.float64)
+            return keys, numpy.zeros(len(keys), dtype=bool)
+        if self.kind == _FLOAT and type_name in (schema.TYPE_FLOAT, schema.TYPE_NUM):
+            keys = numpy.frombuffer(self.numbers, dtype=numpy.float64)
+            # NaN не упорядочивается.
+            bad = numpy.isnan(keys)
+            return (numpy.where(bad, 0, keys) if bad.any() else keys), bad
+        return None
+
+
+class CompactTable(Sequence[tuple]):
+    """ Строки файла по столбцам. Для чтения - последовательность кортежей строк, как список кортежей. """
+
+    def __init__(self, header: tuple):
+        """
+
+        :param header: Кортеж заголовков столбцов.
+        """
+        self.header: tuple = header
+        self.__columns: List[_Column] = [_Column() for _ in header]
+        self.__rows: int = 0
+
+    def append(self, rows: List[tuple]) -> bool:
+        """ Добавление строк.
+
+        :return: False (строки не добавлены), если число значений какой-то строки не равно числу столбцов.
+        """
+        if any(len(row) != len(self.header) for row in rows):
+            return False
+        for column, values in zip(self.__columns, zip(*rows)):
+            column.extend(values)
+        self.__rows += len(rows)
+        return True
+
+    def finish(self) -> None:
+        """ Окончание загрузки: значения столбцов, хранимых строкой, сливаются в одну строку. """
+        for column in self.__columns:
+            column.finish()
+
+    @property
+    def nbytes(self) -> int:
+        """ Память под значения, байт. """
+        return sum(column.nbytes for column in self.__columns)
+
+    def column_kinds(self) -> Tuple[str, ...]:
+        """ Способы хранения столбцов: 'int', 'float', 'text'. """
+        return tuple(column.kind or _TEXT for column in self.__columns)
+
+    def __len__(self) -> int:
+        return self.__rows
+
+    def __getitem__(self, idx: Any) -> Any:
+        if isinstance(idx, slice):
+            return list(self.iter_rows(range(self.__rows)[idx]))
+        if idx < 0:
+            idx += self.__rows
+        if not 0 <= idx < self.__rows:
+            raise IndexError('номер строки вне таблицы')
+        return tuple(column.take((idx,))[0] for column in self.__columns)
+
+    def __iter__(self) -> Iterator[tuple]:
+        return self.iter_rows()
+
+    def iter_rows(self, order: Optional[Sequence[int]] = None) -> Iterator[tuple]:
+        """ Кортежи строк в порядке файла или в порядке номеров order (список или массив numpy).
+
+        Строки собираются порциями по block_rows.
+        """
+        if order is None:
+            order = range(self.__rows)
+        for start in range(0, len(order), block_rows):
+            block = order[start:start + block_rows]
+            if not isinstance(block, (list, range)):
+                block = block.tolist()
+            if self.__columns:
+                yield from zip(*(column.take(block) for column in self.__columns))
+            else:
+                yield from repeat((), len(block))
+
+    def sort_order(self, index: List[int], types: List[str], descending: List[bool]) -> Sequence[int]:
+        """ Номера строк в порядке сортировки (как у get_cgi.sort).
+
+        :param index: Индексы столбцов сортировки.
+        :param types: Типы столбцов сортировки.
+        :param descending: Признаки сортировки по убыванию.
+        :return: Массив numpy или список номеров строк.
+        """
+        if self.__rows and columnar.load_numpy() is not None:
+            # Значения последнего запрошенного столбца: нужны и для числовых ключей, и для неприводимых значений.
+            loaded: Dict[int, List[str]] = {}
+
+            def column_values(num: int) -> List[str]:
+                if num not in loaded:
+                    loaded.clear()
+                    loaded[num] = self.__columns[index[num]].values()
+                return loaded[num]
+
+            def numeric(num: int) -> Optional[Tuple[Any, Any]]:
+                return self.__columns[index[num]].numeric_key(types[num]) or \
+                    columnar.numeric_key(column_values(num), types[num])
+
+            order = columnar.sort_order(list(zip(types, descending)), column_values, numeric)
+            if order is not None:
+                return order
+
+        order = list(range(self.__rows))
+        # От второстепенного столбца к главному: устойчивые сортировки по одному столбцу дают тот же порядок, что
+        # сортировка по кортежу ключей всех столбцов, а ключи в памяти - только одного столбца.
+        for idx, type_name, desc in reversed(list(zip(index, types, descending))):
+            column = self.__columns[idx]
+            numbers = column.number_keys(type_name)
+            if numbers is not None:
+                # reverse сохраняет порядок равных элементов.
+                order.sort(key=numbers.__getitem__, reverse=desc)
+                continue
+            keys = list(map(schema.make_sort_key([0], [type_name], [desc]), zip(column.values())))
+            order.sort(key=keys.__getitem__)
+            del keys
+        return order
+
+
+def sort_bytes(rows: int, key_columns: int) -> int:
+    """ Оценка памяти на сортировку rows строк по key_columns столбцам (сверх значений), байт. """
+    if not key_columns:
+        return 0
+    return rows * (sort_row_bytes + (key_columns * numpy_key_bytes if columnar.load_numpy() is not None else 0))
+
+
+def load(header: tuple, rows: Iterable[tuple], memory_budget: int, key_columns: int = 0) -> \
+        Tuple[CompactTable, Optional[Iterator[tuple]]]:
+    """ Загрузка строк в CompactTable, пока они вместе с сортировкой по key_columns столбцам умещаются в
+    memory_budget байт.
+
+    :param header: Кортеж заголовков столбцов.
+    :param rows: Строки (кортежи значений).
+    :param memory_budget: Допустимый объём памяти, байт.
+    :param key_columns: Число столбцов сортировки (0 - без сортировки).
+    :return: Таблица и None, если загружены все строки; иначе таблица и остальные строки. Загрузка прекращается и
+        на строке, в которой значений не столько, сколько столбцов.
+    """
+    table = CompactTable(header)
+    iterator = iter(rows)
+    while True:
+        block = list(islice(iterator, block_rows))
+        if not block:
+            table.finish()
+            return table, None
+        if not table.append(block):
+            table.finish()
+            return table, chain(block, iterator)
+        if table.nbytes + sort_bytes(len(table), key_columns) > memory_budget:
+            table.finish()
+            return table, iterator
+
+
+def sort_rows(header: tuple, rows: Iterable[tuple], index: List[int], types: List[str], descending: List[bool],
+              memory_budget: int, tmp_dir: Optional[str] = None) -> Iterator[tuple]:
+    """ Сортировка строк (как get_cgi.sort) в CompactTable порциями, умещающимися в memory_budget вместе с сортировкой.
+
+    Если все строки уместились в одну порцию, они выдаются из памяти. Иначе каждая отсортированная порция выгружается
+    во временный файл прогоном пар (ключ, строка), и прогоны сливаются (см. extsort.merge_runs). Строки, начиная
+    с порции, в которой значений какой-то строки не столько, сколько столбцов, сортируются extsort.external_sort.
+    Сортировка выполняется при первом обращении к итератору.
+
+    :param header: Кортеж заголовков столбцов.
+    :param rows: Строки.
+    :param index: Индексы столбцов сортировки.
+    :param types: Типы столбцов сортировки.
+    :param descending: Признаки сортировки по убыванию.
+    :param memory_budget: Допустимый объём памяти под порцию, байт.
+    :param tmp_dir: Директория для временных файлов (None - системная).
+    :return: Итератор по отсортированным строкам.
+    """
+    key = schema.make_sort_key(index, types, descending)
+    runs: List[str] = []
+    rest: Optional[Iterable[tuple]] = rows
+    try:
+        while rest is not None:
+            table, remaining = load(header, rest, memory_budget, len(index))
+            rest = remaining
+            if rest is not None and not len(table):
+                # Строка с другим числом значений.
+                break
+            order = table.sort_order(index, types, descending)
+            if rest is None and not runs:
+                yield from table.iter_rows(order)
+                return
+            runs.append(extsort.write_run(schema.decorate(table.iter_rows(order), key), tmp_dir))
+            # Порция освобождается до загрузки следующей.
+            del table, order
+
+        pairs: Iterator[Tuple[tuple, tuple]] = extsort.merge_runs(runs, itemgetter(0), tmp_dir)
+        if rest is not None:
+            # Прогоны - из строк, предшествующих остальным, поэтому идут при слиянии первыми.
+            pairs = heapq.merge(pairs, extsort.external_sort(schema.decorate(rest, key), itemgetter(0), memory_budget,
+                                                             tmp_dir, size=extsort.pair_size), key=itemgetter(0))
+        yield from map(itemgetter(1), pairs)
+    finally:
+        extsort.remove_runs(runs)
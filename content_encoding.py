@@ -0,0 +1,108 @@
+""" Сжатие ответов сервера (Content-Encoding), согласуемое по заголовку Accept-Encoding запроса.
+
+gzip поддерживается всегда (zlib), zstd - если установлен модуль zstandard. Ответ сжимается по мере формирования
+порций: после каждой порции сжатые данные сбрасываются, поэтому клиент получает строки, не дожидаясь конца ответа.
+"""
+import zlib
+from typing import Any, Iterable, Iterator, List, Optional, Tuple
+
+ENCODING_GZIP: str = 'gzip'
+ENCODING_ZSTD: str = 'zstd'
+ENCODING_IDENTITY: str = 'identity'
+
+# Степень сжатия gzip (1 - быстрее, 9 - сильнее).
+gzip_level: int = 1
+# Степень сжатия zstd (1 - быстрее, 22 - сильнее).
+zstd_level: int = 3
+# Сжатия в порядке предпочтения сервера.
+preferred_encodings: Tuple[str, ...] = (ENCODING_ZSTD, ENCODING_GZIP)
+
+# zlib: заголовок и контрольная сумма gzip.
+_GZIP_WBITS: int = 16 + zlib.MAX_WBITS
+
+# Модуль zstandard (см. load_zstandard): None - ещё не импортирован или не установлен.
+zstandard: Any = None
+# Была ли попытка импорта zstandard.
+_zstandard_loaded: bool = False
+
+
+def load_zstandard() -> Any:
+    """ Модуль zstandard или None, если он не установлен (без него доступно только сжатие gzip).
+    Импортируется при первом запросе, допускающем zstd. """
+    global zstandard, _zstandard_loaded
+    if not _zstandard_loaded:
+        try:
+            import zstandard as module
+        except ImportError:
+            module = None
+        zstandard = module
+        _zstandard_loaded = True
+    return zstandard
+
+
+def available_encodings() -> List[str]:
+    """ Сжатия, поддерживаемые сервером, в порядке предпочтения. """
+    return [encoding for encoding in preferred_encodings if encoding != ENCODING_ZSTD or load_zstandard() is not None]
+
+
+def parse_accept_encoding(accept_encoding: str) -> dict:
+    """ Разбор заголовка Accept-Encoding.
+
+    :return: Словарь {'сжатие': вес q}; сжатия с весом 0 не принимаются клиентом.
+    """
+    weights: dict = {}
+    for item in accept_encoding.split(','):
+        name, *params = item.strip().split(';')
+        if not name:
+            continue
+        weight: float = 1.0
+        for param in params:
+            key, _, value = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[name.strip().lower()] = weight
+    return weights
+
+
+def negotiate(accept_encoding: Optional[str]) -> Optional[str]:
+    """ Выбор сжатия ответа.
+
+    :param accept_encoding: Заголовок Accept-Encoding запроса.
+    :return: Сжатие (ENCODING_GZIP, ENCODING_ZSTD) или None - ответ не сжимается.
+    """
+    if not accept_encoding:
+        return None
+    weights = parse_accept_encoding(accept_encoding)
+    candidates = [(weights.get(encoding, weights.get('*', 0.0)), -num, encoding)
+                  for num, encoding in enumerate(preferred_encodings)]
+    # Наличие zstandard проверяется, только если клиент допускает zstd.
+    candidates = [candidate for candidate in candidates if candidate[0] > 0 and
+                  (candidate[2] != ENCODING_ZSTD or load_zstandard() is not None)]
+    weight, _, encoding = max(candidates, default=(0.0, 0, None))
+    return encoding if weight > 0 else None
+
+
+def compress_stream(chunks: Iterable[bytes], encoding: str) -> Iterator[bytes]:
+    """ Потоковое сжатие частей ответа.
+
+    :param chunks: Части ответа.
+    :param encoding: Сжатие (см. negotiate).
+    :return: Части сжатого ответа.
+    """
+    if encoding == ENCODING_ZSTD:
+        compressor = zstandard.ZstdCompressor(level=zstd_level).compressobj()
+        flush_mode = zstandard.COMPRESSOBJ_FLUSH_BLOCK
+    else:
+        compressor = zlib.compressobj(gzip_level, zlib.DEFLATED, _GZIP_WBITS)
+        flush_mode = zlib.Z_SYNC_FLUSH
+
+    for chunk in chunks:
+        if not chunk:
+            continue
+        data = compressor.compress(chunk) + compressor.flush(flush_mode)
+        if data:
+            yield data
+    yield compressor.flush()
@@ -1,14 +1,24 @@
 """ Модуль работы с базами данных. """
 import abc
 from common import RequestStatus, TokenType
-import mysql.connector
 from datetime import datetime, timedelta
 import random
+import atexit
+import threading
+import time
+from contextlib import contextmanager
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
 import db_data
 
 
 # Время бездействия сессии, сек
 SESSION_WAITING_TIME = 60
+# Максимальная задержка записи времени обращения в БД при кэшировании сеансов, сек.
+# Должна быть заметно меньше SESSION_WAITING_TIME.
+SESSION_FLUSH_INTERVAL = 5
+# Максимальное число токенов в кэше сеансов.
+SESSION_CACHE_SIZE = 10000
 
 
 class UsersDBInterface(abc.ABC):
@@ -34,15 +44,182 @@ class UsersDBInterface(abc.ABC):
         """ Обновление времени обращения. """
         ...
 
+    @abc.abstractmethod
+    def renew_timestamps(self, timestamps: Dict[TokenType, datetime]) -> None:
+        """ Запись времени обращения сразу для нескольких токенов (одним запросом). """
+        ...
+
     @abc.abstractmethod
     def check_token(self, token: TokenType) -> RequestStatus:
         """ Проверка токена на актуальность. Вдруг его время уже истекло, или такого токена не существует? """
         ...
 
+    @abc.abstractmethod
+    def touch_if_active(self, token: TokenType) -> RequestStatus:
+        """ Проверка токена и, если он актуален, обновление времени обращения - одной операцией.
+
+        :return: RequestStatus.OK, RequestStatus.UNAUTHORIZED или RequestStatus.REQUEST_TIMEOUT
+        """
+        ...
+
+    @abc.abstractmethod
+    def authenticate_and_issue_token(self, login: str, password: str) -> Tuple[RequestStatus, TokenType]:
+        """ Проверка логина и пароля и выдача нового токена сеанса - одной операцией.
+
+        :return: Статус (RequestStatus.OK, RequestStatus.USER_NON_FOUND, RequestStatus.WRONG_PASSWORD),
+        токен (0, если статус не RequestStatus.OK).
+        """
+        ...
+
+
+class ConnectionPool:
+    """ Ограниченный пул соединений с БД.
+
+    Соединения создаются по мере надобности, но не больше size одновременно. Соединение, простоявшее без дела
+    дольше idle_timeout, закрывается; простоявшее дольше check_interval - перед выдачей проверяется на живость.
+    Пул не зависит от драйвера: соединения создаёт функция connect (mysql.connector, sqlite3 и т. п.).
+    """
+    def __init__(self, connect: Callable[[], Any], size: int, idle_timeout: float, check_interval: float,
+                 acquire_timeout: Optional[float] = None):
+        """
+
+        :param connect: Функция создания нового соединения.
+        :param size: Максимальное число соединений.
+        :param idle_timeout: Время простоя, после которого соединение закрывается, сек.
+        :param check_interval: Время простоя, после которого соединение проверяется перед выдачей, сек.
+        :param acquire_timeout: Время ожидания свободного соединения, сек (None - без ограничения).
+        """
+        self.__connect = connect
+        self.__size: int = size
+        self.__idle_timeout: float = idle_timeout
+        self.__check_interval: float = check_interval
+        self.__acquire_timeout: Optional[float] = acquire_timeout
+        # Свободные соединения с моментом последнего использования (последнее освободившееся - в конце).
+        self.__idle: List[Tuple[Any, float]] = []
+        # Число созданных и не закрытых соединений (свободных и выданных).
+        self.__count: int = 0
+        self.__condition = threading.Condition()
+
+    @staticmethod
+    def __close(cnx: Any) -> None:
+        try:
+            cnx.close()
+        except Exception:
+            pass
+
+    @staticmethod
+    def __is_alive(cnx: Any) -> bool:
+        """ Проверка соединения. """
+        try:
+            if hasattr(cnx, 'is_connected'):
+                # mysql.connector
+                return cnx.is_connected()
+            cursor = cnx.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchall()
+            cursor.close()
+            return True
+        except Exception:
+            return False
+
+    def __evict_idle(self, now: float) -> List[Any]:
+        """ Изъятие из пула давно простаивающих соединений (вызывается под блокировкой). """
+        expired = [cnx for cnx, used in self.__idle if now - used > self.__idle_timeout]
+        if expired:
+            self.__idle = [(cnx, used) for cnx, used in self.__idle if now - used <= self.__idle_timeout]
+            self.__count -= len(expired)
+            self.__condition.notify(len(expired))
+        return expired
+
+    def acquire(self) -> Any:
+        """ Получение соединения из пула (или создание нового).
+
+        :raises TimeoutError: Свободное соединение не появилось за acquire_timeout.
+        """
+        deadline = None if self.__acquire_timeout is None else time.monotonic() + self.__acquire_timeout
+        while True:
+            cnx = None
+            used: float = 0.0
+            with self.__condition:
+                while True:
+                    for expired in self.__evict_idle(time.monotonic()):
+                        self.__close(expired)
+                    if self.__idle:
+                        cnx, used = self.__idle.pop()
+                        break
+                    if self.__count < self.__size:
+                        self.__count += 1
+                        break
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        raise TimeoutError("Нет свободных соединений с БД.")
+                    self.__condition.wait(remaining)
+
+            if cnx is None:
+                # Место в пуле зарезервировано, создаём соединение.
+                try:
+                    return self.__connect()
+                except Exception:
+                    self.__discard()
+                    raise
+
+            if time.monotonic() - used <= self.__check_interval or self.__is_alive(cnx):
+                return cnx
+
+            # Соединение оборвалось, пробуем следующее.
+            self.__close(cnx)
+            self.__discard()
+
+    def __discard(self) -> None:
+        """ Учёт закрытого соединения, полученного из пула. """
+        with self.__condition:
+            self.__count -= 1
+            self.__condition.notify()
+
+    def release(self, cnx: Any, is_broken: bool = False) -> None:
+        """ Возврат соединения в пул.
+
+        :param cnx: Соединение, полученное acquire().
+        :param is_broken: Соединение неисправно и должно быть закрыто.
+        """
+        if is_broken:
+            self.__close(cnx)
+            self.__discard()
+            return
+        with self.__condition:
+            self.__idle.append((cnx, time.monotonic()))
+            self.__condition.notify()
+
+    @contextmanager
+    def connection(self) -> Iterator[Any]:
+        """ Соединение на время одной транзакции: по выходу из блока транзакция фиксируется, соединение
+        возвращается в пул. При ошибке соединение закрывается. """
+        cnx = self.acquire()
+        try:
+            yield cnx
+            # Фиксация завершает и транзакцию чтения, иначе следующий запрос увидит старый снимок данных.
+            cnx.commit()
+        except BaseException:
+            self.release(cnx, is_broken=True)
+            raise
+        self.release(cnx)
+
+    def close(self) -> None:
+        """ Закрытие всех свободных соединений. """
+        with self.__condition:
+            idle, self.__idle = self.__idle, []
+            self.__count -= len(idle)
+            self.__condition.notify(len(idle))
+        for cnx, _ in idle:
+            self.__close(cnx)
+
 
 class SQL(UsersDBInterface):
     """ Возможная реализация. """
-    def __init__(self, waiting_time: int, script_user: str, script_pass: str, db: str, table: str, ip: str):
+    def __init__(self, waiting_time: int, script_user: str, script_pass: str, db: str, table: str, ip: str,
+                 pool_size: int = db_data.POOL_SIZE, idle_timeout: float = db_data.POOL_IDLE_TIMEOUT,
+                 check_interval: float = db_data.POOL_CHECK_INTERVAL, connect: Optional[Callable[[], Any]] = None,
+                 placeholder: str = '%s'):
         """
 
         :param waiting_time: Время допустимого простоя.
@@ -51,6 +228,13 @@ class SQL(UsersDBInterface):
         :param db: Имя базы данных
         :param table: Таблица базы данных с пользователями.
         :param ip: ip-адрес SQL-сервера.
+        :param pool_size: Максимальное число соединений в пуле.
+        :param idle_timeout: Время простоя, после которого соединение закрывается, сек.
+        :param check_interval: Время простоя, после которого соединение проверяется перед использованием, сек.
+        :param connect: Функция создания соединения. По умолчанию - соединение mysql.connector с параметрами выше.
+            Для проверок без MySQL подходит, например,
+            lambda: sqlite3.connect(path, detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False)
+        :param placeholder: Обозначение параметра запроса у драйвера ('%s' - mysql.connector, '?' - sqlite3).
         """
         super().__init__()
         # Время допустимого простоя в ожидании очередного обращения одного пользователя.
@@ -62,109 +246,338 @@ class SQL(UsersDBInterface):
         self.__db: str = db
         self.__table: str = table
         self.__host: str = ip
+        self.__placeholder: str = placeholder
+        self.__pool = ConnectionPool(connect or self.__mysql_connect, pool_size, idle_timeout, check_interval)
+
+    def __mysql_connect(self) -> Any:
+        """ Новое соединение с MySQL. """
+        # Драйвер импортируется при первом соединении: CGI-скрипт, отклоняющий запрос до обращения к БД,
+        # и база в памяти (MemoryDB) без него обходятся.
+        import mysql.connector
+        # FOUND_ROWS: число строк UPDATE - найденные, а не изменённые (время могло совпасть с записанным)
+        return mysql.connector.connect(user=self.__db_user, password=self.__db_password,
+                                       host=self.__host,
+                                       database=self.__db,
+                                       client_flags=[mysql.connector.constants.ClientFlag.FOUND_ROWS])
 
     def __token_generate(self) -> TokenType:
         """ Генерация токена сеанса. """
         return random.randint(10000, 99999)
 
-    def is_real_user(self, login: str) -> bool:
-        # Начальное значение: ответ из БД пустой
-        result: bool = False
-
-        cnx = mysql.connector.connect(user=self.__db_user, password=self.__db_password,
-                                      host=self.__host,
-                                      database=self.__db)
-        # Обязательно buffered=True
-        # https://stackoverflow.com/questions/29772337/python-mysql-connector-unread-result-found-when-using-fetchone
-        # Ответ БД в виде словаря
-        cursor = cnx.cursor(buffered=True, dictionary=True)
-        query = ("SELECT login, password FROM {} "
-                 "WHERE login = '{}'".format(self.__table, login))
-
-        cursor.execute(query)
-
-        # Если ответа из БД нет (значение не найдено), то в цикл for вообще не заходит
-        for answer in cursor:
-            if 'login' in answer.keys():
-                result = True
-
-        cursor.close()
-        cnx.close()
-        return result
+    def __execute(self, query: str, params: tuple) -> Tuple[List[tuple], int]:
+        """ Выполнение одного запроса на соединении из пула.
 
-    def login(self, login: str, password: str) -> bool:
-        cnx = mysql.connector.connect(user=self.__db_user, password=self.__db_password,
-                                      host=self.__host,
-                                      database=self.__db)
-        # Ответ БД в виде словаря
-        cursor = cnx.cursor(buffered=True, dictionary=True)
-        query = ("UPDATE {} SET timestamp='{}', token={} "
-                 "WHERE login='{}'".format(self.__table, datetime.today(), self.__token_generate(), login))
-        cursor.execute(query)
+        :param query: Текст запроса, параметры обозначены {p}.
+        :param params: Значения параметров.
+        :return: Строки ответа, число затронутых строк.
+        """
+        with self.__pool.connection() as cnx:
+            cursor = cnx.cursor()
+            try:
+                cursor.execute(query.format(table=self.__table, p=self.__placeholder), params)
+                rows = cursor.fetchall() if cursor.description else []
+                return rows, cursor.rowcount
+            finally:
+                cursor.close()
+
+    def close(self) -> None:
+        """ Закрытие соединений пула. """
+        self.__pool.close()
 
-        cnx.commit()
+    def is_real_user(self, login: str) -> bool:
+        rows, _ = self.__execute("SELECT login FROM {table} WHERE login = {p}", (login,))
+        # Если ответа из БД нет (значение не найдено), то список пуст
+        return len(rows) > 0
 
+    def login(self, login: str, password: str) -> bool:
+        self.__execute("UPDATE {table} SET timestamp = {p}, token = {p} WHERE login = {p}",
+                       (datetime.today(), self.__token_generate(), login))
         return True
 
     def get_token(self, login: str) -> TokenType:
-        result = 0
-        cnx = mysql.connector.connect(user=self.__db_user, password=self.__db_password,
-                                      host=self.__host,
-                                      database=self.__db)
-        cursor = cnx.cursor(buffered=True, dictionary=True)
-        query = ("SELECT token FROM {} "
-                 "WHERE login = '{}'".format(self.__table, login))
-        cursor.execute(query)
-
-        # Если ответа из БД нет (значение не найдено), то в цикл for вообще не заходит
-        for answer in cursor:
-            result = answer['token']
-
-        cursor.close()
-        cnx.close()
-        return result
+        rows, _ = self.__execute("SELECT token FROM {table} WHERE login = {p}", (login,))
+        # Если ответа из БД нет (значение не найдено), то токен нулевой
+        return rows[-1][0] if rows else 0
 
     def renew_timestamp(self, token: TokenType) -> None:
-        cnx = mysql.connector.connect(user=self.__db_user, password=self.__db_password,
-                                      host=self.__host,
-                                      database=self.__db)
-        # Ответ БД в виде словаря
-        cursor = cnx.cursor(buffered=True, dictionary=True)
-        query = ("UPDATE {} SET timestamp='{}' "
-                 "WHERE token={}".format(self.__table, datetime.today(), token))
-        cursor.execute(query)
-
-        cnx.commit()
-
-        cursor.close()
-        cnx.close()
+        self.__execute("UPDATE {table} SET timestamp = {p} WHERE token = {p}", (datetime.today(), token))
+
+    def renew_timestamps(self, timestamps: Dict[TokenType, datetime]) -> None:
+        if not timestamps:
+            return
+        # UPDATE ... SET timestamp = CASE token WHEN t1 THEN ts1 WHEN t2 THEN ts2 ... END WHERE token IN (t1, t2, ...)
+        cases = ' '.join(['WHEN {p} THEN {p}'] * len(timestamps))
+        tokens = ', '.join(['{p}'] * len(timestamps))
+        params = tuple(value for pair in timestamps.items() for value in pair) + tuple(timestamps)
+        self.__execute("UPDATE {table} SET timestamp = CASE token " + cases + " END WHERE token IN (" + tokens + ")",
+                       params)
 
     def check_token(self, token: TokenType) -> RequestStatus:
-        # Значение по умолчанию
-        default: datetime = datetime(1970, 1, 1, 00, 00, 00)
-        timestamp: datetime = default
-
-        cnx = mysql.connector.connect(user=self.__db_user, password=self.__db_password,
-                                      host=self.__host,
-                                      database=self.__db)
-        cursor = cnx.cursor(buffered=True, dictionary=True)
-        query = ("SELECT timestamp FROM {} "
-                 "WHERE token = {}".format(self.__table, token))
-        cursor.execute(query)
-
-        # Если ответа из БД нет (значение не найдено), то в цикл for вообще не заходит
-        for answer in cursor:
-            timestamp = answer['timestamp']
-
-        cursor.close()
-        cnx.close()
-
-        if timestamp is default:
+        rows, _ = self.__execute("SELECT timestamp FROM {table} WHERE token = {p}", (token,))
+
+        if not rows or rows[-1][0] is None:
             # Таймстэмп не найден в базе данных
             return RequestStatus.UNAUTHORIZED
 
+        timestamp: datetime = rows[-1][0]
         if datetime.today() - timestamp > timedelta(seconds=self.__waiting_time):
             # Время паузы для этого сеанса истекло.
             return RequestStatus.REQUEST_TIMEOUT
 
         return RequestStatus.OK
+
+    def touch_if_active(self, token: TokenType) -> RequestStatus:
+        now = datetime.today()
+        _, count = self.__execute("UPDATE {table} SET timestamp = {p} WHERE token = {p} AND timestamp >= {p}",
+                                  (now, token, now - timedelta(seconds=self.__waiting_time)))
+        if count > 0:
+            return RequestStatus.OK
+        # Второй запрос - только чтобы отличить неизвестный токен от истёкшего.
+        status = self.check_token(token)
+        return status if status != RequestStatus.OK else RequestStatus.REQUEST_TIMEOUT
+
+    def authenticate_and_issue_token(self, login: str, password: str) -> Tuple[RequestStatus, TokenType]:
+        token = self.__token_generate()
+        _, count = self.__execute("UPDATE {table} SET timestamp = {p}, token = {p} "
+                                  "WHERE login = {p} AND password = {p}",
+                                  (datetime.today(), token, login, password))
+        if count > 0:
+            return RequestStatus.OK, token
+        # Второй запрос - только чтобы отличить неизвестного пользователя от неверного пароля.
+        return (RequestStatus.WRONG_PASSWORD if self.is_real_user(login) else RequestStatus.USER_NON_FOUND), 0
+
+
+class SessionCache(UsersDBInterface):
+    """ Кэш сеансов перед интерфейсом БД.
+
+    Для каждого токена запоминается время последнего обращения и время последней проверки в БД. Пока обе не старше
+    waiting_time, check_token и touch_if_active отвечают из кэша без запроса к БД; не реже раза в waiting_time
+    токен проверяется в БД, сколько бы обращений ни было между проверками (так замечается отзыв токена в БД,
+    например другим процессом). Обновления времени обращения копятся и записываются в БД одним запросом
+    renew_timestamps не позже чем через flush_interval (а также при вызове flush() и при завершении процесса).
+    Имеет смысл в постоянно работающем сервере (app.py), где кэш живёт между запросами.
+    """
+    def __init__(self, db: UsersDBInterface, waiting_time: int = SESSION_WAITING_TIME,
+                 flush_interval: float = SESSION_FLUSH_INTERVAL, max_size: int = SESSION_CACHE_SIZE):
+        """
+
+        :param db: Интерфейс БД, запросы к которому кэшируются.
+        :param waiting_time: Время допустимого простоя сеанса, сек (время жизни записи кэша).
+        :param flush_interval: Максимальная задержка записи времени обращения в БД, сек.
+        :param max_size: Максимальное число токенов в кэше.
+        """
+        super().__init__()
+        self.__db: UsersDBInterface = db
+        self.__waiting_time: timedelta = timedelta(seconds=waiting_time)
+        self.__flush_interval: float = flush_interval
+        self.__max_size: int = max_size
+        # Токен -> время последнего обращения (давно обновлённые - в начале)
+        self.__seen: 'OrderedDict[TokenType, datetime]' = OrderedDict()
+        # Токен -> время последней проверки в БД, подтвердившей, что токен действует
+        self.__checked: Dict[TokenType, datetime] = {}
+        # Ещё не записанные в БД времена обращения
+        self.__pending: Dict[TokenType, datetime] = {}
+        # Логин -> токен, выданный этим процессом (чтобы при повторном входе отозвать прежний токен)
+        self.__issued: Dict[str, TokenType] = {}
+        self.__lock = threading.Lock()
+        # Таймер ближайшей записи в БД
+        self.__timer: Optional[threading.Timer] = None
+        self.__hits: int = 0
+        self.__misses: int = 0
+        atexit.register(self.flush)
+
+    @property
+    def hits(self) -> int:
+        """ Число проверок токена, обслуженных кэшем. """
+        return self.__hits
+
+    @property
+    def misses(self) -> int:
+        """ Число проверок токена, переданных в БД. """
+        return self.__misses
+
+    def invalidate(self, token: Optional[TokenType] = None) -> None:
+        """ Удаление токена из кэша (принудительное завершение сеанса); без параметра - очистка всего кэша.
+        Незаписанное время обращения для удаляемых токенов отбрасывается. """
+        with self.__lock:
+            if token is None:
+                self.__seen.clear()
+                self.__checked.clear()
+                self.__pending.clear()
+                self.__issued.clear()
+            else:
+                self.__seen.pop(token, None)
+                self.__checked.pop(token, None)
+                self.__pending.pop(token, None)
+
+    def flush(self) -> None:
+        """ Запись накопленных времён обращения в БД. """
+        with self.__lock:
+            pending, self.__pending = self.__pending, {}
+            if self.__timer is not None:
+                self.__timer.cancel()
+                self.__timer = None
+        if pending:
+            self.__db.renew_timestamps(pending)
+
+    def is_real_user(self, login: str) -> bool:
+        return self.__db.is_real_user(login)
+
+    def login(self, login: str, password: str) -> bool:
+        # Прежний токен пользователя перестаёт действовать.
+        self.invalidate(self.__db.get_token(login))
+        return self.__db.login(login, password)
+
+    def get_token(self, login: str) -> TokenType:
+        return self.__db.get_token(login)
+
+    def renew_timestamp(self, token: TokenType) -> None:
+        self.renew_timestamps({token: datetime.today()})
+
+    def renew_timestamps(self, timestamps: Dict[TokenType, datetime]) -> None:
+        with self.__lock:
+            for token, moment in timestamps.items():
+                self.__seen[token] = moment
+                self.__seen.move_to_end(token)
+                self.__pending[token] = moment
+            self.__trim()
+            if self.__timer is None:
+                self.__timer = threading.Timer(self.__flush_interval, self.flush)
+                self.__timer.daemon = True
+                self.__timer.start()
+
+    def __trim(self) -> None:
+        """ Удаление давно не использовавшихся токенов сверх max_size (под блокировкой). """
+        while len(self.__seen) > self.__max_size:
+            token, _ = self.__seen.popitem(last=False)
+            self.__checked.pop(token, None)
+
+    def __is_cached(self, token: TokenType, now: datetime) -> bool:
+        """ Можно ли ответить о токене из кэша: обращение к нему и его проверка в БД - не старше waiting_time
+        (под блокировкой). """
+        moment = self.__seen.get(token)
+        checked = self.__checked.get(token)
+        return moment is not None and checked is not None and now - moment <= self.__waiting_time and \
+            now - checked <= self.__waiting_time
+
+    def check_token(self, token: TokenType) -> RequestStatus:
+        with self.__lock:
+            if self.__is_cached(token, datetime.today()):
+                self.__hits += 1
+                return RequestStatus.OK
+            self.__misses += 1
+        return self.__db.check_token(token)
+
+    def touch_if_active(self, token: TokenType) -> RequestStatus:
+        now = datetime.today()
+        with self.__lock:
+            is_hit = self.__is_cached(token, now)
+            if is_hit:
+                self.__hits += 1
+            else:
+                self.__misses += 1
+
+        if is_hit:
+            # Время обращения будет записано в БД вместе с остальными.
+            self.renew_timestamps({token: now})
+            return RequestStatus.OK
+
+        status = self.__db.touch_if_active(token)
+        if status == RequestStatus.OK:
+            # БД уже обновлена, запоминаем только в кэше; более раннее незаписанное время обращения не нужно.
+            with self.__lock:
+                self.__seen[token] = now
+                self.__seen.move_to_end(token)
+                self.__checked[token] = now
+                if self.__pending.get(token, now) <= now:
+                    self.__pending.pop(token, None)
+                self.__trim()
+        else:
+            self.invalidate(token)
+        return status
+
+    def authenticate_and_issue_token(self, login: str, password: str) -> Tuple[RequestStatus, TokenType]:
+        status, token = self.__db.authenticate_and_issue_token(login, password)
+        if status == RequestStatus.OK:
+            with self.__lock:
+                previous = self.__issued.get(login)
+                self.__issued[login] = token
+            if previous is not None:
+                # Прежний токен пользователя перестаёт действовать.
+                self.invalidate(previous)
+        return status, token
+
+
+class MemoryDB(UsersDBInterface):
+    """ База данных пользователей в памяти процесса: для проверок и замеров без MySQL. """
+    def __init__(self, waiting_time: int = SESSION_WAITING_TIME, users: Optional[Dict[str, str]] = None):
+        """
+
+        :param waiting_time: Время допустимого простоя.
+        :param users: Пользователи {'логин': 'пароль'}.
+        """
+        super().__init__()
+        self.__waiting_time: timedelta = timedelta(seconds=waiting_time)
+        # Логин -> [пароль, время обращения, токен]
+        self.__users: Dict[str, list] = {login: [password, None, 0] for login, password in (users or {}).items()}
+        self.__lock = threading.Lock()
+
+    def add_user(self, login: str, password: str, token: TokenType = 0,
+                 timestamp: Optional[datetime] = None) -> None:
+        """ Добавление пользователя. """
+        with self.__lock:
+            self.__users[login] = [password, timestamp, token]
+
+    def __by_token(self, token: TokenType) -> Optional[list]:
+        for record in self.__users.values():
+            if record[2] == token:
+                return record
+        return None
+
+    def is_real_user(self, login: str) -> bool:
+        return login in self.__users
+
+    def login(self, login: str, password: str) -> bool:
+        with self.__lock:
+            if login in self.__users:
+                self.__users[login][1:] = [datetime.today(), random.randint(10000, 99999)]
+        return True
+
+    def get_token(self, login: str) -> TokenType:
+        record = self.__users.get(login)
+        return record[2] if record else 0
+
+    def renew_timestamp(self, token: TokenType) -> None:
+        self.renew_timestamps({token: datetime.today()})
+
+    def renew_timestamps(self, timestamps: Dict[TokenType, datetime]) -> None:
+        with self.__lock:
+            for record in self.__users.values():
+                if record[2] in timestamps:
+                    record[1] = timestamps[record[2]]
+
+    def check_token(self, token: TokenType) -> RequestStatus:
+        record = self.__by_token(token)
+        if record is None or record[1] is None:
+            return RequestStatus.UNAUTHORIZED
+        if datetime.today() - record[1] > self.__waiting_time:
+            return RequestStatus.REQUEST_TIMEOUT
+        return RequestStatus.OK
+
+    def touch_if_active(self, token: TokenType) -> RequestStatus:
+        with self.__lock:
+            status = self.check_token(token)
+            if status == RequestStatus.OK:
+                self.__by_token(token)[1] = datetime.today()
+        return status
+
+    def authenticate_and_issue_token(self, login: str, password: str) -> Tuple[RequestStatus, TokenType]:
+        with self.__lock:
+            record = self.__users.get(login)
+            if record is None:
+                return RequestStatus.USER_NON_FOUND, 0
+            if str(record[0]) != str(password):
+                return RequestStatus.WRONG_PASSWORD, 0
+            token = random.randint(10000, 99999)
+            record[1:] = [datetime.today(), token]
+        return RequestStatus.OK, token
@@ -6,3 +6,11 @@ DB_NAME: str = 'users'
 TABLE_NAME: str = 'users_list'
 USER_NAME: str = 'root'
 USER_PASSWORD: str = 'root'
+
+# Пул соединений с базой данных.
+# Максимальное число соединений.
+POOL_SIZE: int = 4
+# Время простоя, после которого соединение закрывается, сек.
+POOL_IDLE_TIMEOUT: int = 300
+# Время простоя, после которого соединение проверяется перед использованием, сек.
+POOL_CHECK_INTERVAL: int = 30
@@ -0,0 +1,150 @@
+""" Внешняя сортировка (с выгрузкой на диск) строк, не помещающихся в память. """
+import heapq
+import os
+import sys
+from typing import Any, Callable, Iterable, Iterator, List, Optional, Tuple
+
+# Число строк, сериализуемых в файл прогона за один вызов pickle.dump
+run_block_rows: int = 1000
+# Максимальное число одновременно сливаемых прогонов (открытых временных файлов).
+merge_fan_in: int = 64
+
+
+def row_size(row: tuple) -> int:
+    """ Оценка памяти, занимаемой строкой, байт. """
+    return sys.getsizeof(row) + sum(map(sys.getsizeof, row))
+
+
+def pair_size(pair: Tuple[tuple, tuple]) -> int:
+    """ Оценка памяти, занимаемой парой (ключ, строка), байт. """
+    return row_size(pair[0]) + row_size(pair[1])
+
+
+def write_run(rows: Iterable[Any], tmp_dir: Optional[str]) -> str:
+    """ Запись отсортированного прогона во временный файл.
+
+    :return: Путь к файлу прогона.
+    """
+    # pickle и tempfile нужны, только если строки не уместились в памяти.
+    import pickle
+    import tempfile
+    with tempfile.NamedTemporaryFile(dir=tmp_dir, prefix='csvsort', delete=False) as run:
+        block: List[Any] = []
+        for row in rows:
+            block.append(row)
+            if len(block) >= run_block_rows:
+                pickle.dump(block, run, protocol=pickle.HIGHEST_PROTOCOL)
+                block = []
+        if block:
+            pickle.dump(block, run, protocol=pickle.HIGHEST_PROTOCOL)
+    return run.name
+
+
+def read_run(path: str) -> Iterator[Any]:
+    """ Чтение прогона порциями. Файл удаляется по окончании чтения. """
+    import pickle
+    try:
+        with open(path, 'rb') as run:
+            while True:
+                try:
+                    block: List[Any] = pickle.load(run)
+                except EOFError:
+                    return
+                yield from block
+    finally:
+        _remove(path)
+
+
+def _remove(path: str) -> None:
+    """ Удаление файла прогона, если он ещё существует. """
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def remove_runs(paths: Iterable[str]) -> None:
+    """ Удаление файлов прогонов, которые ещё существуют. """
+    for path in paths:
+        _remove(path)
+
+
+def merge_runs(runs: List[str], key: Callable[[Any], Any], tmp_dir: Optional[str] = None) -> Iterator[Any]:
+    """ Слияние отсортированных прогонов (см. write_run) в один отсортированный поток.
+
+    Равные элементы выдаются в порядке прогонов в runs. Файлы прогонов удаляются по мере чтения,
+    а если чтение результата прервано - в конце.
+
+    :param runs: Пути к файлам прогонов.
+    :param key: Функция ключа сортировки.
+    :param tmp_dir: Директория для промежуточных прогонов (None - системная).
+    :return: Итератор по элементам прогонов.
+    """
+    # Все файлы прогонов, включая промежуточные
+    created: List[str] = list(runs)
+    try:
+        while len(runs) > merge_fan_in:
+            # Слишком много прогонов: предварительно сливаем их группами, сохраняя порядок прогонов
+            # (heapq.merge отдаёт равные элементы в порядке следования итераторов, что сохраняет устойчивость).
+            groups = [runs[i:i + merge_fan_in] for i in range(0, len(runs), merge_fan_in)]
+            runs = []
+            for group in groups:
+                runs.append(write_run(heapq.merge(*map(read_run, group), key=key), tmp_dir))
+                created.append(runs[-1])
+
+        yield from heapq.merge(*map(read_run, runs), key=key)
+    finally:
+        for path in created:
+            _remove(path)
+
+
+def external_sort(rows: Iterable[Any], key: Callable[[Any], Any], memory_budget: int,
+                  tmp_dir: Optional[str] = None, size: Callable[[Any], int] = row_size) -> Iterator[Any]:
+    """ Сортировка строк в пределах заданного объёма памяти.
+
+    Строки набираются в прогон, пока их оценочный объём не превысит memory_budget. Прогон сортируется
+    и выгружается во временный файл; затем прогоны сливаются heapq.merge (не более merge_fan_in за раз).
+    Если все строки уместились в один прогон, сортировка выполняется в памяти без временных файлов.
+    Порядок совпадает с sorted(rows, key=key), включая устойчивость для равных ключей.
+
+    :param rows: Строки.
+    :param key: Функция ключа сортировки.
+    :param memory_budget: Допустимый объём памяти под один прогон, байт.
+    :param tmp_dir: Директория для временных файлов (None - системная).
+    :param size: Функция оценки объёма строки, байт.
+    :return: Итератор по отсортированным строкам.
+    """
+    # Файлы текущих прогонов
+    runs: List[str] = []
+    # Все созданные файлы прогонов (прочитанные удаляются сразу, остальные - в конце)
+    created: List[str] = []
+    try:
+        buffer: List[Any] = []
+        used: int = 0
+
+        for row in rows:
+            buffer.append(row)
+            used += size(row)
+            if used >= memory_budget:
+                buffer.sort(key=key)
+                runs.append(write_run(buffer, tmp_dir))
+                created.append(runs[-1])
+                buffer = []
+                used = 0
+
+        buffer.sort(key=key)
+        if not runs:
+            # Всё уместилось в памяти.
+            yield from buffer
+            return
+
+        if buffer:
+            runs.append(write_run(buffer, tmp_dir))
+            created.append(runs[-1])
+        del buffer
+
+        yield from merge_runs(runs, key, tmp_dir)
+    finally:
+        # Если чтение результата прервано, временные файлы не должны оставаться на диске.
+        for path in created:
+            _remove(path)
@@ -0,0 +1,100 @@
+""" Условия отбора строк (параметр where запроса).
+
+Условие - 'имя<оператор>значение': '=' и '!=' - равенство, '>', '<', '>=', '<=' - сравнение, '~' - начало строки.
+Несколько условий через condition_separator объединяются по И: 'price>=10;name~Ab'.
+Значения сравниваются с учётом типа столбца: числа - как числа, даты - как даты, остальное - как строки.
+Условия компилируются один раз на запрос в функцию, проверяющую строку файла.
+"""
+import operator
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+import schema
+
+# Разделитель условий.
+condition_separator: str = ';'
+
+# Операторы сравнения (двухсимвольные проверяются раньше односимвольных).
+_comparisons: Dict[str, Callable[[Any, Any], bool]] = {'!=': operator.ne, '>=': operator.ge, '<=': operator.le,
+                                                      '=': operator.eq, '>': operator.gt, '<': operator.lt}
+# Оператор "значение начинается с".
+PREFIX: str = '~'
+OPERATORS: Tuple[str, ...] = tuple(_comparisons) + (PREFIX,)
+
+# Функция проверки строки файла.
+Predicate = Callable[[Sequence[str]], bool]
+
+
+def parse_condition(condition: str) -> Tuple[str, str, str]:
+    """ Разбор условия 'имя<оператор>значение'.
+
+    :return: Имя столбца, оператор, значение.
+    :raises ValueError: Условие не распознано.
+    """
+    # Оператор - первое вхождение любого из OPERATORS.
+    found: Optional[Tuple[int, str]] = None
+    for op in OPERATORS:
+        position = condition.find(op)
+        if position > 0 and (found is None or position < found[0]):
+            found = position, op
+    if found is None:
+        raise ValueError("Не найден оператор в условии: {}".format(condition))
+    position, op = found
+    return condition[:position], op, condition[position + len(op):]
+
+
+def _value_converter(type_name: str) -> Callable[[str], Any]:
+    """ Преобразование значений столбца для сравнения: целые и дробные сравниваются как числа. """
+    if type_name in (schema.TYPE_INT, schema.TYPE_FLOAT):
+        type_name = schema.TYPE_NUM
+    return schema.value_converter(type_name)
+
+
+def _compile_condition(idx: int, op: str, value: str, type_name: str) -> Predicate:
+    """ Проверка одного условия для значения с индексом idx.
+
+    Строки, где значения нет или оно не приводится к типу столбца, условию не удовлетворяют
+    (кроме условия '!=').
+    """
+    if op == PREFIX:
+        def test_prefix(row: Sequence[str]) -> bool:
+            try:
+                return row[idx].startswith(value)
+            except IndexError:
+                return False
+        return test_prefix
+
+    convert = _value_converter(type_name)
+    # Значение условия преобразуется один раз (ValueError - если не приводится к типу столбца).
+    target = convert(value)
+    compare = _comparisons[op]
+    is_negative: bool = op == '!='
+
+    def test(row: Sequence[str]) -> bool:
+        try:
+            return compare(convert(row[idx]), target)
+        except (ValueError, IndexError):
+            return is_negative
+
+    return test
+
+
+def compile_where(where: str, header: tuple, types: Optional[Dict[str, str]] = None) -> Predicate:
+    """ Функция проверки строки файла на соответствие условиям.
+
+    :param where: Условия, через condition_separator.
+    :param header: Заголовок файла (строки проверяются до выбора столбцов).
+    :param types: Типы столбцов файла {'имя столбца': 'тип'}. Для отсутствующих - строковый.
+    :raises ValueError: Условие не распознано, столбец не найден или значение не приводится к типу столбца.
+    """
+    tests: List[Predicate] = []
+    for condition in where.split(condition_separator):
+        name, op, value = parse_condition(condition)
+        tests.append(_compile_condition(header.index(name), op, value, (types or {}).get(name, schema.TYPE_STR)))
+
+    if len(tests) == 1:
+        return tests[0]
+    return lambda row: all(test(row) for test in tests)
+
+
+def where_columns(where: str, header: tuple) -> List[int]:
+    """ Индексы столбцов, участвующих в условиях. """
+    return [header.index(parse_condition(condition)[0]) for condition in where.split(condition_separator)]
@@ -1,22 +1,78 @@
 #!E:\miniconda3\envs\csv_test\python
 from urllib.parse import parse_qs
 import os
-from common import RequestStatus, TokenType
-import unittest
-from typing import Optional, Any, List, Dict, Tuple, Set
-import csv
+import sys
+from common import RequestStatus, TokenType, Answer, write_answer, HTTP_NOT_MODIFIED
+from typing import TYPE_CHECKING, Optional, Any, List, Dict, Tuple, Set, Iterator, Iterable, BinaryIO, Sequence
+import locale
+from itertools import chain, islice
 from operator import itemgetter
-import pickle
+import protocol
+import timing
 from db import UsersDBInterface, SQL, SESSION_WAITING_TIME
 import db_data
+# Остальные модули проекта (и csv, sqlite3, mmap, hashlib, pickle, которые они импортируют) импортируются
+# в функциях, которым они нужны: каждый CGI-запрос - новый процесс, и запрос списка файлов или ошибочный запрос
+# не должен загружать модули сортировки, кэшей и сжатия.
+if TYPE_CHECKING:
+    import filters
+    import sort_index
+    from schema_cache import SchemaCache
+    from result_cache import ResultCache
 
 
 # Представление файла .csv внутри скрипта: список кортежей, где каждый кортеж - одна строка файла.
 ContentView = List[tuple]
 # Относительный путь к директории с файлами.
 files_dir: str = "../files"
+# Относительный путь к директории служебных файлов сервера (кэши, индексы).
+cache_dir: str = "../cache"
+# Имя файла кэша сведений о файлах в cache_dir.
+schema_cache_name: str = "schema.sqlite"
+# Имя директории кэша готовых ответов в cache_dir.
+result_cache_name: str = "results"
+# Допустимый объём кэша готовых ответов, байт (0 - не кэшировать).
+result_cache_bytes: int = 1024 * 1024 * 1024
+# Имя директории кэша отсортированных результатов (для постраничной выдачи) в cache_dir.
+sorted_cache_name: str = "sorted"
+# Допустимый объём кэша отсортированных результатов, байт.
+sorted_cache_bytes: int = 1024 * 1024 * 1024
+# Чтение строк из поколоночной копии файла (см. columnar), если она построена для текущей версии файла.
+use_columnar: bool = True
+# Выбор столбцов из отображённого в память файла (mmap) вместо разбора всех значений строки модулем csv.
+use_mmap: bool = True
+# Кодировка csv-файлов (по умолчанию та же, что у open()).
+file_encoding: str = locale.getpreferredencoding(False)
+# Размер блока, которым с конца файла ищется последняя завершённая строка, байт.
+tail_block_size: int = 64 * 1024
 # Разделитель множественных значений в запросе
 in_value_separator: str = ','
+# Число строк в одной порции при потоковой отправке файла.
+chunk_rows: int = 1000
+# Объём памяти под сортируемые строки, байт. Сверх него строки выгружаются во временные файлы.
+sort_memory_budget: int = 64 * 1024 * 1024
+# Директория для временных файлов сортировки (None - системная).
+sort_tmp_dir: Optional[str] = None
+# Сортировка строк в компактном хранилище (см. compact) по номерам строк; False - строки сортируются списком
+# вместе с ключами (extsort). В sort_memory_budget во втором случае умещается в несколько раз меньше строк.
+use_compact_sort: bool = True
+# Число процессов, в которых большие файлы читаются при запросах с sort или where (см. parallel; 1 - в одном процессе).
+parallel_workers: int = os.cpu_count() or 1
+# Объём данных файла, начиная с которого файл читается в parallel_workers процессах, байт.
+parallel_min_bytes: int = 64 * 1024 * 1024
+# Ключи сортировки, для которых строятся индексы (см. sort_index): {'имя файла': ['price:num:desc,name', ...]}.
+# Индекс используется только для сортировки по тому же ключу.
+hot_sort_keys: Dict[str, List[str]] = {}
+# Число запросов с сортировкой файла по одному ключу, после которого по ключу строится индекс
+# (0 - индексы только для hot_sort_keys).
+hot_sort_threshold: int = 3
+
+# Кэш сведений о файлах процесса (см. schema_cache())
+_schema_cache: Optional['SchemaCache'] = None
+# Кэш готовых ответов процесса (см. result_cache())
+_result_cache: Optional['ResultCache'] = None
+# Кэш отсортированных результатов процесса (см. sorted_cache())
+_sorted_cache: Optional['ResultCache'] = None
 
 
 def check_query(query: dict) -> RequestStatus:
@@ -29,19 +85,39 @@ def check_query(query: dict) -> RequestStatus:
     if 'token' not in query.keys():
         status = RequestStatus.BAD_REQUEST
 
+    for name in ('from_byte', 'offset', 'limit'):
+        # Позиции и числа строк - неотрицательные целые.
+        if name in query.keys() and not query[name][0].isdigit():
+            status = RequestStatus.BAD_REQUEST
+
+    if 'agg' in query.keys():
+        # Сводные значения: строки не выдаются, столбцы определяются функциями.
+        if any(name in query.keys() for name in ('cols', 'sort', 'offset', 'limit', 'from_byte')):
+            status = RequestStatus.BAD_REQUEST
+
+    if 'from_byte' in query.keys():
+        # Дозагрузка строк, дописанных в файл: сортировка и выбор страницы не допускаются.
+        if 'sort' in query.keys() or 'offset' in query.keys() or 'limit' in query.keys():
+            status = RequestStatus.BAD_REQUEST
+
     return status
 
 
-def get_list(files_dir: str, with_info: bool = False) -> Dict[str, tuple]:
+def get_list(files_dir: str, with_info: bool = False, cache: Optional['SchemaCache'] = None) -> Dict[str, tuple]:
     """ Получить список файлов.
 
     :param files_dir: папка с файлами.
     :param with_info: получить список файлов с информацией о столбцах.
+    :param cache: кэш сведений о файлах. Заголовки читаются из него, файлы открываются только при их изменении.
     :return: Словарь вида {'имя файла': (кортеж имён столбцов)}
     """
+    import csv
     file_dict = {filename: tuple('') for filename in os.listdir(files_dir)}
 
     if with_info:
+        if cache is not None:
+            return {filename: info.header for filename, info in cache.refresh(files_dir).items()}
+
         result: dict = {}
         for filename in file_dict:
             with open(files_dir + '/' + filename) as csvfile:
@@ -54,102 +130,621 @@ def get_list(files_dir: str, with_info: bool = False) -> Dict[str, tuple]:
         return file_dict
 
 
-def get_file(filepath: str, cols: Optional[List[str]] = None) -> \
-        Tuple[RequestStatus, Optional[tuple], Optional[ContentView]]:
-    """ Чтение файла.
+def data_end(csvfile: BinaryIO, size: int) -> int:
+    """ Позиция конца последней завершённой строки файла (дописываемая в этот момент строка не учитывается).
+
+    Так определяется конец данных при дозагрузке (см. read_end).
+
+    :param csvfile: файл, открытый в двоичном режиме
+    :param size: размер файла
+    """
+    end = size
+    while end > 0:
+        block_start = max(0, end - tail_block_size)
+        csvfile.seek(block_start)
+        block = csvfile.read(end - block_start)
+        newline = block.rfind(b'\n')
+        if newline >= 0:
+            return block_start + newline + 1
+        end = block_start
+    return 0
+
+
+def read_end(filepath: str, size: int, start: int = 0) -> int:
+    """ Конец читаемых данных файла.
+
+    Полное чтение - до конца файла: последняя строка без перевода строки тоже читается. Дозагрузка (start > 0) -
+    до конца последней завершённой строки: дописываемая в этот момент строка будет прочитана следующей дозагрузкой.
+    Если после start завершённых строк нет, конец данных - start (новых строк нет).
+
+    :param filepath: имя файла с путём
+    :param size: размер файла
+    :param start: позиция, с которой читаются строки (см. iter_file)
+    """
+    if not start:
+        return size
+    with open(filepath, 'rb') as csvfile:
+        return max(data_end(csvfile, size), min(start, size))
+
+
+def iter_lines(csvfile: BinaryIO, end: int) -> Iterator[str]:
+    """ Строки файла от текущей позиции до позиции end. """
+    position = csvfile.tell()
+    for line in csvfile:
+        position += len(line)
+        if position > end:
+            # Строка, продолженная после определения end: читается её часть до end, как и без дописывания.
+            if position - len(line) < end:
+                yield line[:len(line) - (position - end)].decode(file_encoding)
+            return
+        yield line.decode(file_encoding)
+
+
+def iter_file(filepath: str, cols: Optional[List[str]] = None, start: int = 0, end: Optional[int] = None,
+              where: Optional[str] = None, types: Optional[Dict[str, str]] = None,
+              order: Optional[Iterable[int]] = None) -> \
+        Tuple[RequestStatus, Optional[tuple], Optional[Iterator[tuple]]]:
+    """ Потоковое чтение файла: строки читаются с диска по мере обращения к итератору.
+
+    Читаются данные до end, поэтому строки, дописываемые в файл во время чтения, попадут в ответ на следующий
+    запрос с from_byte.
 
     :param filepath: имя файла с путём
     :param cols: список желаемых колонок
-    :return: Статус запроса, Кортеж заголовков столбцов, Список кортежей (каждый кортеж - одна строка файла)
+    :param start: позиция в файле, с которой читаются строки (0 - с начала; заголовок читается всегда).
+        Должна быть началом строки, например концом ранее прочитанных данных (см. read_end).
+    :param end: конец читаемых данных (None - конец файла)
+    :param where: условия отбора строк (см. filters), проверяются до выбора столбцов
+    :param types: типы столбцов файла {'имя столбца': 'тип'} для сравнения значений в условиях
+    :param order: позиции строк в порядке выдачи (см. sort_index), None - строки в порядке файла
+    :return: Статус запроса, Кортеж заголовков столбцов, Итератор по кортежам строк (только затребованные столбцы)
     """
+    import csv
+    import projection
     # Если файл не найден, то возвращается: (RequestStatus.NON_FOUND, None, None)
-
-    # Индекс желаемых столбцов в файле csv
-    index: Set[int] = set()
-
-    # Заголовок исходного csv-файла
-    header: tuple = tuple()
-    # Заголовок прочитан из файла
-    is_header_ready: bool = False
-    # Содержимое файла (только затребованные столбцы)
-    content: List[tuple] = []
     try:
-        # Цикл чтения файла
-        with open(filepath) as csvfile:
-            csvreader = csv.reader(csvfile)
-            for row in csvreader:
-                if not is_header_ready:
-                    header = tuple(row)
-
-                    if cols:
-                        # Если нужны не все столбцы
-                        for colname in cols:
-                            # Заполнение списка индексов желаемых столбцов
-                            try:
-                                index.add(header.index(colname))
-                            except ValueError:
-                                # Если колонка с таким именем в файле отсутствует
-                                return RequestStatus.BAD_REQUEST, None, None
-
-                    is_header_ready = True
-                    continue
-
-                if cols:
-                    # Добавление запрошенных столбцов
-                    filtered: tuple = tuple(value for idx, value in enumerate(row) if idx in index)
-                    content.append(filtered)
-                else:
-                    # Добавление всех столбцов
-                    content.append(tuple(row))
+        csvfile = open(filepath, 'rb')
     except FileNotFoundError:
         # Файл не найден
         return RequestStatus.NON_FOUND, None, None
 
-    # Создание заголовка csv-файла
-    header = header if not cols else tuple(value for idx, value in enumerate(header) if idx in index)
+    if end is None:
+        end = os.fstat(csvfile.fileno()).st_size
+    is_valid_start: bool = start == 0
+    if 0 < start <= end:
+        # Позиция должна быть началом строки. Если прошлое чтение закончилось последней строкой файла без
+        # перевода строки, он может быть дописан после неё: чтение начинается за ним.
+        csvfile.seek(start - 1)
+        is_valid_start = csvfile.read(1) == b'\n' or start == end
+        if not is_valid_start and csvfile.read(1) == b'\n':
+            start += 1
+            is_valid_start = start <= end
+    if not is_valid_start:
+        # Позиция за концом данных или не в начале строки: файл был изменён не дописыванием.
+        csvfile.close()
+        return RequestStatus.BAD_REQUEST, None, None
+
+    csvfile.seek(0)
+    csvreader = csv.reader(iter_lines(csvfile, end))
+    # Заголовок исходного csv-файла
+    header: tuple = tuple(next(csvreader, ()))
+    # Позиция первой читаемой строки
+    data_start: int = max(start, csvfile.tell())
+    if start > csvfile.tell():
+        # Строки, дописанные после позиции start.
+        csvfile.seek(start)
+        csvreader = csv.reader(iter_lines(csvfile, end))
+
+    # Индекс желаемых столбцов в файле csv
+    index: Set[int] = set()
+    if cols:
+        # Если нужны не все столбцы
+        for colname in cols:
+            # Заполнение списка индексов желаемых столбцов
+            try:
+                index.add(header.index(colname))
+            except ValueError:
+                # Если колонка с таким именем в файле отсутствует
+                csvfile.close()
+                return RequestStatus.BAD_REQUEST, None, None
+
+    # Условие отбора строк, компилируется один раз на запрос.
+    predicate: Optional[filters.Predicate] = None
+    predicate_columns: List[int] = []
+    if where:
+        import filters
+        try:
+            predicate = filters.compile_where(where, header, types)
+            predicate_columns = filters.where_columns(where, header)
+        except ValueError:
+            # Условие не распознано, столбца нет в файле или значение не приводится к типу столбца
+            csvfile.close()
+            return RequestStatus.BAD_REQUEST, None, None
+        if not cols:
+            # Строки отбираются как есть, без выбора столбцов.
+            csvreader = filter(predicate, csvreader)
+
+    # Индексы желаемых столбцов в порядке файла
+    positions: List[int] = sorted(index)
+    if cols:
+        # Создание заголовка csv-файла
+        header = tuple(header[idx] for idx in positions)
+
+    def rows() -> Iterator[tuple]:
+        # Файл закрывается по окончании чтения (или при уничтожении итератора).
+        with csvfile:
+            if order is not None:
+                # Строки читаются по позициям, в порядке индекса.
+                records = projection.iter_mmap_records(csvfile, order, end, file_encoding)
+                project = projection.make_projection(positions) if cols else tuple
+                for row in records if predicate is None else filter(predicate, records):
+                    try:
+                        yield project(row)
+                    except IndexError:
+                        yield projection.project_short(row, positions)
+            elif not cols:
+                # Добавление всех столбцов
+                for row in csvreader:
+                    yield tuple(row)
+            elif use_mmap:
+                # Добавление запрошенных столбцов: значения выделяются прямо из байтов файла.
+                yield from projection.iter_mmap_rows(csvfile, data_start, end, positions, file_encoding, predicate,
+                                                     predicate_columns)
+            else:
+                # Добавление запрошенных столбцов
+                project = projection.make_projection(positions)
+                for row in csvreader if predicate is None else filter(predicate, csvreader):
+                    try:
+                        yield project(row)
+                    except IndexError:
+                        # В строке меньше значений, чем в заголовке.
+                        yield projection.project_short(row, positions)
+
+    return RequestStatus.OK, header, rows()
+
 
-    return RequestStatus.OK, header, content
+def get_file(filepath: str, cols: Optional[List[str]] = None, compact_rows: bool = False) -> \
+        Tuple[RequestStatus, Optional[tuple], Optional[Sequence[tuple]]]:
+    """ Чтение файла.
+
+    :param filepath: имя файла с путём
+    :param cols: список желаемых колонок
+    :param compact_rows: строки в компактном хранилище (compact.CompactTable) вместо списка кортежей: в памяти
+        в несколько раз меньше, а читаются так же - по номеру строки и итерацией
+    :return: Статус запроса, Кортеж заголовков столбцов, Список кортежей (каждый кортеж - одна строка файла)
+    """
+    # Если файл не найден, то возвращается: (RequestStatus.NON_FOUND, None, None)
+    status, header, rows = iter_file(filepath, cols)
+    if status != RequestStatus.OK:
+        return status, None, None
 
+    if compact_rows:
+        import compact
+        table, rest = compact.load(header, rows, sys.maxsize)
+        # Строки, в которых значений не столько, сколько столбцов, в таблицу не загружаются.
+        return RequestStatus.OK, header, table if rest is None else list(chain(table, rest))
+    return RequestStatus.OK, header, list(rows)
 
-def sort(header: Tuple[str], content: ContentView, cols: List[str]) -> Tuple[RequestStatus, ContentView]:
+
+def sort(header: Tuple[str], content: Iterable[tuple], cols: List[str], types: Optional[Dict[str, str]] = None) -> \
+        Tuple[RequestStatus, Iterable[tuple]]:
     """ Сортировка.
 
+    Каждый столбец сортируется с учётом своего типа: явно указанного в запросе ('price:num:desc')
+    или определённого по файлу (types). Сортировка внешняя: в памяти держится не более sort_memory_budget байт
+    строк, остальное выгружается во временные файлы в sort_tmp_dir. Строки в памяти хранятся по столбцам
+    и сортируются по номерам строк (см. compact, use_compact_sort), иначе - списком вместе с ключами, вычисленными
+    один раз на строку.
+
     :param header: Кортеж из названий столбцов файла.
     :param content: Неотсортированное содержимое файла.
-    :param cols: Список колонок, по которым необходима сортировка.
-    :return: Статус запроса, отсортированное содержимое файла.
+    :param cols: Список колонок, по которым необходима сортировка, вида 'имя[:тип][:asc|desc]'.
+    :param types: Типы столбцов файла {'имя столбца': 'тип'}. Для отсутствующих - строковый.
+    :return: Статус запроса, отсортированное содержимое файла (итератор).
     """
+    import schema
     # Список индексов колонок
     index: List[int] = []
+    # Типы колонок
+    col_types: List[str] = []
+    # Признаки сортировки по убыванию
+    descending: List[bool] = []
 
-    for colname in cols:
+    for spec in cols:
         # Заполнение списка индексов желаемых столбцов
         try:
+            colname, type_name, is_desc = schema.parse_sort_spec(spec)
             index.append(header.index(colname))
         except ValueError:
-            # Если колонка с таким именем в файле отсутствует
+            # Если колонка с таким именем в файле отсутствует или описание сортировки не распознано
             return RequestStatus.BAD_REQUEST, [()]
+        col_types.append(type_name or (types or {}).get(colname, schema.TYPE_STR))
+        descending.append(is_desc)
+
+    if use_compact_sort:
+        import compact
+        return RequestStatus.OK, compact.sort_rows(header, content, index, col_types, descending, sort_memory_budget,
+                                                   sort_tmp_dir)
+
+    # Сортировка по запрошенным полям: строки сортируются вместе с заранее вычисленными ключами.
+    from extsort import external_sort, pair_size
+    key = schema.make_sort_key(index, col_types, descending)
+    decorated = external_sort(schema.decorate(content, key), itemgetter(0), sort_memory_budget, sort_tmp_dir,
+                              size=pair_size)
+
+    return RequestStatus.OK, map(itemgetter(1), decorated)
+
+
+def select_rows(filepath: str, cols: Optional[str], sort_spec: Optional[str], start: int = 0,
+                end: Optional[int] = None, where: Optional[str] = None, timings: timing.Timings = timing.NULL) -> \
+        Tuple[RequestStatus, Optional[tuple], Optional[Iterable[tuple]]]:
+    """ Строки файла, отобранные по условиям, с выбранными столбцами, при необходимости отсортированные.
+
+    Строки отбираются по мере чтения файла, до выбора столбцов и сортировки.
+
+    :param filepath: имя файла с путём
+    :param cols: значение параметра cols запроса (None - все столбцы)
+    :param sort_spec: значение параметра sort запроса (None - без сортировки)
+    :param start: позиция в файле, с которой читаются строки (см. iter_file)
+    :param end: конец читаемых данных (см. iter_file)
+    :param where: значение параметра where запроса (None - все строки)
+    :param timings: замеры запроса: этапы 'schema' (типы столбцов), 'parse' (чтение csv-файла), 'sort'
+    :return: Статус запроса, Кортеж заголовков столбцов, Итератор по кортежам строк
+    """
+    if use_columnar and start == 0 and not where:
+        status, header, content = select_columnar(filepath, cols, sort_spec)
+        if status is not None:
+            return status, header, content
+
+    with timings.span('schema'):
+        types = schema_cache().get(filepath).column_types() if where or sort_spec else None
+    if sort_spec and start == 0 and end is not None:
+        status, header, content = select_indexed(filepath, cols, sort_spec, end, where, types)
+        if status is not None:
+            return status, header, content
+
+    if start == 0 and parallel_workers > 1 and (sort_spec or where):
+        # Без сортировки и отбора строк чтение прогонов процессов обходится почти как разбор файла.
+        status, header, content = select_parallel(filepath, cols, sort_spec, end, where, types)
+        if status is not None:
+            return status, header, content
+
+    status, header, content = iter_file(filepath, cols.split(sep=in_value_separator) if cols else None, start, end,
+                                        where, types)
+    if status != RequestStatus.OK:
+        return status, header, content
+    content = timings.iterate('parse', content, batch=chunk_rows)
+    if not sort_spec:
+        return status, header, content
+
+    # Сортировка файла по указанным в списке столбцам
+    status, content = sort(header, content, sort_spec.split(sep=in_value_separator), types)
+    return status, header, timings.iterate('sort', content, batch=chunk_rows) if status == RequestStatus.OK else content
+
+
+def select_columnar(filepath: str, cols: Optional[str], sort_spec: Optional[str]) -> \
+        Tuple[Optional[RequestStatus], Optional[tuple], Optional[Iterable[tuple]]]:
+    """ Строки файла из поколоночной копии: читаются только файлы выбранных столбцов, сортировка - по номерам строк.
+
+    :param filepath: имя файла с путём
+    :param cols: значение параметра cols запроса (None - все столбцы)
+    :param sort_spec: значение параметра sort запроса (None - без сортировки)
+    :return: Статус запроса, Кортеж заголовков столбцов, Итератор по кортежам строк.
+        Статус None - копии нет или столбцы не умещаются в sort_memory_budget (строки читаются из csv-файла).
+    """
+    import columnar
+    import schema
+    table = columnar.open_table(os.path.join(cache_dir, columnar.columnar_dir_name), filepath)
+    if table is None:
+        return None, None, None
+
+    try:
+        # Индексы желаемых столбцов в порядке файла
+        positions: List[int] = sorted({table.header.index(colname) for colname in cols.split(sep=in_value_separator)}) \
+            if cols else list(range(len(table.header)))
+    except ValueError:
+        # Если колонка с таким именем в файле отсутствует
+        return RequestStatus.BAD_REQUEST, None, None
+    header: tuple = tuple(table.header[idx] for idx in positions)
+    try:
+        specs = [schema.parse_sort_spec(spec) for spec in sort_spec.split(sep=in_value_separator)] \
+            if sort_spec else []
+        # Индексы столбцов сортировки среди выбранных
+        sort_index: List[int] = [header.index(colname) for colname, _, _ in specs]
+    except ValueError:
+        # Как в sort: столбца нет среди выбранных или описание сортировки не распознано
+        return RequestStatus.BAD_REQUEST, header, [()]
+    if table.memory_estimate(positions) > sort_memory_budget:
+        return None, None, None
+
+    columns: List[list] = [table.column(idx) for idx in positions]
+    if not specs:
+        return RequestStatus.OK, header, zip(*columns)
+
+    order = table.sort_order(
+        {positions[idx]: columns[idx] for idx in sort_index},
+        [(positions[idx], type_name or table.types.get(colname, schema.TYPE_STR), is_desc)
+         for idx, (colname, type_name, is_desc) in zip(sort_index, specs)])
+    if order is None:
+        # Без numpy строки сортируются как при чтении csv-файла.
+        status, content = sort(header, zip(*columns), sort_spec.split(sep=in_value_separator), table.types)
+        return status, header, content
+    order = order.tolist()
+    return RequestStatus.OK, header, zip(*(columnar.reorder(values, order) for values in columns))
+
+
+def parse_sort_key(sort_spec: str, types: Dict[str, str]) -> 'sort_index.SortSpec':
+    """ Ключ сортировки с типами всех столбцов (явно указанными или определёнными по файлу).
+
+    :raises ValueError: Описание сортировки не распознано.
+    """
+    import schema
+    return [(colname, type_name or types.get(colname, schema.TYPE_STR), is_desc)
+            for colname, type_name, is_desc in map(schema.parse_sort_spec, sort_spec.split(sep=in_value_separator))]
 
-    # Сортировка по запрошенным полям.
-    content = sorted(content, key= itemgetter(*index))
 
-    return RequestStatus.OK, content
+def select_indexed(filepath: str, cols: Optional[str], sort_spec: str, end: int, where: Optional[str],
+                   types: Dict[str, str]) -> Tuple[Optional[RequestStatus], Optional[tuple], Optional[Iterable[tuple]]]:
+    """ Отсортированные строки файла, читаемые по индексу сортировки (см. sort_index), без сортировки.
 
+    Индекс строится для ключей из hot_sort_keys и для ключей, по которым файл сортировали не менее
+    hot_sort_threshold раз, и используется, пока файл не изменится.
 
-def send_answer(status: RequestStatus, data: Any) -> None:
-    """ Отправка ответа на запрос в виде потока байт.
+    :param filepath: имя файла с путём
+    :param cols: значение параметра cols запроса (None - все столбцы)
+    :param sort_spec: значение параметра sort запроса
+    :param end: конец читаемых данных (см. read_end)
+    :param where: значение параметра where запроса (None - все строки)
+    :param types: типы столбцов файла
+    :return: Статус запроса, Кортеж заголовков столбцов, Итератор по кортежам строк.
+        Статус None - индекса нет и ключ не часто используемый (строки сортируются как обычно).
+    """
+    import sort_index
+    try:
+        spec = parse_sort_key(sort_spec, types)
+        declared = [parse_sort_key(hot, types) for hot in hot_sort_keys.get(os.path.basename(filepath), [])]
+    except ValueError:
+        return None, None, None
+    colnames = cols.split(sep=in_value_separator) if cols else None
+    if any(colname not in (colnames or types) for colname, _, _ in spec):
+        # Столбца сортировки нет в файле или он не выбран: ошибку возвращает sort.
+        return None, None, None
+
+    stat = os.stat(filepath)
+    directory = os.path.join(cache_dir, sort_index.index_dir_name)
+    path = sort_index.find_index(directory, filepath, stat, spec)
+    if path is None:
+        # Объявленный или часто используемый ключ.
+        if spec not in declared and not (hot_sort_threshold and schema_cache().count_sort(
+                filepath, sort_index.spec_text(spec)) >= hot_sort_threshold):
+            return None, None, None
+        path = sort_index.build_index(directory, filepath, stat, end, spec, file_encoding, sort_memory_budget,
+                                      sort_tmp_dir)
+        if path is None:
+            return None, None, None
+
+    order = sort_index.iter_positions(path, end)
+    if order is None:
+        return None, None, None
+    return iter_file(filepath, colnames, 0, end, where, types, order)
+
+
+def select_parallel(filepath: str, cols: Optional[str], sort_spec: Optional[str], end: Optional[int],
+                    where: Optional[str], types: Optional[Dict[str, str]]) -> \
+        Tuple[Optional[RequestStatus], Optional[tuple], Optional[Iterable[tuple]]]:
+    """ Строки большого файла, прочитанные и отсортированные в parallel_workers процессах (см. parallel).
+
+    :param filepath: имя файла с путём
+    :param cols: значение параметра cols запроса (None - все столбцы)
+    :param sort_spec: значение параметра sort запроса (None - без сортировки)
+    :param end: конец читаемых данных (None - конец файла)
+    :param where: значение параметра where запроса (None - все строки)
+    :param types: типы столбцов файла (для where и sort)
+    :return: Статус запроса, Кортеж заголовков столбцов, Итератор по кортежам строк.
+        Статус None - файл меньше parallel_min_bytes, в данных есть кавычки или в запросе ошибка
+        (строки читаются в одном процессе, ошибку возвращают iter_file и sort).
+    """
+    import csv
+    import filters
+    import parallel
+    try:
+        csvfile = open(filepath, 'rb')
+    except FileNotFoundError:
+        return None, None, None
+    with csvfile:
+        if end is None:
+            end = os.fstat(csvfile.fileno()).st_size
+        if end < parallel_min_bytes:
+            return None, None, None
+        csvfile.seek(0)
+        header: tuple = tuple(next(csv.reader(iter_lines(csvfile, end)), ()))
+        data_start: int = csvfile.tell()
+    if data_start >= end:
+        return None, None, None
+
+    try:
+        positions: Optional[List[int]] = sorted({header.index(colname) for colname in
+                                                 cols.split(sep=in_value_separator)}) if cols else None
+        if where:
+            filters.compile_where(where, header, types)
+        selected: tuple = tuple(header[idx] for idx in positions) if positions is not None else header
+        sort_key: Optional[Tuple[List[int], List[str], List[bool]]] = None
+        if sort_spec:
+            spec = parse_sort_key(sort_spec, types or {})
+            sort_key = ([selected.index(colname) for colname, _, _ in spec], [type_name for _, type_name, _ in spec],
+                        [is_desc for _, _, is_desc in spec])
+    except ValueError:
+        return None, None, None
+
+    rows = parallel.iter_rows(filepath, data_start, end, header, positions, where, types, sort_key, file_encoding,
+                              parallel_workers, sort_tmp_dir)
+    if rows is None:
+        return None, None, None
+    return RequestStatus.OK, selected, rows
+
+
+def select_aggregate(filepath: str, agg: str, end: int, where: Optional[str] = None) -> \
+        Tuple[RequestStatus, Optional[Dict[str, Any]]]:
+    """ Сводные значения по столбцам файла (см. aggregate), вычисленные за один проход по строкам.
+
+    :param filepath: имя файла с путём
+    :param agg: значение параметра agg запроса
+    :param end: конец читаемых данных (см. read_end)
+    :param where: значение параметра where запроса (None - все строки)
+    :return: Статус запроса, Словарь {'функция[:столбец]': значение}
+    """
+    import aggregate
+    try:
+        specs = aggregate.parse_agg(agg)
+    except ValueError:
+        # Функция не распознана
+        return RequestStatus.BAD_REQUEST, None
+    colnames = aggregate.agg_columns(specs)
+
+    status, header, content = select_rows(filepath, in_value_separator.join(colnames) if colnames else None, None, 0,
+                                          end, where)
+    if status != RequestStatus.OK:
+        return status, None
+    aggregator = aggregate.Aggregator(specs, header, schema_cache().get(filepath).column_types())
+    for chunk in iter_chunks(content, chunk_rows):
+        aggregator.update(chunk)
+    return RequestStatus.OK, aggregator.result()
+
+
+def select_page(filepath: str, cols: Optional[str], sort_spec: Optional[str], offset: int, limit: Optional[int],
+                end: int, stat: os.stat_result, where: Optional[str] = None, timings: timing.Timings = timing.NULL) -> \
+        Tuple[RequestStatus, Optional[tuple], Optional[Iterable[tuple]]]:
+    """ Диапазон строк результата запроса (страница).
+
+    Без сортировки и условий отбора чтение начинается с ближайшей строки из индекса строк файла
+    (см. SchemaCache.row_index).
+    Отсортированный результат один раз сохраняется в кэше сортировок и дальше страницы читаются из него.
+
+    :param filepath: имя файла с путём
+    :param cols: значение параметра cols запроса (None - все столбцы)
+    :param sort_spec: значение параметра sort запроса (None - без сортировки)
+    :param offset: номер первой строки страницы (с нуля, без заголовка)
+    :param limit: число строк страницы (None - до конца)
+    :param end: конец читаемых данных (см. read_end)
+    :param stat: сведения о файле, по которым определён end
+    :param where: значение параметра where запроса (None - все строки)
+    :param timings: замеры запроса (см. select_rows)
+    :return: Статус запроса, Кортеж заголовков столбцов, Итератор по кортежам строк
+    """
+    import pages
+    if not sort_spec:
+        # Номера строк в индексе - номера до отбора, поэтому с условиями строки пропускаются от начала.
+        start, skip = schema_cache().row_index(filepath).locate(offset) if not where else (0, offset)
+        status, header, content = select_rows(filepath, cols, None, start, end, where, timings)
+        if status != RequestStatus.OK:
+            return status, header, content
+        return status, header, islice(content, skip, None if limit is None else skip + limit)
+
+    key = result_key(filepath, cols, sort_spec, where, stat=stat)
+    stored = sorted_cache().get(key)
+    if stored is None:
+        status, header, content = select_rows(filepath, cols, sort_spec, 0, end, where, timings)
+        if status != RequestStatus.OK:
+            return status, header, content
+        for _ in sorted_cache().store(key, pages.encode_pages(header, content)):
+            pass
+        stored = sorted_cache().get(key)
+        if stored is None:
+            # Результат не уместился в кэше сортировок: страница выбирается из него без сохранения.
+            status, header, content = select_rows(filepath, cols, sort_spec, 0, end, where, timings)
+            return status, header, islice(content, offset, None if limit is None else offset + limit)
+
+    reader = pages.PageReader(stored.file)
+    return RequestStatus.OK, reader.header, reader.rows(offset, limit)
+
+
+def response_content_type(version: int) -> str:
+    """ Значение заголовка Content-Type ответа для данной версии протокола. """
+    return protocol.CONTENT_TYPE if version == protocol.PROTOCOL_VERSION else protocol.MEDIA_TYPE
+
+
+def iter_chunks(rows: Iterable[tuple], size: int) -> Iterator[List[tuple]]:
+    """ Деление строк на порции не более чем по size строк. """
+    chunk: List[tuple] = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def encode_answer(status: RequestStatus, data: Any, version: int = protocol.LEGACY_VERSION) -> bytes:
+    """ Сериализация ответа на запрос.
 
     :param status: Статус запроса.
     :param data: Данные, которые будут отправлены.
+    :param version: Версия протокола ответа.
     """
+    if version == protocol.PROTOCOL_VERSION:
+        return protocol.encode_preamble() + protocol.encode_status(status.value) + \
+            (protocol.encode_data(data) if data is not None else b'') + protocol.encode_end()
+
+    # pickle нужен только прежнему формату и импортируется при первом таком ответе.
+    import pickle
     # Данные будут отправлены в виде словаря.
     answer: dict = {'status': status, 'content': data}
     # Сериализация
-    serialized = pickle.dumps(answer)
-    # Отправка.
-    print("Content-Type: application/octet-stream")
-    print("")
-    print(serialized)
+    return (repr(pickle.dumps(answer)) + '\n').encode()
+
+
+def encode_answer_stream(status: RequestStatus, header: Optional[tuple], rows: Iterable[tuple],
+                         version: int = protocol.LEGACY_VERSION) -> Iterator[bytes]:
+    """ Потоковая сериализация ответа порциями по chunk_rows строк.
+
+    В прежнем формате каждая порция - отдельная строка вида repr(pickle.dumps(...)), т. е. в формате encode_answer:
+    первая содержит статус и заголовок, последующие - списки строк файла.
+    В двоичном протоколе порция - кадр FRAME_ROWS.
+
+    :param status: Статус запроса.
+    :param header: Кортеж заголовков столбцов.
+    :param rows: Строки файла.
+    :param version: Версия протокола ответа.
+    """
+    if version == protocol.PROTOCOL_VERSION:
+        yield protocol.encode_preamble() + protocol.encode_status(status.value)
+        if status == RequestStatus.OK:
+            yield protocol.encode_header(header)
+            for chunk in iter_chunks(rows, chunk_rows):
+                yield protocol.encode_rows(chunk)
+        yield protocol.encode_end()
+        return
+
+    yield encode_answer(status, header)
+    if status != RequestStatus.OK:
+        return
+
+    for chunk in iter_chunks(rows, chunk_rows):
+        yield encode_answer(status, chunk)
+
+
+def answer(status: RequestStatus, data: Any, version: int = protocol.LEGACY_VERSION) -> Answer:
+    """ Ответ на запрос целиком.
+
+    :param status: Статус запроса.
+    :param data: Данные, которые будут отправлены.
+    :param version: Версия протокола ответа.
+    """
+    return Answer([('Content-Type', response_content_type(version))], [encode_answer(status, data, version)])
+
+
+def answer_stream(status: RequestStatus, header: Optional[tuple], rows: Iterable[tuple],
+                  version: int = protocol.LEGACY_VERSION) -> Answer:
+    """ Потоковый ответ на запрос порциями по chunk_rows строк.
+
+    :param status: Статус запроса.
+    :param header: Кортеж заголовков столбцов.
+    :param rows: Строки файла.
+    :param version: Версия протокола ответа.
+    """
+    return Answer([('Content-Type', response_content_type(version))],
+                  encode_answer_stream(status, header, rows, version))
 
 
 def is_session_active(db: UsersDBInterface, token: TokenType) -> bool:
@@ -158,77 +753,255 @@ def is_session_active(db: UsersDBInterface, token: TokenType) -> bool:
     :param db: Интерфейс доступа к базе данных с пользователями.
     :param token: Токен сеанса для данного пользователя.
     """
-    if db.check_token(token) == RequestStatus.OK:
-        # Если токен существует в базе данных и он актуален.
-        db.renew_timestamp(token)
-        # Освежаем время последнего обращения.
-        return True
-    else:
-        # Токен устарел или его просто нет в базе данных. Нужна повторная авторизация.
+    # Если токен существует в базе данных и он актуален, время последнего обращения освежается
+    # той же операцией (один запрос к БД).
+    # Иначе токен устарел или его просто нет в базе данных. Нужна повторная авторизация.
+    return db.touch_if_active(token) == RequestStatus.OK
+
+
+def make_db() -> UsersDBInterface:
+    """ Интерфейс доступа к базе данных пользователей с параметрами из db_data. """
+    return SQL(SESSION_WAITING_TIME, db_data.USER_NAME, db_data.USER_PASSWORD, db_data.DB_NAME,
+               db_data.TABLE_NAME, db_data.DB_IP)
+
+
+def schema_cache() -> 'SchemaCache':
+    """ Кэш сведений о файлах (заголовки, типы столбцов, число строк), общий для всех запросов процесса. """
+    from schema_cache import SchemaCache
+    global _schema_cache
+    if _schema_cache is None:
+        _schema_cache = SchemaCache(cache_dir + '/' + schema_cache_name, file_encoding)
+    return _schema_cache
+
+
+def result_cache() -> 'ResultCache':
+    """ Кэш готовых ответов на запросы файлов, общий для всех запросов процесса. """
+    from result_cache import ResultCache
+    global _result_cache
+    if _result_cache is None:
+        _result_cache = ResultCache(cache_dir + '/' + result_cache_name, result_cache_bytes)
+    return _result_cache
+
+
+def result_key(filepath: str, *params: object, stat: os.stat_result) -> str:
+    """ Ключ результата запроса для ETag и кэшей (см. ResultCache.make_key). В ключ входит версия правил
+    определения типов столбцов: от типов зависят порядок сортировки и сводные значения. """
+    import schema
+    from result_cache import ResultCache
+    return ResultCache.make_key(filepath, schema.INFERENCE_VERSION, *params, stat=stat)
+
+
+def encoding_headers(encoding: Optional[str]) -> List[Tuple[str, str]]:
+    """ Заголовки сжатого ответа. """
+    return [('Content-Encoding', encoding)] if encoding else []
+
+
+def compress_answer(response: Answer, encoding: Optional[str]) -> Answer:
+    """ Ответ, сжимаемый по мере формирования его частей (см. content_encoding).
+
+    :param response: Ответ.
+    :param encoding: Сжатие (см. content_encoding.negotiate), None - без сжатия.
+    """
+    import content_encoding
+    if not encoding:
+        return response
+    return Answer(response.headers + encoding_headers(encoding),
+                  content_encoding.compress_stream(response.body, encoding), response.status)
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """ Совпадает ли ETag с одним из значений заголовка If-None-Match. """
+    if not if_none_match:
         return False
+    return any(value.strip() in (etag, '*') for value in if_none_match.split(','))
 
 
-if __name__ == "__main__":
-    # unittest.main()
+def sorted_cache() -> 'ResultCache':
+    """ Кэш отсортированных результатов для постраничной выдачи, общий для всех запросов процесса. """
+    from result_cache import ResultCache
+    global _sorted_cache
+    if _sorted_cache is None:
+        _sorted_cache = ResultCache(cache_dir + '/' + sorted_cache_name, sorted_cache_bytes)
+    return _sorted_cache
 
-    # Выделение запроса
-    request = parse_qs(os.environ['QUERY_STRING'], keep_blank_values=True)
-    # request = {'file':['bar.csv'], 'cols': ['foo,bar'], 'sort':['foo,bar']}
-    # request = {'list':'', 'info': ''}
-    # request = {'list':'', 'token': '12345'}
+
+def answer_aggregate(filepath: str, agg: str, where: Optional[str], end: int, stat: os.stat_result, version: int,
+                     if_none_match: Optional[str] = None, encoding: Optional[str] = None) -> Answer:
+    """ Ответ на запрос сводных значений. Ответ кэшируется для версии файла, как и строки файла.
+
+    :param filepath: имя файла с путём
+    :param agg: значение параметра agg запроса
+    :param where: значение параметра where запроса (None - все строки)
+    :param end: конец читаемых данных (см. read_end)
+    :param stat: сведения о файле, по которым определён end
+    :param version: Версия протокола ответа.
+    :param if_none_match: Заголовок If-None-Match запроса.
+    :param encoding: Сжатие ответа (см. content_encoding.negotiate), None - без сжатия.
+    """
+    etag = '"{}"'.format(result_key(filepath, 'agg', agg, where, encoding, stat=stat))
+    validators = [('ETag', etag), ('X-End-Offset', str(end)), ('Vary', 'Accept-Encoding')]
+    if etag_matches(if_none_match, etag):
+        return Answer(validators, [], HTTP_NOT_MODIFIED)
+
+    key = result_key(filepath, 'agg', agg, where, version, encoding, stat=stat)
+    cached = result_cache().get(key)
+    if cached is not None:
+        return Answer([('Content-Type', response_content_type(version))] + encoding_headers(encoding) + validators,
+                      cached)
+
+    status, result = select_aggregate(filepath, agg, end, where)
+    response = answer(status, result, version)
+    if status != RequestStatus.OK:
+        return response
+    response = compress_answer(response, encoding)
+    return Answer(response.headers + validators, result_cache().store(key, response.body))
+
+
+def handle(request: Dict[str, List[str]], db: UsersDBInterface, content_type: Optional[str] = None,
+           if_none_match: Optional[str] = None, accept_encoding: Optional[str] = None) -> Answer:
+    """ Обработка запроса к get_cgi.py. Используется и CGI-скриптом, и постоянно работающим сервером (app.py).
+
+    Если замеры включены (timing.enabled), время этапов обработки записывается в журнал и в заголовок Server-Timing.
+
+    :param request: Запрос, разобранный parse_qs.
+    :param db: Интерфейс доступа к базе данных с пользователями.
+    :param content_type: Заголовок Content-Type запроса (определяет версию протокола ответа).
+    :param if_none_match: Заголовок If-None-Match запроса: если результат не изменился, ответ - 304 без тела.
+    :param accept_encoding: Заголовок Accept-Encoding запроса: строки файла передаются сжатыми, если клиент это
+        допускает (см. content_encoding).
+    :return: Ответ.
+    """
+    timings = timing.start()
+    response = respond(request, db, timings, content_type, if_none_match, accept_encoding)
+    # Токен в журнал не попадает.
+    return timing.finish(timings, response, dict({name: values[0] for name, values in request.items()
+                                                  if name != 'token'}, handler='get_cgi'))
+
+
+def respond(request: Dict[str, List[str]], db: UsersDBInterface, timings: timing.Timings,
+            content_type: Optional[str] = None, if_none_match: Optional[str] = None,
+            accept_encoding: Optional[str] = None) -> Answer:
+    """ Ответ на запрос к get_cgi.py (см. handle).
+
+    :param timings: Замеры запроса. Этапы: 'db' (проверка токена), 'stat' (версия и конец данных файла),
+        'cache' (поиск готового ответа), 'schema', 'parse', 'sort' (см. select_rows), 'select' (остальное чтение строк:
+        поколоночные копии, индексы, процессы, страницы), 'encode' (сериализация), 'compress', 'aggregate', 'list'.
+        Счётчики: 'rows' (строки ответа).
+    """
+    version = protocol.negotiated_version(content_type)
 
     status = check_query(request)
 
     if status == RequestStatus.BAD_REQUEST:
         # Запрос "кривой", ошибка.
-        send_answer(status, None)
-        exit()
+        return answer(status, None, version)
 
-    if not is_session_active(SQL(SESSION_WAITING_TIME, db_data.USER_NAME, db_data.USER_PASSWORD, db_data.DB_NAME,
-                                 db_data.TABLE_NAME, db_data.DB_IP),
-                             TokenType(request['token'][0])):
+    with timings.span('db'):
+        is_active = is_session_active(db, TokenType(request['token'][0]))
+    if not is_active:
         # Токен устарел, сессия закрыта.
-        send_answer(RequestStatus.REQUEST_TIMEOUT, None)
-        exit()
+        return answer(RequestStatus.REQUEST_TIMEOUT, None, version)
 
     if 'file' in request.keys():
+        import content_encoding
         # Работа с отдельным файлом.
         filepath = files_dir + '/' + request['file'][0]
-        if os.path.isfile(filepath):
+        if not os.path.isfile(filepath):
             # проверка файла на существование.
-            if 'cols' in request.keys():
-                # Получение только указанных колонок.
-                status, header, content = get_file(filepath, request['cols'][0].split(sep=in_value_separator))
-            else:
-                # Получение Всех колонок.
-                status, header, content = get_file(filepath)
-
-            if status == RequestStatus.BAD_REQUEST or status == RequestStatus.NON_FOUND:
-                # Не удалось прочитать содержимое файла.
-                send_answer(status, None)
-                exit()
+            return answer(RequestStatus.NON_FOUND, None, version)
+
+        start = int(request['from_byte'][0]) if 'from_byte' in request.keys() else 0
+        # Версия файла и конец его данных (при дозагрузке дописываемая в этот момент строка не учитывается).
+        with timings.span('stat'):
+            stat = os.stat(filepath)
+            end = read_end(filepath, stat.st_size, start)
+        cols = request.get('cols', [None])[0]
+        sort_spec = request.get('sort', [None])[0]
+        where = request.get('where', [None])[0]
+        # Диапазон строк (страница)
+        offset = int(request['offset'][0]) if 'offset' in request.keys() else 0
+        limit = int(request['limit'][0]) if 'limit' in request.keys() else None
+        is_paged = 'offset' in request.keys() or 'limit' in request.keys()
+        # Сжатие ответа, допускаемое клиентом.
+        encoding = content_encoding.negotiate(accept_encoding)
+
+        if 'agg' in request.keys():
+            with timings.span('aggregate'):
+                return answer_aggregate(filepath, request['agg'][0], where, end, stat, version, if_none_match,
+                                        encoding)
+
+        # ETag описывает результат запроса (файл и параметры), а не способ его передачи,
+        # поэтому совпадает и у запросов дозагрузки. Сжатый ответ - другое представление результата, с другим ETag.
+        etag = '"{}"'.format(result_key(filepath, cols, sort_spec, where, offset, limit, encoding, stat=stat))
+        validators = [('ETag', etag), ('X-End-Offset', str(end)), ('Vary', 'Accept-Encoding')]
+        if etag_matches(if_none_match, etag):
+            # Результат у клиента актуален.
+            return Answer(validators, [], HTTP_NOT_MODIFIED)
+
+        # Готовый ответ на такой же запрос к этой же версии файла.
+        is_streamed = 'stream' in request.keys() or version == protocol.PROTOCOL_VERSION
+        key = result_key(filepath, cols, sort_spec, where, offset, limit, version, is_streamed, start,
+                                   encoding, stat=stat)
+        with timings.span('cache'):
+            cached = result_cache().get(key)
+        if cached is not None:
+            # В кэше хранится уже сжатый ответ.
+            return Answer([('Content-Type', response_content_type(version))] + encoding_headers(encoding) + validators,
+                          cached)
+
+        if is_paged:
+            status, header, content = select_page(filepath, cols, sort_spec, offset, limit, end, stat, where, timings)
+        else:
+            status, header, content = select_rows(filepath, cols, sort_spec, start, end, where, timings)
 
-            if 'sort' in request.keys():
-                # Сортировка файла по указанным в списке столбцам
-                status, content = sort(header, content, request['sort'][0].split(sep=in_value_separator))
+        if status == RequestStatus.BAD_REQUEST or status == RequestStatus.NON_FOUND:
+            # Не удалось прочитать содержимое файла.
+            return answer(status, None, version)
+        content = timings.iterate('select', content, 'rows', chunk_rows)
 
-            content.insert(0, header)
-            send_answer(status, content)
+        if is_streamed:
+            # Потоковая отправка файла порциями (двоичный протокол всегда потоковый).
+            response = answer_stream(status, header, content, version)
+            response = Answer(response.headers, timings.iterate('encode', response.body), response.status)
         else:
-            send_answer(RequestStatus.NON_FOUND, None)
-    else:
-        # Работа с папкой по умолчанию.
-        if 'list' in request.keys():
-            # Получение списка файлов csv из директории.
+            with timings.span('encode'):
+                content = list(content)
+                content.insert(0, header)
+                response = answer(status, content, version)
+
+        if status != RequestStatus.OK:
+            return response
+        # Ответ сжимается и сохраняется в кэше по мере отправки.
+        response = compress_answer(response, encoding)
+        if encoding:
+            response = Answer(response.headers, timings.iterate('compress', response.body), response.status)
+        return Answer(response.headers + validators, result_cache().store(key, response.body))
+
+    # Работа с папкой по умолчанию.
+    if 'list' in request.keys():
+        # Получение списка файлов csv из директории.
+        with timings.span('list'):
             if 'info' in request.keys():
                 # Список файлов с информацией о столбцах в каждом.
-                files_list = get_list(files_dir, with_info=True)
+                files_list = get_list(files_dir, with_info=True, cache=schema_cache())
             else:
                 # Список файлов без информации
                 files_list = get_list(files_dir)
 
-            send_answer(RequestStatus.OK, files_list)
+        return answer(RequestStatus.OK, files_list, version)
 
-        else:
-            # Запрос не опознан.
-            send_answer(RequestStatus.BAD_REQUEST, None)
+    # Запрос не опознан.
+    return answer(RequestStatus.BAD_REQUEST, None, version)
+
+
+if __name__ == "__main__":
+    # unittest.main()
+
+    # Выделение запроса
+    request = parse_qs(os.environ['QUERY_STRING'], keep_blank_values=True)
+    # request = {'file':['bar.csv'], 'cols': ['foo,bar'], 'sort':['foo,bar']}
+    # request = {'list':'', 'info': ''}
+    # request = {'list':'', 'token': '12345'}
+
+    write_answer(handle(request, make_db(), os.environ.get('CONTENT_TYPE'), os.environ.get('HTTP_IF_NONE_MATCH'),
+                        os.environ.get('HTTP_ACCEPT_ENCODING')))
@@ -1,21 +1,50 @@
 import os
 import sys
+import threading
+import time
 import typing
-from typing import Dict, List, Optional, Tuple
-import requests
-import pickle
+from typing import TYPE_CHECKING, Dict, List, NamedTuple, Optional, Tuple, Iterable, Iterator
+import protocol
 import common
-import csv
+import timing
+import json
 from common import TokenType
 
+if TYPE_CHECKING:
+    # requests, pickle, csv и concurrent.futures импортируются в функциях, которым они нужны:
+    # -help и разбор параметров обходятся без них.
+    import requests
+
 # Формат расшифрованного ответа на запрос.
 Parsed = Dict[str, Optional[typing.Union[str, list]]]
 # Адрес ответного скрипта на сервере.
 url: str = "http://csvtest/cgi-bin/get_cgi.py"
 # Относительный путь (относительно скрипта) к папке с сохраняемыми файлами.
 saved_dir: str = '../files'
+# Имя файла манифеста загруженных файлов в saved_dir.
+manifest_name: str = '.manifest.json'
+# Число одновременных загрузок в пакетном режиме (-file=a.csv,b.csv или -all).
+download_workers: int = 4
+# Число повторных попыток загрузки файла при ошибке сети или оборванном ответе.
+download_retries: int = 2
+# Пауза перед повторной попыткой (умножается на номер попытки), с.
+retry_delay: float = 1.0
+# Число строк страницы по умолчанию (-head, -page).
+page_size: int = 100
+# Сжатие ответов сервера по умолчанию (-compress): 'gzip', 'zstd' (нужен модуль zstandard) или 'none'.
+compression: str = 'gzip'
+# Заголовок Accept-Encoding для каждого значения -compress. Ответ распаковывается requests по мере получения.
+accept_encodings: Dict[str, str] = {'gzip': 'gzip', 'zstd': 'zstd, gzip;q=0.5', 'none': 'identity'}
 # Файл с токеном сеанса
 token_file: str = "./token"
+# Размер куска, читаемого из сети при потоковой загрузке, байт.
+read_chunk_size: int = 64 * 1024
+# Названия этапов замеров загрузки (-timing).
+timing_labels: Dict[str, str] = {'token': 'чтение токена', 'network': 'сеть', 'decode': 'расшифровка',
+                                 'write': 'запись на диск'}
+
+# Блокировка манифеста при параллельных загрузках.
+_manifest_lock = threading.Lock()
 
 
 def parse_input(com_line: List[str]) -> Parsed:
@@ -28,7 +57,8 @@ def parse_input(com_line: List[str]) -> Parsed:
     result: Parsed = {}
     for com in com_line:
         try:
-            key, value = com.split(sep='=')
+            # Значение может само содержать '=' (например, -where=name=foo)
+            key, value = com.split(sep='=', maxsplit=1)
         except ValueError:
             result[com] = None
             continue
@@ -40,26 +70,47 @@ def print_help() -> None:
     print("\n"
           "Варианты использования:\n"
           "\n"
-          "Получить список файлов: main.py -list [-info]\n"
-          "Загрузить один файл: main.py -file=... [-cols=...,...,...] [sort=...,...,...] [-delete]\n"
+          "Получить список файлов: main.py -list [-info] [-timing]\n"
+          "Загрузить один файл: main.py -file=... [-cols=...] [-where=...] [-sort=...] [-resume] [-compress=...]\n"
+          "                     [-delete] [-timing]\n"
+          "Загрузить несколько файлов: main.py -file=...,...,... | -all [-workers=...] [-cols=...] [-where=...]\n"
+          "                            [-sort=...] [-async [-list [-info]]]\n"
+          "Загрузить часть файла: main.py -file=... -head=... | -page=... [-page_size=...] [-cols=...] [-where=...]\n"
+          "                       [-sort=...]\n"
+          "Сводные значения по столбцам: main.py -file=...,... | -all -agg=... [-where=...]\n"
           "\n"
           "Подробно о параметрах.\n"
           "-list        - загрузка списка csv файлов\n"
           "-info        - показать информацию о содержимом файла\n"
-          "-file        - имя файла, вида 'foo.csv'\n"
+          "-file        - имя файла, вида 'foo.csv', или список имён, вида 'foo.csv,bar.csv' (без пробелов)\n"
+          "-all         - загрузить все файлы с сервера\n"
+          "-workers     - число одновременных загрузок (по умолчанию {0})\n"
+          "-async       - асинхронная загрузка: приём, расшифровка и запись на диск идут одновременно;\n"
+          "               с -list [-info] список файлов запрашивается вместе с загрузками\n"
           "-cols        - список необходимых колонок, вида 'foo,bar,baz' (без пробелов)\n"
-          "-sort        - сортировка запрошенных колонок, вида 'foo,bar' (без пробелов)\n"
+          "-sort        - сортировка запрошенных колонок, вида 'foo,bar' (без пробелов).\n"
+          "               Для каждой колонки можно указать тип (int, float, num, date, str) и направление\n"
+          "               (asc, desc): 'price:num:desc,name'. По умолчанию тип определяется по файлу.\n"
+          "-where       - условия отбора строк (проверяются на сервере), вида 'price>=10;name~Ab'.\n"
+          "               Операторы: = != > < >= <= и ~ (значение начинается с). Числа и даты сравниваются\n"
+          "               с учётом типа столбца. Условие с > или < заключается в кавычки: -where='price>10'.\n"
+          "-agg         - вычислить на сервере сводные значения, вида 'count,sum:price,distinct:region':\n"
+          "               count (число строк), count, sum, avg, min, max, distinct (различные значения) по столбцу\n"
+          "-head        - загрузить только первые строки (по умолчанию {1})\n"
+          "-page        - загрузить страницу с указанным номером (с единицы), по -page_size строк (по умолчанию {1})\n"
+          "               Страница сохраняется в отдельный файл, вида 'foo_rows_100-199.csv'.\n"
+          "-resume      - дозагрузить только строки, дописанные в файл после прошлой загрузки\n"
+          "               (для файлов, которые только дописываются; без сортировки)\n"
+          "-compress    - сжатие ответа сервера: gzip, zstd (нужен модуль zstandard) или none (по умолчанию {2})\n"
+          "-timing      - показать время этапов загрузки: чтение токена, сеть, расшифровка, запись на диск\n"
           "-delete      - удалить ранее загруженные файлы\n"
-          "-help        - помощь.\n")
+          "-help        - помощь.\n".format(download_workers, page_size, compression))
 
 
-def send_request(url: str, params: Dict[str, str], headers: Dict[str, str]) -> Tuple[common.RequestStatus, dict]:
-    """ Отправка HTTP-запроса.
+def read_token() -> str:
+    """ Чтение токена сессии из файла.
 
-    :param url: адрес запроса. Может указывать на директорию или на отдельный .csv-файл.
-    :param params: параметры запроса
-    :param headers: заголовок запроса. Обязательно с 'Content-Type': 'application/octet-stream'
-    :return: расшифрованный ответ HTTP-сервера в виде словаря с двумя полями: 'status' и 'content'
+    :return: токен сеанса в виде строки.
     """
     try:
         # Чтение токена сессии
@@ -67,22 +118,444 @@ def send_request(url: str, params: Dict[str, str], headers: Dict[str, str]) -> T
             token: str = tf.readline()
             # Попытка привезти прочитанную строку к типу токена, если не токен, то вылетит ошибка.
             TokenType(token)
-            params['token'] = token
+            return token
     except FileNotFoundError:
         raise FileNotFoundError("Отсутствует файл с токеном.")
     except TypeError:
         raise TypeError("В файле, где должен быть токен, находится не токен.")
 
-    response = requests.get(url, params=params, headers=headers)
 
-    # декодируем байтовый поток в строку вида "b'...'" и превращаем эту строку в bytes-объект
-    bytes_obj = eval(response.content.decode())
-    # десериализация byte-объекта в словарь с данными
-    dict_response: dict = pickle.loads(bytes_obj)
+def decode_line(line: bytes) -> dict:
+    """ Расшифровка одной порции ответа сервера.
+
+    :param line: строка вида "b'...'"
+    :return: словарь с двумя полями: 'status' и 'content'
+    :raises ValueError: строка повреждена (например, ответ оборван посреди строки)
+    """
+    import pickle
+    try:
+        # декодируем байтовый поток в строку вида "b'...'" и превращаем эту строку в bytes-объект
+        bytes_obj = eval(line.decode())
+        # десериализация byte-объекта в словарь с данными
+        return pickle.loads(bytes_obj)
+    except (SyntaxError, TypeError, EOFError, pickle.UnpicklingError) as e:
+        raise ValueError("Повреждённая порция ответа.") from e
+
+
+def is_binary(response: 'requests.Response') -> bool:
+    """ Ответ сервера передан в двоичном протоколе? """
+    return protocol.negotiated_version(response.headers.get('Content-Type')) == protocol.PROTOCOL_VERSION
+
+
+def iter_legacy_frames(lines: Iterable[bytes]) -> Iterator[Tuple[int, typing.Any]]:
+    """ Представление потокового ответа в прежнем формате в виде кадров двоичного протокола.
+
+    :param lines: строки ответа, каждая вида "b'...'"
+    :return: Итератор по парам (тип кадра, данные): статус, заголовок, порции строк.
+    """
+    frame_type: int = protocol.FRAME_STATUS
+    for line in lines:
+        if not line:
+            continue
+        answer: dict = decode_line(line)
+        if frame_type == protocol.FRAME_STATUS:
+            yield protocol.FRAME_STATUS, answer['status'].value
+            frame_type = protocol.FRAME_HEADER
+            yield frame_type, answer['content']
+            frame_type = protocol.FRAME_ROWS
+        else:
+            yield frame_type, answer['content']
+
+
+def send_request(url: str, params: Dict[str, str], headers: Dict[str, str],
+                 session: Optional['requests.Session'] = None, token: Optional[str] = None,
+                 timings: timing.Timings = timing.NULL) -> Tuple[common.RequestStatus, dict]:
+    """ Отправка HTTP-запроса.
+
+    :param url: адрес запроса. Может указывать на директорию или на отдельный .csv-файл.
+    :param params: параметры запроса
+    :param headers: заголовок запроса. Обязательно с 'Content-Type': 'application/octet-stream'
+        (для двоичного протокола - protocol.CONTENT_TYPE)
+    :param session: сессия requests (соединение переиспользуется между запросами), None - отдельное соединение
+    :param token: токен сеанса, None - прочитать из файла
+    :param timings: замеры этапов: 'token', 'network', 'decode'; счётчик 'bytes'
+    :return: расшифрованный ответ HTTP-сервера в виде словаря с двумя полями: 'status' и 'content'
+    """
+    import requests
+    with timings.span('token'):
+        params['token'] = token or read_token()
+
+    with timings.span('network'):
+        response = (session or requests).get(url, params=params, headers=headers)
+    timings.count('bytes', len(response.content))
+
+    if is_binary(response):
+        # Ответ в двоичном протоколе: кадр статуса и, возможно, кадр данных.
+        status: common.RequestStatus = common.RequestStatus.BAD_REQUEST
+        content = None
+        with timings.span('decode'):
+            for frame_type, value in protocol.iter_frames([response.content]):
+                if frame_type == protocol.FRAME_STATUS:
+                    status = common.RequestStatus(value)
+                elif frame_type == protocol.FRAME_DATA:
+                    content = value
+        return status, content
+
+    with timings.span('decode'):
+        dict_response: dict = decode_line(response.content)
 
     return dict_response['status'], dict_response['content']
 
 
+def request_key(params: Dict[str, str]) -> str:
+    """ Ключ записи манифеста: параметры запроса, определяющие содержимое сохраняемого файла. """
+    return '&'.join('{}={}'.format(name, params[name]) for name in ('file', 'cols', 'where', 'sort', 'offset', 'limit')
+                    if name in params)
+
+
+def saved_filename(name: str, params: Dict[str, str]) -> str:
+    """ Желаемое имя сохраняемого файла: страница файла сохраняется отдельно, вида foo_rows_100-199.csv """
+    filename: str = saved_dir + '/' + name
+    if 'offset' not in params and 'limit' not in params:
+        return filename
+    first: int = int(params.get('offset', 0))
+    last: str = str(first + int(params['limit']) - 1) if 'limit' in params else ''
+    return '{}_rows_{}-{}.csv'.format(filename[:-4] if filename.endswith('.csv') else filename, first, last)
+
+
+def load_manifest() -> Dict[str, dict]:
+    """ Манифест загруженных файлов: {ключ запроса: {'file': имя файла, 'etag': ETag, 'end': конец данных}}. """
+    try:
+        with open(saved_dir + '/' + manifest_name, 'r') as mf:
+            return json.load(mf)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def save_manifest(manifest: Dict[str, dict]) -> None:
+    """ Запись манифеста (через временный файл, чтобы прерванная запись не испортила его). """
+    path: str = saved_dir + '/' + manifest_name
+    with open(path + '.tmp', 'w') as mf:
+        json.dump(manifest, mf, ensure_ascii=False, indent=1)
+    os.replace(path + '.tmp', path)
+
+
+def prepare_file_request(params: Dict[str, str], headers: Dict[str, str], resume: bool) -> \
+        Tuple[str, Optional[dict], Dict[str, str], bool]:
+    """ Подготовка запроса на загрузку файла по манифесту: условный запрос (If-None-Match) для сохранённого
+    файла, дозагрузка (from_byte добавляется в params).
+
+    :param params: параметры запроса
+    :param headers: заголовок запроса (не изменяется)
+    :param resume: дозагрузить только строки, дописанные в файл после прошлой загрузки (см. receive_file)
+    :return: ключ записи манифеста, запись манифеста (None - файл не загружался или удалён), заголовок запроса,
+        признак дозагрузки
+    """
+    key: str = request_key(params)
+    entry: Optional[dict] = load_manifest().get(key)
+    if entry is not None and not os.path.isfile(entry['file']):
+        # Сохранённый файл удалён.
+        entry = None
+
+    headers = dict(headers)
+    is_resumed: bool = False
+    if entry is not None:
+        headers['If-None-Match'] = entry['etag']
+        is_resumed = resume and 'sort' not in params and 'offset' not in params and 'limit' not in params
+    if is_resumed:
+        params['from_byte'] = str(entry['end'])
+    return key, entry, headers, is_resumed
+
+
+def save_manifest_record(key: str, record: dict) -> None:
+    """ Запись о загруженном файле в манифест. """
+    try:
+        # Манифест перечитывается: его могли обновить параллельные загрузки (см. receive_files).
+        with _manifest_lock:
+            manifest: Dict[str, dict] = load_manifest()
+            manifest[key] = record
+            save_manifest(manifest)
+    except OSError:
+        # Файл сохранён, но без манифеста будет загружен заново.
+        pass
+
+
+def discard_download(target: str, is_resumed: bool, size: int) -> None:
+    """ Откат прерванной загрузки: временный файл удаляется, дописываемый усекается до прежнего размера,
+    чтобы повторная дозагрузка не продублировала строки.
+
+    :param target: файл, в который шла запись
+    :param is_resumed: дозагрузка (запись в конец сохранённого файла)
+    :param size: размер сохранённого файла до дозагрузки, байт
+    """
+    try:
+        if is_resumed:
+            os.truncate(target, size)
+        else:
+            os.remove(target)
+    except OSError:
+        pass
+
+
+def receive_file(url: str, params: Dict[str, str], headers: Dict[str, str], filename: str,
+                 resume: bool = False, session: Optional['requests.Session'] = None, token: Optional[str] = None,
+                 timings: timing.Timings = timing.NULL) -> Tuple[common.RequestStatus, Optional[str]]:
+    """ Потоковая загрузка файла: порции ответа записываются на диск по мере получения.
+
+    Результат запроса с теми же параметрами сохраняется в тот же файл (см. манифест). Если результат
+    на сервере не изменился, он не передаётся повторно (ответ 304, статус NOT_MODIFIED).
+
+    :param url: адрес запроса.
+    :param params: параметры запроса (без параметров 'stream' и 'from_byte', они добавляются здесь)
+    :param headers: заголовок запроса. Обязательно с 'Content-Type': 'application/octet-stream'
+    :param filename: желаемое имя сохраняемого файла с путём
+    :param resume: дозагрузить только строки, дописанные в файл на сервере после прошлой загрузки
+        (для файлов, которые только дописываются; не совместимо с сортировкой и выбором страницы)
+    :param session: сессия requests (соединение переиспользуется между запросами), None - отдельное соединение
+    :param token: токен сеанса, None - прочитать из файла
+    :param timings: замеры этапов: 'token', 'network' (ожидание и получение ответа, включая распаковку),
+        'decode' (расшифровка кадров), 'write' (запись на диск); счётчики 'bytes' (после распаковки), 'rows'
+    :return: статус запроса, имя сохранённого файла (None, если файл не сохранён)
+    """
+    import csv
+    import requests
+    key, entry, headers, is_resumed = prepare_file_request(params, headers, resume)
+
+    with timings.span('token'):
+        params['token'] = token or read_token()
+    params['stream'] = ''
+
+    with timings.span('network'):
+        response = (session or requests).get(url, params=params, headers=headers, stream=True)
+    with response:
+        if response.status_code == 304:
+            # Результат не изменился.
+            return common.RequestStatus.NOT_MODIFIED, entry['file']
+
+        if is_binary(response):
+            chunks = timings.iterate('network', response.iter_content(chunk_size=read_chunk_size))
+            frames = protocol.iter_frames(timings.counted('bytes', chunks, len))
+        else:
+            # Прежний формат: каждая строка ответа - порция вида repr(pickle.dumps(...))
+            lines = timings.iterate('network', response.iter_lines())
+            frames = iter_legacy_frames(timings.counted('bytes', lines, len))
+        frames = timings.iterate('decode', frames)
+
+        # Первый кадр - статус запроса.
+        first: Optional[Tuple[int, typing.Any]] = next(frames, None)
+        if first is None:
+            raise ValueError("Пустой ответ.")
+        status = common.RequestStatus(first[1])
+        if status == common.RequestStatus.BAD_REQUEST and is_resumed:
+            # Файл на сервере изменён не дописыванием: загружается заново целиком.
+            del params['from_byte']
+            return receive_file(url, params, headers, filename, session=session, token=token, timings=timings)
+        if status != common.RequestStatus.OK:
+            return status, None
+
+        if entry is not None:
+            filename = entry['file']
+        else:
+            filename = unic_filename(filename)
+        # Новый файл пишется во временный и заменяет прежний только после полной загрузки.
+        target: str = filename if is_resumed else filename + '.part'
+        size: int = 0
+        try:
+            if is_resumed:
+                size = os.path.getsize(target)
+            with open(target, 'a' if is_resumed else 'w', newline='') as csvfile:
+                csvwriter = csv.writer(csvfile)
+                for frame_type, value in frames:
+                    if frame_type == protocol.FRAME_HEADER and not is_resumed:
+                        csvwriter.writerow(value)
+                    elif frame_type == protocol.FRAME_ROWS:
+                        # Запись очередной порции строк
+                        with timings.span('write'):
+                            csvwriter.writerows(value)
+                        timings.count('rows', len(value))
+            if not is_resumed:
+                os.replace(target, filename)
+        except BaseException as e:
+            # Загрузка прервана: файл возвращается к состоянию до неё.
+            discard_download(target, is_resumed, size)
+            if isinstance(e, OSError) and not isinstance(e, requests.RequestException):
+                # Не удалось записать файл (ошибки сети не относятся к записи).
+                return common.RequestStatus.OK, None
+            raise
+
+        record: dict = {'file': filename, 'etag': response.headers.get('ETag'),
+                        'end': int(response.headers.get('X-End-Offset', 0))}
+
+    save_manifest_record(key, record)
+    return common.RequestStatus.OK, filename
+
+
+class Download(NamedTuple):
+    """ Результат загрузки одного файла в пакетном режиме. """
+    # Имя файла на сервере
+    name: str
+    # Статус запроса (None - ответ не получен)
+    status: Optional[common.RequestStatus]
+    # Имя сохранённого файла (None, если файл не сохранён)
+    filename: Optional[str]
+    # Размер загруженного файла, байт (0, если файл не загружался)
+    size: int
+    # Ошибка, на которой загрузка закончилась: сети или расшифровки ответа - после всех попыток, прочие - сразу
+    # (None - загрузка завершилась ответом сервера)
+    error: Optional[Exception] = None
+    # Замеры этапов загрузки (см. receive_file)
+    timings: timing.Timings = timing.NULL
+
+
+def receive_one(url: str, params: Dict[str, str], headers: Dict[str, str], name: str, resume: bool,
+                session: 'requests.Session', token: str, timed: bool = False) -> Download:
+    """ Загрузка одного файла пакета с повторными попытками при ошибках сети и оборванных ответах.
+
+    :param name: имя файла на сервере
+    :param timed: замерять время этапов загрузки (все попытки вместе)
+    :return: результат загрузки; исключения не выбрасываются, а возвращаются в Download.error
+    """
+    import requests
+    timings: timing.Timings = timing.Timings() if timed else timing.NULL
+    error: Optional[Exception] = None
+    for attempt in range(download_retries + 1):
+        if attempt:
+            time.sleep(retry_delay * attempt)
+        try:
+            status, filename = receive_file(url, dict(params, file=name), headers, saved_filename(name, params),
+                                            resume, session, token, timings)
+        except (requests.RequestException, ValueError) as e:
+            # Ошибка сети или ответ, который не удалось расшифровать (оборван или пуст): попытка повторяется.
+            error = e
+            continue
+        except Exception as e:
+            # Прочие ошибки не исправятся повтором и не должны прерывать загрузку остальных файлов пакета.
+            return Download(name, None, None, 0, e, timings)
+        is_received: bool = status == common.RequestStatus.OK and filename is not None
+        return Download(name, status, filename, os.path.getsize(filename) if is_received else 0, timings=timings)
+    return Download(name, None, None, 0, error, timings)
+
+
+def receive_files(url: str, params: Dict[str, str], headers: Dict[str, str], names: List[str],
+                  resume: bool = False, workers: Optional[int] = None, token: Optional[str] = None,
+                  timed: bool = False) -> Iterator[Download]:
+    """ Параллельная загрузка нескольких файлов с одинаковыми параметрами запроса.
+
+    Токен читается один раз; запросы идут через одну сессию requests (keep-alive соединения переиспользуются)
+    из пула не более чем workers потоков. Каждый файл загружается и при ошибке сети или оборванном ответе
+    повторяется независимо от других; ошибка одного файла не прерывает загрузку остальных (см. Download.error).
+
+    :param url: адрес запроса.
+    :param params: параметры запроса без имени файла (cols, sort)
+    :param headers: заголовок запроса. Обязательно с 'Content-Type': 'application/octet-stream'
+    :param names: имена файлов на сервере
+    :param resume: дозагрузить только строки, дописанные в файлы после прошлой загрузки (см. receive_file)
+    :param workers: число одновременных загрузок (None - download_workers)
+    :param token: токен сеанса, None - прочитать из файла
+    :param timed: замерять время этапов загрузки каждого файла (Download.timings)
+    :return: Итератор по результатам загрузки в порядке их завершения.
+    """
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+    import requests
+    import requests.adapters
+    workers = workers or download_workers
+    token = token or read_token()
+    with requests.Session() as session:
+        # Пул соединений сессии не меньше числа потоков, иначе соединения будут закрываться и открываться заново.
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(receive_one, url, params, headers, name, resume, session, token, timed)
+                       for name in names]
+            for future in as_completed(futures):
+                yield future.result()
+
+
+def print_download(download: Download) -> None:
+    """ Вывод результата загрузки одного файла. """
+    if download.error is not None:
+        print("{}: ошибка - {}".format(download.name, download.error))
+    elif download.status == common.RequestStatus.NOT_MODIFIED:
+        print("Файл не изменился: {}".format(download.filename))
+    elif download.status == common.RequestStatus.OK:
+        if download.filename:
+            print("Файл успешно сохранён под именем {}".format(download.filename))
+        else:
+            print("{}: не удалось сохранить файл.".format(download.name))
+    else:
+        # Ошибка
+        print("{}: Error. {} - {}".format(download.name, download.status.value, download.status.name))
+
+
+def print_listing(status: common.RequestStatus, content: Optional[dict]) -> None:
+    """ Вывод списка файлов. """
+    if status == common.RequestStatus.OK:
+        for filename, fields in content.items():
+            print(filename, ': ', fields)
+    else:
+        # Ошибка
+        print("Error. {} - {}".format(status.value, status.name))
+
+
+def print_summary(downloads: List[Download], elapsed: float) -> None:
+    """ Суммарная производительность пакетной загрузки (файлы без изменений не загружались). """
+    if len(downloads) < 2:
+        return
+    received: int = sum(1 for download in downloads if download.size)
+    unchanged: int = sum(1 for download in downloads if download.status == common.RequestStatus.NOT_MODIFIED)
+    size_mb: float = sum(download.size for download in downloads) / (1024 * 1024)
+    print("Загружено файлов: {} из {} (без изменений: {}), {:.2f} МБ за {:.2f} с ({:.2f} МБ/с)".format(
+        received, len(downloads), unchanged, size_mb, elapsed, size_mb / elapsed if elapsed else 0))
+
+
+def receive_async(url: str, params: Dict[str, str], headers: Dict[str, str], names: Optional[List[str]],
+                  list_params: Optional[Dict[str, str]] = None, resume: bool = False, workers: Optional[int] = None,
+                  token: Optional[str] = None, timed: bool = False) -> List[Download]:
+    """ Асинхронная загрузка файлов (-async, см. async_client.iter_results) с выводом результатов
+    по мере их получения.
+
+    :param names: имена файлов на сервере; None - все файлы из списка
+    :param list_params: параметры запроса списка файлов для вывода (None - список не выводится)
+    :return: Результаты загрузки в порядке их завершения.
+    """
+    import asyncio
+    import async_client
+
+    async def report() -> List[Download]:
+        downloads: List[Download] = []
+        async for result in async_client.iter_results(url, params, headers, names, list_params, resume, workers,
+                                                      token, timed):
+            if isinstance(result, async_client.Listing):
+                if list_params is None and result.status == common.RequestStatus.OK:
+                    # Список нужен только для загрузки всех файлов.
+                    continue
+                if result.error is not None:
+                    print("Список файлов: ошибка - {}".format(result.error))
+                else:
+                    print_listing(result.status, result.content)
+            else:
+                print_download(result)
+                downloads.append(result)
+            if timed:
+                print("    {}".format(format_timings(result.timings)))
+        return downloads
+
+    return asyncio.run(report())
+
+
+def format_timings(timings: timing.Timings) -> str:
+    """ Время этапов загрузки и счётчики одной строкой. """
+    parts: List[str] = ['{} {:.3f} с'.format(timing_labels.get(name, name), seconds)
+                        for name, seconds in timings.spans.items()]
+    parts.append('всего {:.3f} с'.format(timings.total()))
+    if 'rows' in timings.counters:
+        parts.append('строк {}'.format(timings.counters['rows']))
+    if 'bytes' in timings.counters:
+        parts.append('получено {:.2f} МБ'.format(timings.counters['bytes'] / (1024 * 1024)))
+    return ', '.join(parts)
+
+
 def unic_filename(filename: str) -> str:
     """ Если в папке сохранений уже есть файл с таким именем, функция создаёт новое уникальное имя
     для этого файла по принципу: foo.csv -> foo0.csv -> foo1.csv и т. д. """
@@ -114,15 +587,14 @@ if __name__ == '__main__':
 
     if '-help' in parsed_commands.keys():
         print_help()
-    elif '-file' in parsed_commands.keys():
-        # Указание на конкретный файл csv.
+    elif '-file' in parsed_commands.keys() or '-all' in parsed_commands.keys():
+        # Указание на конкретные файлы csv или на все файлы.
 
         if "-delete" in parsed_commands.keys():
             # Удаление файлов, полученных ранее (очистка директории с загруженными файлами на локальной машине).
             for filename in os.listdir(saved_dir):
                 os.remove(saved_dir + '/' + filename)
 
-        params['file'] = parsed_commands['-file']
         if "-cols" in parsed_commands.keys():
             # Получение только указанных колонок.
             params['cols'] = parsed_commands['-cols']
@@ -131,25 +603,86 @@ if __name__ == '__main__':
             # Сортировка файла по указанным в списке столбцам
             params['sort'] = parsed_commands['-sort']
 
-        status, content = send_request(url, params, {'Content-Type': 'application/octet-stream'})
-
-        if status == common.RequestStatus.OK:
-            filename = saved_dir + '/' + parsed_commands['-file']
-
-            filename = unic_filename(filename)
-
-            try:
-                with open(filename, 'w') as csvfile:
-                    # Запись в файл
-                    csvwriter = csv.writer(csvfile)
-                    csvwriter.writerows(content)
-
-                print("Файл успешно сохранён под именем {}".format(filename))
-            except:
-                print("Не удалось сохранить файл.")
+        if "-where" in parsed_commands.keys():
+            # Отбор строк на сервере по условиям
+            params['where'] = parsed_commands['-where']
+
+        if "-head" in parsed_commands.keys():
+            # Только первые строки файла.
+            params['offset'] = '0'
+            params['limit'] = parsed_commands['-head'] or str(page_size)
+        elif "-page" in parsed_commands.keys():
+            # Одна страница файла (нумерация с единицы).
+            size: int = int(parsed_commands.get('-page_size') or page_size)
+            params['offset'] = str((int(parsed_commands['-page'] or 1) - 1) * size)
+            params['limit'] = str(size)
+
+        # Сжатие ответов: известное имя или значение заголовка Accept-Encoding как есть.
+        compress: str = parsed_commands.get('-compress') or compression
+        import requests.utils
+        if compress == 'zstd' and 'zstd' not in requests.utils.DEFAULT_ACCEPT_ENCODING:
+            # requests (urllib3) не умеет распаковывать zstd в этом окружении.
+            compress = 'gzip'
+        headers: Dict[str, str] = {'Content-Type': protocol.CONTENT_TYPE,
+                                   'Accept-Encoding': accept_encodings.get(compress, compress)}
+        # Замеры этапов (-timing): чтение токена и список файлов - здесь, загрузка каждого файла - отдельно.
+        timed: bool = '-timing' in parsed_commands.keys()
+        timings: timing.Timings = timing.Timings() if timed else timing.NULL
+        with timings.span('token'):
+            token: str = read_token()
+        # Асинхронный режим (только для загрузки строк): список файлов запрашивается вместе с загрузками.
+        is_async: bool = '-async' in parsed_commands.keys() and '-agg' not in parsed_commands.keys()
+        names: Optional[List[str]] = None
+        if is_async:
+            if '-file' in parsed_commands.keys():
+                names = parsed_commands['-file'].split(sep=',')
+        elif '-all' in parsed_commands.keys():
+            # Список всех файлов на сервере.
+            status, content = send_request(url, {'list': ''}, headers, token=token, timings=timings)
+            names = sorted(content) if status == common.RequestStatus.OK else []
+            if status != common.RequestStatus.OK:
+                print("Error. {} - {}".format(status.value, status.name))
+        else:
+            names = parsed_commands['-file'].split(sep=',')
+        if timed:
+            print("Замеры: {}".format(format_timings(timings)))
+
+        if '-agg' in parsed_commands.keys():
+            # Сводные значения вычисляются на сервере, строки файлов не загружаются.
+            params['agg'] = parsed_commands['-agg'] or 'count'
+            for name in names:
+                file_timings: timing.Timings = timing.Timings() if timed else timing.NULL
+                status, content = send_request(url, dict(params, file=name), headers, token=token,
+                                               timings=file_timings)
+                if status == common.RequestStatus.OK:
+                    print(name, ': ', content)
+                else:
+                    print("{}: Error. {} - {}".format(name, status.value, status.name))
+                if timed:
+                    print("    {}".format(format_timings(file_timings)))
+        elif is_async:
+            list_params: Optional[Dict[str, str]] = None
+            if '-list' in parsed_commands.keys():
+                list_params = {'list': ''}
+                if '-info' in parsed_commands.keys():
+                    list_params['info'] = ''
+            started: float = time.perf_counter()
+            downloads: List[Download] = receive_async(url, params, headers, names, list_params,
+                                                      '-resume' in parsed_commands.keys(),
+                                                      int(parsed_commands.get('-workers') or download_workers),
+                                                      token, timed)
+            print_summary(downloads, time.perf_counter() - started)
         else:
-            # Ошибка
-            print("Error. {} - {}".format(status.value, status.name))
+            started = time.perf_counter()
+            downloads = []
+            workers: int = int(parsed_commands.get('-workers') or download_workers)
+            for download in receive_files(url, params, headers, names, resume='-resume' in parsed_commands.keys(),
+                                          workers=workers, token=token, timed=timed):
+                print_download(download)
+                if timed:
+                    print("    {}".format(format_timings(download.timings)))
+                downloads.append(download)
+            print_summary(downloads, time.perf_counter() - started)
     else:
         if "-list" in parsed_commands.keys():
             # Получение списка файлов csv из директории.
@@ -158,14 +691,11 @@ if __name__ == '__main__':
                 # Список файлов с информацией о столбцах в каждом.
                 params['info'] = ''
 
-            status, content = send_request(url, params, {'Content-Type': 'application/octet-stream'})
-
-            if status == common.RequestStatus.OK:
-                for filename, fields in content.items():
-                    print(filename, ': ', fields)
-            else:
-                # Ошибка
-                print("Error. {} - {}".format(status.value, status.name))
+            timings = timing.Timings() if '-timing' in parsed_commands.keys() else timing.NULL
+            status, content = send_request(url, params, {'Content-Type': protocol.CONTENT_TYPE}, timings=timings)
+            print_listing(status, content)
+            if timings is not timing.NULL:
+                print("Замеры: {}".format(format_timings(timings)))
 
         else:
             # Не хватает команд для работы с директорией, указанной в URL
@@ -0,0 +1,83 @@
+""" Сохранённый результат запроса (например, отсортированный файл) для постраничной выдачи.
+
+Строки записываются блоками по block_rows (pickle), в конце - заголовок, позиции блоков и число строк,
+затем позиция этого описания. Страница читается с позиции нужного блока, без просмотра файла с начала.
+"""
+import struct
+from itertools import islice
+from typing import BinaryIO, Iterable, Iterator, List, Optional
+
+# Число строк в блоке.
+block_rows: int = 1000
+
+# Позиция описания в конце файла.
+_TRAILER = struct.Struct('>Q')
+
+
+def encode_pages(header: tuple, rows: Iterable[tuple]) -> Iterator[bytes]:
+    """ Сериализация строк блоками с описанием в конце.
+
+    :param header: Заголовок.
+    :param rows: Строки.
+    :return: Части файла.
+    """
+    import pickle
+    offsets: List[int] = []
+    position: int = 0
+    count: int = 0
+    block: List[tuple] = []
+
+    def dump(rows_block: List[tuple]) -> bytes:
+        nonlocal position
+        offsets.append(position)
+        data = pickle.dumps(rows_block, protocol=pickle.HIGHEST_PROTOCOL)
+        position += len(data)
+        return data
+
+    for row in rows:
+        block.append(row)
+        count += 1
+        if len(block) >= block_rows:
+            yield dump(block)
+            block = []
+    if block:
+        yield dump(block)
+
+    yield pickle.dumps((header, block_rows, offsets, count), protocol=pickle.HIGHEST_PROTOCOL) + \
+        _TRAILER.pack(position)
+
+
+class PageReader:
+    """ Чтение строк из файла, записанного encode_pages. """
+    def __init__(self, file: BinaryIO):
+        """
+
+        :param file: Файл, открытый в двоичном режиме. Закрывается по окончании чтения строк (см. rows).
+        """
+        import pickle
+        self.__file: BinaryIO = file
+        file.seek(-_TRAILER.size, 2)
+        trailer_start, = _TRAILER.unpack(file.read(_TRAILER.size))
+        file.seek(trailer_start)
+        header, self.__block_rows, self.__offsets, self.count = pickle.load(file)
+        self.header: tuple = tuple(header)
+
+    def rows(self, offset: int = 0, limit: Optional[int] = None) -> Iterator[tuple]:
+        """ Строки с номера offset (с нуля), не более limit (None - до конца). Файл закрывается по окончании. """
+        with self.__file:
+            block = offset // self.__block_rows
+            if block >= len(self.__offsets) or limit == 0:
+                return
+            self.__file.seek(self.__offsets[block])
+            skip: int = offset - block * self.__block_rows
+            yield from islice(self.__iter_blocks(len(self.__offsets) - block), skip,
+                              None if limit is None else skip + limit)
+
+    def __iter_blocks(self, count: int) -> Iterator[tuple]:
+        import pickle
+        for _ in range(count):
+            yield from pickle.load(self.__file)
+
+    def close(self) -> None:
+        self.__file.close()
+
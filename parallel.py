@@ -0,0 +1,180 @@
+""" Параллельное (в нескольких процессах) чтение и сортировка больших csv-файлов.
+
+Данные файла делятся на диапазоны байт, границы которых - концы строк. Каждый диапазон читается в отдельном
+процессе (ProcessPoolExecutor): строки разбираются, отбираются по условию, из них выбираются столбцы, а при сортировке
+диапазон сортируется целиком. Результат процесса - прогон во временном файле (см. extsort.write_run).
+Прогоны сортировки сливаются в родительском процессе (extsort.merge_runs), прогоны без сортировки читаются подряд.
+
+Равные ключи сливаются в порядке диапазонов, то есть в порядке файла, поэтому результат совпадает с однопоточным
+чтением и сортировкой (get_cgi.iter_file, get_cgi.sort) строка в строку. Файлы, в данных которых есть кавычки,
+так не читаются: значение в кавычках может содержать перевод строки, и конец строки файла - не обязательно
+конец записи.
+"""
+import csv
+import io
+import mmap
+import threading
+from itertools import chain
+from operator import itemgetter
+from typing import TYPE_CHECKING, Dict, Iterator, List, NamedTuple, Optional, Tuple
+import extsort
+import filters
+import projection
+import schema
+
+if TYPE_CHECKING:
+    # concurrent.futures.process импортирует multiprocessing, это дольше обработки небольшого запроса:
+    # модуль импортируется при первом использовании пула (см. _executor).
+    from concurrent.futures import ProcessPoolExecutor
+
+# Наибольший размер диапазона, читаемого одним процессом, байт: ограничивает память процесса при сортировке.
+range_bytes: int = 16 * 1024 * 1024
+
+# Пул процессов (см. _executor) и число процессов в нём
+_pool: Optional['ProcessPoolExecutor'] = None
+_pool_workers: int = 0
+_pool_lock = threading.Lock()
+
+
+class RangeTask(NamedTuple):
+    """ Задание процессу: диапазон файла и что с ним сделать. """
+    # Имя файла с путём
+    filepath: str
+    # Начало и конец диапазона (начало и конец строк)
+    start: int
+    end: int
+    # Заголовок файла (все столбцы)
+    header: tuple
+    # Индексы выбранных столбцов по возрастанию (None - все столбцы)
+    positions: Optional[List[int]]
+    # Условие отбора строк (см. filters) и типы столбцов для него
+    where: Optional[str]
+    types: Optional[Dict[str, str]]
+    # Ключ сортировки: индексы среди выбранных столбцов, типы, признаки убывания (None - без сортировки)
+    sort_key: Optional[Tuple[List[int], List[str], List[bool]]]
+    # Кодировка файла
+    encoding: str
+    # Директория для файла прогона (None - системная)
+    tmp_dir: Optional[str]
+
+
+def has_quotes(mm: mmap.mmap, start: int, end: int) -> bool:
+    """ Есть ли кавычки в данных файла от start до end. """
+    return mm.find(b'"', start, end) >= 0
+
+
+def split_ranges(mm: mmap.mmap, start: int, end: int, count: int) -> List[Tuple[int, int]]:
+    """ Деление данных файла на count (или меньше) диапазонов примерно равной длины по концам строк.
+
+    :param mm: Отображённый в память файл.
+    :param start: Начало данных (начало строки).
+    :param end: Конец данных (конец строки).
+    :param count: Желаемое число диапазонов.
+    :return: Список пар (начало, конец) в порядке файла.
+    """
+    bounds: List[int] = [start]
+    for num in range(1, count):
+        newline = mm.find(b'\n', max(bounds[-1], start + (end - start) * num // count), end)
+        if newline < 0:
+            break
+        if newline + 1 < end:
+            bounds.append(newline + 1)
+    bounds.append(end)
+    return [(bounds[i], bounds[i + 1]) for i in range(len(bounds) - 1) if bounds[i] < bounds[i + 1]]
+
+
+def _iter_range(task: RangeTask, csvfile: io.BufferedReader) -> Iterator[tuple]:
+    """ Строки диапазона, отобранные по условию, с выбранными столбцами (как в get_cgi.iter_file). """
+    predicate: Optional[filters.Predicate] = None
+    if task.where:
+        predicate = filters.compile_where(task.where, task.header, task.types)
+    if task.positions is not None:
+        columns: List[int] = filters.where_columns(task.where, task.header) if task.where else []
+        yield from projection.iter_mmap_rows(csvfile, task.start, task.end, task.positions, task.encoding,
+                                             predicate, columns)
+        return
+
+    csvfile.seek(task.start)
+    lines = (line.decode(task.encoding) for line in io.BytesIO(csvfile.read(task.end - task.start)))
+    records = csv.reader(lines)
+    yield from map(tuple, records if predicate is None else filter(predicate, records))
+
+
+def _range_run(task: RangeTask) -> str:
+    """ Обработка диапазона в процессе пула.
+
+    :return: Путь к файлу прогона: строки или, при сортировке, отсортированные пары (ключ, строка).
+    """
+    with open(task.filepath, 'rb') as csvfile:
+        rows = _iter_range(task, csvfile)
+        if task.sort_key is None:
+            return extsort.write_run(rows, task.tmp_dir)
+        key = schema.make_sort_key(*task.sort_key)
+        decorated = list(schema.decorate(rows, key))
+    decorated.sort(key=itemgetter(0))
+    return extsort.write_run(decorated, task.tmp_dir)
+
+
+def _executor(workers: int) -> 'ProcessPoolExecutor':
+    """ Пул процессов, общий для запросов (создаётся заново при изменении числа процессов). """
+    from concurrent.futures import ProcessPoolExecutor
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool = ProcessPoolExecutor(workers)
+            _pool_workers = workers
+        return _pool
+
+
+def iter_rows(filepath: str, start: int, end: int, header: tuple, positions: Optional[List[int]],
+              where: Optional[str], types: Optional[Dict[str, str]],
+              sort_key: Optional[Tuple[List[int], List[str], List[bool]]], encoding: str, workers: int,
+              tmp_dir: Optional[str] = None) -> Optional[Iterator[tuple]]:
+    """ Строки файла, прочитанные (и отсортированные) в workers процессах.
+
+    Данные делятся не меньше чем на workers диапазонов, и каждый не длиннее range_bytes. Диапазоны обрабатываются
+    при первом обращении к итератору. Условие, столбцы и ключ сортировки проверяются заранее; исключение процесса
+    (например, IndexError для строки без столбца сортировки, как в get_cgi.sort) выбрасывается при чтении.
+
+    :param filepath: Имя файла с путём.
+    :param start: Начало данных (после заголовка).
+    :param end: Конец данных (см. get_cgi.read_end).
+    :param header: Заголовок файла (все столбцы).
+    :param positions: Индексы выбранных столбцов по возрастанию (None - все столбцы).
+    :param where: Условие отбора строк (см. filters), проверяется до выбора столбцов.
+    :param types: Типы столбцов файла для условия.
+    :param sort_key: Индексы столбцов сортировки среди выбранных, их типы и признаки убывания (None - без сортировки).
+    :param encoding: Кодировка файла.
+    :param workers: Число процессов.
+    :param tmp_dir: Директория для файлов прогонов (None - системная).
+    :return: Итератор по кортежам строк или None, если в данных файла есть кавычки.
+    """
+    with open(filepath, 'rb') as csvfile, mmap.mmap(csvfile.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        if has_quotes(mm, start, end):
+            return None
+        count: int = max(workers, -(-(end - start) // range_bytes))
+        ranges = split_ranges(mm, start, end, count)
+
+    tasks = [RangeTask(filepath, range_start, range_end, header, positions, where, types, sort_key, encoding, tmp_dir)
+             for range_start, range_end in ranges]
+    return _iter_tasks(tasks, workers)
+
+
+def _iter_tasks(tasks: List[RangeTask], workers: int) -> Iterator[tuple]:
+    """ Выполнение заданий в пуле (при первом обращении к итератору) и строки их прогонов по порядку. """
+    from concurrent.futures import wait
+    futures = [_executor(workers).submit(_range_run, task) for task in tasks]
+    wait(futures)
+    # Прогоны удаляются и при ошибке в одном из процессов, и при прерванном чтении.
+    runs: List[str] = [future.result() for future in futures if future.exception() is None]
+    try:
+        for future in futures:
+            future.result()
+        if tasks and tasks[0].sort_key is not None:
+            yield from map(itemgetter(1), extsort.merge_runs(runs, itemgetter(0), tasks[0].tmp_dir))
+        else:
+            yield from chain.from_iterable(map(extsort.read_run, runs))
+    finally:
+        extsort.remove_runs(runs)
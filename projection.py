@@ -0,0 +1,124 @@
+""" Выбор столбцов строк csv-файла.
+
+make_projection - выбор по заранее вычисленным индексам (operator.itemgetter) вместо цикла по всем значениям строки.
+iter_mmap_rows - чтение строк из отображённого в память файла: строка без кавычек делится на поля методом split
+только до последнего выбранного поля, без разбора модулем csv; строки с кавычками разбираются модулем csv.
+"""
+import csv
+import mmap
+from operator import itemgetter
+from typing import BinaryIO, Callable, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+# Разделитель полей (как у csv.reader по умолчанию).
+field_separator: str = ','
+
+
+def make_projection(index: List[int]) -> Callable[[Sequence], tuple]:
+    """ Функция выбора значений строки с индексами index (в порядке index).
+
+    Если в строке меньше значений, чем нужно, функция выбрасывает IndexError (см. project_short).
+    """
+    if len(index) == 1:
+        # itemgetter с одним индексом возвращает значение, а не кортеж.
+        idx = index[0]
+        return lambda row: (row[idx],)
+    return itemgetter(*index)
+
+
+def project_short(row: Sequence, index: List[int]) -> tuple:
+    """ Выбор значений короткой строки: отсутствующие значения пропускаются. """
+    return tuple(row[idx] for idx in index if idx < len(row))
+
+
+def _read_record(mm: mmap.mmap, pos: int, end: int, encoding: str) -> Tuple[List[str], int]:
+    """ Разбор модулем csv одной записи, начинающейся с позиции pos (значение в кавычках может содержать
+    перевод строки, тогда запись занимает несколько строк файла).
+
+    :return: Значения записи, позиция начала следующей записи.
+    """
+    position: List[int] = [pos]
+
+    def lines() -> Iterator[str]:
+        while position[0] < end:
+            newline = mm.find(b'\n', position[0], end)
+            line_end = end if newline < 0 else newline + 1
+            line = mm[position[0]:line_end]
+            position[0] = line_end
+            yield line.decode(encoding)
+
+    # csv.reader читает строки по одной, поэтому после разбора записи position указывает на начало следующей.
+    return next(csv.reader(lines()), []), position[0]
+
+
+def iter_mmap_rows(csvfile: BinaryIO, start: int, end: int, index: List[int], encoding: str,
+                   predicate: Optional[Callable[[Sequence[str]], bool]] = None,
+                   predicate_columns: Sequence[int] = ()) -> Iterator[tuple]:
+    """ Выбранные столбцы строк файла от позиции start до end.
+
+    Строка декодируется целиком (для ASCII-совместимых кодировок это быстрее, чем декодировать каждое выбранное
+    поле), и делится только до последнего выбранного поля.
+
+    :param csvfile: файл, открытый в двоичном режиме
+    :param start: позиция начала первой строки
+    :param end: конец читаемых данных (конец строки или файла)
+    :param index: индексы выбранных столбцов (по возрастанию)
+    :param encoding: кодировка файла
+    :param predicate: условие отбора строк (проверяется до выбора столбцов, см. filters.compile_where)
+    :param predicate_columns: индексы столбцов, используемых условием
+    :return: Итератор по кортежам выбранных значений.
+    """
+    if start >= end:
+        return
+    project = make_projection(index)
+    # Поля после последнего нужного не разделяются.
+    maxsplit: int = max([index[-1], *predicate_columns]) + 1
+    with mmap.mmap(csvfile.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        mm.seek(start)
+        pos: int = start
+        readline = mm.readline
+        while pos < end:
+            raw = readline()
+            if not raw:
+                # Файл укорочен во время чтения.
+                return
+            line = raw.decode(encoding).rstrip('\r\n')
+            if '"' in line or not line:
+                # Значения в кавычках и пустые строки - как у csv.reader.
+                row, pos = _read_record(mm, pos, end, encoding)
+                mm.seek(pos)
+                if predicate is not None and not predicate(row):
+                    continue
+                try:
+                    yield project(row)
+                except IndexError:
+                    yield project_short(row, index)
+                continue
+
+            pos += len(raw)
+            fields = line.split(field_separator, maxsplit)
+            if predicate is not None and not predicate(fields):
+                continue
+            try:
+                yield project(fields)
+            except IndexError:
+                yield project_short(fields, index)
+
+
+def iter_mmap_records(csvfile: BinaryIO, positions: Iterable[int], end: int, encoding: str) -> Iterator[List[str]]:
+    """ Записи файла, начинающиеся с позиций positions, в порядке positions (например, по индексу сортировки).
+
+    :param csvfile: файл, открытый в двоичном режиме
+    :param positions: позиции начала записей
+    :param end: конец читаемых данных (конец строки или файла)
+    :param encoding: кодировка файла
+    :return: Итератор по спискам значений записей.
+    """
+    with mmap.mmap(csvfile.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        for pos in positions:
+            newline = mm.find(b'\n', pos, end)
+            line = mm[pos:end if newline < 0 else newline].decode(encoding).rstrip('\r')
+            if '"' in line or not line:
+                # Значения в кавычках и пустые строки - как у csv.reader.
+                yield _read_record(mm, pos, end, encoding)[0]
+            else:
+                yield line.split(field_separator)
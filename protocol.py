@@ -0,0 +1,237 @@
+""" Компактный двоичный протокол передачи ответов сервера.
+
+Ответ - это преамбула (MAGIC + байт версии) и последовательность кадров. Кадр: байт типа, длина данных кадра
+(uint32, big-endian) и сами данные. Порция строк кодируется целиком: число строк, число полей каждой строки,
+длины всех полей (всё - uint32, big-endian) и затем сами поля подряд в utf-8. Такое представление позволяет
+кодировать и раскодировать порцию несколькими вызовами вместо цикла по полям.
+
+Протокол согласуется через заголовок 'Content-Type: application/octet-stream; protocol=2'. Если клиент
+не указал версию, сервер отвечает в прежнем формате repr(pickle) (версия 1).
+"""
+import json
+import struct
+from itertools import accumulate, islice
+from typing import Any, Iterable, Iterator, List, Optional, Tuple
+
+# Сигнатура двоичного ответа.
+MAGIC: bytes = b'CSV'
+# Прежний формат: repr(pickle.dumps(...))
+LEGACY_VERSION: int = 1
+# Текущая версия двоичного протокола.
+PROTOCOL_VERSION: int = 2
+# Базовый тип содержимого запросов и ответов.
+MEDIA_TYPE: str = 'application/octet-stream'
+# Тип содержимого, которым клиент запрашивает двоичный протокол.
+CONTENT_TYPE: str = '{}; protocol={}'.format(MEDIA_TYPE, PROTOCOL_VERSION)
+
+# Типы кадров.
+# Конец ответа.
+FRAME_END: int = 0
+# Статус запроса (uint32).
+FRAME_STATUS: int = 1
+# Заголовок файла (одна строка).
+FRAME_HEADER: int = 2
+# Порция строк файла.
+FRAME_ROWS: int = 3
+# Произвольные данные (например, список файлов) в виде JSON.
+FRAME_DATA: int = 4
+
+_uint32 = struct.Struct('>I')
+_frame_head = struct.Struct('>BI')
+
+
+def negotiated_version(content_type: Optional[str]) -> int:
+    """ Версия протокола, указанная в заголовке Content-Type.
+
+    :param content_type: значение заголовка, вида 'application/octet-stream; protocol=2'
+    :return: Версия протокола. Если версия не указана или не поддерживается - LEGACY_VERSION.
+    """
+    if not content_type:
+        return LEGACY_VERSION
+
+    for param in content_type.split(';')[1:]:
+        key, _, value = param.strip().partition('=')
+        if key.strip() == 'protocol':
+            try:
+                version = int(value.strip())
+            except ValueError:
+                return LEGACY_VERSION
+            return version if version == PROTOCOL_VERSION else LEGACY_VERSION
+
+    return LEGACY_VERSION
+
+
+def _frame(frame_type: int, payload: bytes) -> bytes:
+    """ Упаковка данных в кадр. """
+    return _frame_head.pack(frame_type, len(payload)) + payload
+
+
+def encode_preamble() -> bytes:
+    """ Начало двоичного ответа. """
+    return MAGIC + bytes((PROTOCOL_VERSION,))
+
+
+def encode_status(status_value: int) -> bytes:
+    """ Кадр статуса запроса. """
+    return _frame(FRAME_STATUS, _uint32.pack(status_value))
+
+
+def _encode_block(rows: List[Iterable[Any]]) -> bytes:
+    """ Кодирование порции строк. Поля типа bytes передаются как есть, остальные - в виде строк utf-8. """
+    counts: List[int] = []
+    fields: list = []
+    for row in rows:
+        before = len(fields)
+        fields.extend(row)
+        counts.append(len(fields) - before)
+
+    try:
+        text: str = ''.join(fields)
+        is_text: bool = True
+    except TypeError:
+        # Среди полей есть байтовые строки или не строки.
+        text, is_text = '', False
+    if is_text and text.isascii():
+        # Для ASCII длина в символах равна длине в байтах: кодируем всё одним вызовом.
+        data: bytes = text.encode()
+        lengths = list(map(len, fields))
+    else:
+        encoded = [value if isinstance(value, bytes) else str(value).encode() for value in fields]
+        data = b''.join(encoded)
+        lengths = list(map(len, encoded))
+
+    return struct.pack('>{}I'.format(1 + len(counts) + len(lengths)), len(counts), *counts, *lengths) + data
+
+
+def encode_header(header: Iterable[Any]) -> bytes:
+    """ Кадр заголовка файла. """
+    return _frame(FRAME_HEADER, _encode_block([header]))
+
+
+def encode_rows(rows: List[Iterable[Any]]) -> bytes:
+    """ Кадр с порцией строк файла. """
+    return _frame(FRAME_ROWS, _encode_block(rows))
+
+
+def encode_data(data: Any) -> bytes:
+    """ Кадр с произвольными данными, сериализуемыми в JSON. """
+    return _frame(FRAME_DATA, json.dumps(data, ensure_ascii=False).encode())
+
+
+def encode_end() -> bytes:
+    """ Кадр конца ответа. """
+    return _frame(FRAME_END, b'')
+
+
+def _decode_block(payload: bytes) -> List[tuple]:
+    """ Раскодирование порции строк. """
+    count: int = _uint32.unpack_from(payload, 0)[0]
+    counts = struct.unpack_from('>{}I'.format(count), payload, 4)
+    total: int = sum(counts)
+    pos: int = 4 + 4 * count
+    lengths = struct.unpack_from('>{}I'.format(total), payload, pos)
+    pos += 4 * total
+
+    data: bytes = payload[pos:]
+    offsets = list(accumulate(lengths, initial=0))
+    if data.isascii():
+        # Для ASCII смещения в байтах совпадают со смещениями в символах: раскодируем всё одним вызовом.
+        text: Any = data.decode()
+        fields = [text[a:b] for a, b in zip(offsets, offsets[1:])]
+    else:
+        fields = [data[a:b].decode() for a, b in zip(offsets, offsets[1:])]
+
+    iter_fields = iter(fields)
+    return [tuple(islice(iter_fields, n)) for n in counts]
+
+
+def decode_payload(frame_type: int, payload: bytes) -> Any:
+    """ Раскодирование данных кадра.
+
+    :return: Для FRAME_STATUS - значение статуса, для FRAME_HEADER - кортеж, для FRAME_ROWS - список кортежей,
+    для FRAME_DATA - объект JSON, для FRAME_END - None.
+    """
+    if frame_type == FRAME_STATUS:
+        return _uint32.unpack(payload)[0]
+    if frame_type == FRAME_HEADER:
+        return _decode_block(payload)[0]
+    if frame_type == FRAME_ROWS:
+        return _decode_block(payload)
+    if frame_type == FRAME_DATA:
+        return json.loads(payload.decode())
+    if frame_type == FRAME_END:
+        return None
+    raise ValueError("Неизвестный тип кадра: {}".format(frame_type))
+
+
+class FrameDecoder:
+    """ Пошаговый разбор потока байт на кадры: куски ответа передаются в feed по мере получения
+    (например, из асинхронного клиента, который не может отдать iter_frames блокирующий итератор).
+
+    Буферизуется не более одного неполного кадра и кусок, переданный в feed.
+    """
+
+    def __init__(self):
+        self.__buffer = bytearray()
+        self.__is_preamble_read: bool = False
+        # Получен ли кадр конца ответа (куски после него не разбираются).
+        self.finished: bool = False
+
+    def feed(self, chunk: bytes) -> List[Tuple[int, Any]]:
+        """ Разбор очередного куска ответа.
+
+        :return: Кадры, полученные полностью: пары (тип кадра, раскодированные данные).
+        """
+        frames: List[Tuple[int, Any]] = []
+        if self.finished:
+            return frames
+        buffer = self.__buffer
+        buffer += chunk
+        pos: int = 0
+
+        if not self.__is_preamble_read:
+            if len(buffer) < len(MAGIC) + 1:
+                return frames
+            if bytes(buffer[:len(MAGIC)]) != MAGIC or buffer[len(MAGIC)] != PROTOCOL_VERSION:
+                raise ValueError("Ответ не является ответом двоичного протокола версии {}.".format(PROTOCOL_VERSION))
+            self.__is_preamble_read = True
+            pos = len(MAGIC) + 1
+
+        while len(buffer) - pos >= _frame_head.size:
+            frame_type, length = _frame_head.unpack_from(buffer, pos)
+            if len(buffer) - pos - _frame_head.size < length:
+                # Кадр получен не полностью.
+                break
+            start = pos + _frame_head.size
+            payload = bytes(buffer[start:start + length])
+            pos = start + length
+            frames.append((frame_type, decode_payload(frame_type, payload)))
+            if frame_type == FRAME_END:
+                self.finished = True
+                break
+
+        del buffer[:pos]
+        return frames
+
+    def close(self) -> List[Tuple[int, Any]]:
+        """ Конец потока байт: проверка, что ответ получен полностью (кадров после конца ответа не бывает). """
+        if not self.finished:
+            raise ValueError("Ответ оборван до кадра конца.")
+        return []
+
+
+def iter_frames(chunks: Iterable[bytes]) -> Iterator[Tuple[int, Any]]:
+    """ Разбор потока байт (например, response.iter_content()) на кадры.
+
+    Буферизуются неполный кадр и кадры одного куска (см. FrameDecoder), поэтому память не зависит от размера
+    ответа.
+
+    :param chunks: Последовательные куски ответа.
+    :return: Итератор по парам (тип кадра, раскодированные данные), до кадра FRAME_END включительно.
+    """
+    decoder = FrameDecoder()
+    for chunk in chunks:
+        yield from decoder.feed(chunk)
+        if decoder.finished:
+            return
+    decoder.close()
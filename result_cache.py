@@ -0,0 +1,127 @@
+""" Дисковый кэш готовых ответов на запросы файлов.
+
+Ответ хранится уже закодированным (в том виде, в каком уходит клиенту), поэтому повторный запрос - это просто
+копирование файла в сокет. Ключ кэша включает путь, время изменения и размер исходного файла, поэтому
+изменённый файл не может быть отдан из кэша. Записи пишутся во временный файл и атомарно переименовываются,
+так что параллельные запросы не видят недописанных ответов. Объём кэша ограничен: при превышении удаляются
+давно не запрашивавшиеся записи (LRU по времени изменения записи, которое обновляется при каждом попадании).
+"""
+import hashlib
+import os
+import tempfile
+from typing import BinaryIO, Iterable, Iterator, Optional
+
+# Размер куска, которым ответ читается из кэша, байт.
+read_chunk_size: int = 256 * 1024
+# Расширение файлов записей.
+entry_suffix: str = '.bin'
+
+
+class FileBody:
+    """ Тело ответа из файла кэша: итерируется кусками; сервер может отправить файл напрямую (wsgi.file_wrapper). """
+    def __init__(self, file: BinaryIO):
+        self.file: BinaryIO = file
+
+    def __iter__(self) -> Iterator[bytes]:
+        with self.file:
+            while True:
+                chunk = self.file.read(read_chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+
+    def close(self) -> None:
+        self.file.close()
+
+
+class ResultCache:
+    """ Дисковый кэш закодированных ответов с вытеснением давно не использованных записей. """
+    def __init__(self, directory: str, max_bytes: int):
+        """
+
+        :param directory: Директория записей кэша (создаётся при необходимости).
+        :param max_bytes: Допустимый суммарный объём записей, байт.
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.__directory: str = directory
+        self.__max_bytes: int = max_bytes
+
+    @staticmethod
+    def make_key(filepath: str, *params: object, stat: Optional[os.stat_result] = None) -> str:
+        """ Ключ записи для файла и параметров запроса.
+
+        :param filepath: Имя исходного файла с путём.
+        :param params: Параметры запроса, влияющие на ответ (колонки, сортировка, версия протокола и т. п.).
+        :param stat: Сведения о файле, по которым читался ответ (None - текущие).
+        :raises FileNotFoundError: Файл не найден.
+        """
+        if stat is None:
+            stat = os.stat(filepath)
+        source = repr((os.path.abspath(filepath), stat.st_mtime_ns, stat.st_size) + params)
+        return hashlib.sha1(source.encode()).hexdigest()
+
+    def __path(self, key: str) -> str:
+        return os.path.join(self.__directory, key + entry_suffix)
+
+    def get(self, key: str) -> Optional[FileBody]:
+        """ Готовый ответ из кэша.
+
+        :return: Тело ответа или None, если записи нет.
+        """
+        path = self.__path(key)
+        try:
+            file = open(path, 'rb')
+        except FileNotFoundError:
+            return None
+        try:
+            # Отметка использования для вытеснения.
+            os.utime(path)
+        except OSError:
+            pass
+        return FileBody(file)
+
+    def store(self, key: str, body: Iterable[bytes]) -> Iterator[bytes]:
+        """ Передача частей ответа дальше с одновременной записью в кэш.
+
+        Запись появляется в кэше только если ответ передан полностью.
+
+        :param key: Ключ записи.
+        :param body: Части ответа.
+        :return: Те же части ответа.
+        """
+        if self.__max_bytes <= 0:
+            yield from body
+            return
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.__directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                for part in body:
+                    tmp.write(part)
+                    yield part
+            os.replace(tmp_path, self.__path(key))
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        self.evict()
+
+    def evict(self) -> None:
+        """ Удаление давно не использованных записей, пока объём кэша превышает допустимый. """
+        entries = []
+        total: int = 0
+        with os.scandir(self.__directory) as scan:
+            for entry in scan:
+                if entry.name.endswith(entry_suffix):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    total += stat.st_size
+
+        for _, size, path in sorted(entries):
+            if total <= self.__max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                # Запись уже удалена другим процессом (или открыта на чтение в Windows).
+                continue
+            total -= size
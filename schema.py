@@ -0,0 +1,190 @@
+""" Типы столбцов csv-файлов: определение по выборке строк и типизированные ключи сортировки. """
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+# Типы столбцов.
+TYPE_INT: str = 'int'
+TYPE_FLOAT: str = 'float'
+TYPE_DATE: str = 'date'
+TYPE_STR: str = 'str'
+# Число без уточнения (целое или дробное): тип в запросе сортировки и тип столбцов, целых по выборке строк.
+TYPE_NUM: str = 'num'
+# Все типы, которые можно указать в запросе сортировки.
+SORT_TYPES: Tuple[str, ...] = (TYPE_INT, TYPE_FLOAT, TYPE_NUM, TYPE_DATE, TYPE_STR)
+
+# Версия правил определения типов (infer_type). Сохранённые сведения, которые от них зависят (кэш сведений
+# о файлах, поколоночные копии, ключи кэшей ответов), с другой версией не используются.
+INFERENCE_VERSION: int = 2
+
+# Направления сортировки.
+ASC: str = 'asc'
+DESC: str = 'desc'
+
+# Разделитель частей описания сортировки столбца: 'price:num:desc'
+spec_separator: str = ':'
+# Число строк (после заголовка), по которым определяются типы столбцов.
+sample_rows: int = 100
+# Допустимые форматы дат.
+date_formats: Tuple[str, ...] = ('%Y-%m-%d', '%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S', '%d.%m.%Y',
+                                 '%d.%m.%Y %H:%M:%S')
+
+
+def _to_number(value: str) -> Any:
+    """ Преобразование строки в целое число, а если не получилось - в дробное. """
+    try:
+        return int(value)
+    except ValueError:
+        return float(value)
+
+
+def _to_date(value: str) -> float:
+    """ Преобразование строки с датой (в одном из date_formats) в число для сравнения. """
+    for fmt in date_formats:
+        try:
+            moment = datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+        return moment.toordinal() + (moment.hour * 3600 + moment.minute * 60 + moment.second) / 86400
+    raise ValueError("Не дата: {}".format(value))
+
+
+# Преобразователи значений для каждого типа, кроме строкового.
+_converters: Dict[str, Callable[[str], Any]] = {TYPE_INT: int, TYPE_FLOAT: float, TYPE_NUM: _to_number,
+                                                TYPE_DATE: _to_date}
+
+
+def value_converter(type_name: str) -> Callable[[str], Any]:
+    """ Преобразование строкового значения к типу type_name (для строкового типа - без преобразования).
+
+    :raises KeyError: Неизвестный тип.
+    """
+    if type_name == TYPE_STR:
+        return str
+    return _converters[type_name]
+
+
+def infer_type(values: Iterable[str]) -> str:
+    """ Определение типа столбца по его значениям. Пустые значения не учитываются.
+
+    Столбец из целых чисел получает тип num, а не int: значения определяются по выборке, и дробные числа
+    в остальных строках должны сравниваться как числа, а не как неприводимые к типу значения.
+
+    :return: Самый узкий тип, к которому приводятся все непустые значения: num, float, date или str.
+    """
+    candidates: List[str] = [TYPE_INT, TYPE_FLOAT, TYPE_DATE]
+    is_empty: bool = True
+    for value in values:
+        if not value:
+            continue
+        is_empty = False
+        for type_name in list(candidates):
+            try:
+                converted = _converters[type_name](value)
+            except ValueError:
+                candidates.remove(type_name)
+                continue
+            if converted != converted:
+                # NaN не упорядочивается.
+                candidates.remove(type_name)
+        if not candidates:
+            return TYPE_STR
+
+    if is_empty:
+        return TYPE_STR
+    return TYPE_NUM if candidates[0] == TYPE_INT else candidates[0]
+
+
+def infer_types(header: tuple, rows: Iterable[tuple]) -> Tuple[str, ...]:
+    """ Определение типов всех столбцов по выборке строк.
+
+    :param header: Заголовок файла.
+    :param rows: Выборка строк.
+    :return: Кортеж типов в порядке столбцов заголовка.
+    """
+    sample: List[tuple] = list(rows)
+    return tuple(infer_type(row[idx] for row in sample if idx < len(row)) for idx in range(len(header)))
+
+
+def parse_sort_spec(spec: str) -> Tuple[str, Optional[str], bool]:
+    """ Разбор описания сортировки одного столбца вида 'имя[:тип][:asc|desc]'.
+
+    :param spec: Описание, например 'price', 'price:desc', 'price:num:desc'.
+    :return: Имя столбца, тип (None - определить по файлу), признак сортировки по убыванию.
+    :raises ValueError: Описание не распознано.
+    """
+    name, *options = spec.split(spec_separator)
+    type_name: Optional[str] = None
+    descending: bool = False
+    for option in options:
+        if option in SORT_TYPES and type_name is None:
+            type_name = option
+        elif option in (ASC, DESC):
+            descending = option == DESC
+        else:
+            raise ValueError("Неизвестный параметр сортировки: {}".format(option))
+    if not name:
+        raise ValueError("Не указано имя столбца.")
+    return name, type_name, descending
+
+
+class _Descending:
+    """ Обёртка строки, сравнивающаяся в обратном порядке. """
+    __slots__ = ('value',)
+
+    def __init__(self, value: str):
+        self.value = value
+
+    def __lt__(self, other: '_Descending') -> bool:
+        return other.value < self.value
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, _Descending) and self.value == other.value
+
+
+def _column_key(idx: int, type_name: str, descending: bool) -> Callable[[tuple], Any]:
+    """ Ключ сортировки одного столбца.
+
+    Значения, не приводимые к типу столбца, идут после приводимых (в порядке строк по возрастанию).
+    """
+    if type_name == TYPE_STR:
+        if descending:
+            return lambda row: _Descending(row[idx])
+        return lambda row: row[idx]
+
+    convert = _converters[type_name]
+    sign = -1 if descending else 1
+
+    def key(row: tuple) -> tuple:
+        value = row[idx]
+        try:
+            number = convert(value)
+        except ValueError:
+            return 1, value
+        if number != number:
+            # NaN
+            return 1, value
+        return 0, sign * number
+
+    return key
+
+
+def make_sort_key(index: List[int], types: List[str], descending: List[bool]) -> Callable[[tuple], tuple]:
+    """ Ключ сортировки строки по нескольким столбцам.
+
+    Ключ вычисляется один раз на строку (см. decorate) и дальше сравнивается как обычный кортеж.
+
+    :param index: Индексы столбцов в строке.
+    :param types: Типы столбцов.
+    :param descending: Признаки сортировки по убыванию.
+    :return: Функция, возвращающая кортеж ключей столбцов.
+    """
+    keys = [_column_key(idx, type_name, desc) for idx, type_name, desc in zip(index, types, descending)]
+    if len(keys) == 1:
+        single = keys[0]
+        return lambda row: (single(row),)
+    return lambda row: tuple(key(row) for key in keys)
+
+
+def decorate(rows: Iterable[tuple], key: Callable[[tuple], tuple]) -> Iterable[Tuple[tuple, tuple]]:
+    """ Пары (ключ, строка): ключ вычисляется однажды и переживает выгрузку на диск при внешней сортировке. """
+    return ((key(row), row) for row in rows)
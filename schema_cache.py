@@ -0,0 +1,263 @@
+""" Постоянный кэш сведений о csv-файлах: заголовок, типы столбцов, число строк, размер,
+разреженный индекс строк (позиция в байтах каждой index_step-й строки).
+
+Сведения хранятся в файле SQLite и пересчитываются только для файлов, у которых изменились
+время изменения или размер.
+"""
+import csv
+import json
+import os
+import sqlite3
+import threading
+from array import array
+from typing import BinaryIO, Dict, Iterator, List, NamedTuple, Optional, Tuple
+import schema
+
+# Шаг индекса строк: запоминается позиция каждой index_step-й строки.
+index_step: int = 1000
+
+
+class FileInfo(NamedTuple):
+    """ Сведения о csv-файле. """
+    # Заголовок файла
+    header: tuple
+    # Типы столбцов (в порядке заголовка)
+    types: Tuple[str, ...]
+    # Число строк без заголовка
+    rows: int
+    # Размер файла, байт
+    size: int
+    # Время изменения файла
+    mtime: float
+
+    def column_types(self) -> Dict[str, str]:
+        """ Словарь {'имя столбца': 'тип'} """
+        return dict(zip(self.header, self.types))
+
+
+class RowIndex(NamedTuple):
+    """ Разреженный индекс строк файла (без заголовка). """
+    # Шаг индекса, строк
+    step: int
+    # Позиции в файле строк с номерами 0, step, 2 * step, ... (начинаются с нуля), байт
+    offsets: array
+    # Конец проиндексированных данных, байт
+    end: int
+
+    def locate(self, row: int) -> Tuple[int, int]:
+        """ Где начинать чтение, чтобы получить строку с номером row.
+
+        :return: Позиция ближайшей проиндексированной строки не после row (или конец данных) и число строк,
+            которые надо пропустить от неё.
+        """
+        block = row // self.step
+        if block >= len(self.offsets):
+            return self.end, 0
+        return self.offsets[block], row - block * self.step
+
+
+def _iter_lines(csvfile: BinaryIO, encoding: str, position: List[int]) -> Iterator[str]:
+    """ Строки файла; position[0] - позиция в файле после последней выданной строки. """
+    for line in csvfile:
+        position[0] += len(line)
+        yield line.decode(encoding)
+
+
+def scan_file(filepath: str, size: int, mtime: float, encoding: Optional[str] = None) -> Tuple[FileInfo, RowIndex]:
+    """ Чтение сведений о файле и построение индекса строк одним проходом по нему.
+
+    :param filepath: имя файла с путём
+    :param size: размер файла
+    :param mtime: время изменения файла
+    :param encoding: кодировка файла (None - utf-8)
+    """
+    offsets: array = array('q')
+    # csv.reader читает строки файла по одной (несколько - если значение в кавычках содержит перевод строки),
+    # поэтому после разбора записи позиция указывает на начало следующей.
+    position: List[int] = [0]
+    with open(filepath, 'rb') as csvfile:
+        csvreader = csv.reader(_iter_lines(csvfile, encoding or 'utf-8', position))
+        header: tuple = tuple(next(csvreader, ()))
+        sample: List[tuple] = []
+        rows: int = 0
+        while True:
+            start: int = position[0]
+            row = next(csvreader, None)
+            if row is None:
+                break
+            if rows % index_step == 0:
+                offsets.append(start)
+            if rows < schema.sample_rows:
+                sample.append(tuple(row))
+            rows += 1
+    return FileInfo(header, schema.infer_types(header, sample), rows, size, mtime), \
+        RowIndex(index_step, offsets, position[0])
+
+
+class SchemaCache:
+    """ Кэш сведений о файлах в файле SQLite. Ключ записи - имя файла, актуальность проверяется по (mtime, size).
+
+    Один объект кэша можно использовать из нескольких потоков (обращения к базе сериализуются).
+    """
+
+    def __init__(self, path: str, encoding: Optional[str] = None):
+        """
+
+        :param path: Путь к файлу базы данных кэша. Директория создаётся при необходимости.
+        :param encoding: Кодировка csv-файлов (None - utf-8).
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Кэш может одновременно обновляться несколькими процессами: ждём снятия блокировки.
+        self.__cnx = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.__lock = threading.Lock()
+        self.__encoding: Optional[str] = encoding
+        self.__cnx.execute("CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, mtime REAL, size INTEGER, "
+                           "header TEXT, types TEXT, rows INTEGER)")
+        # Индекс строк - отдельно, чтобы не читать его при запросе списка файлов.
+        self.__cnx.execute("CREATE TABLE IF NOT EXISTS row_index (path TEXT PRIMARY KEY, mtime REAL, size INTEGER, "
+                           "step INTEGER, offsets BLOB, data_end INTEGER)")
+        # Число запросов с сортировкой по каждому ключу (для выбора ключей, по которым строятся индексы).
+        self.__cnx.execute("CREATE TABLE IF NOT EXISTS sort_history (path TEXT, spec TEXT, hits INTEGER, "
+                           "PRIMARY KEY (path, spec))")
+        # Типы столбцов, определённые по другим правилам (см. schema.INFERENCE_VERSION), пересчитываются.
+        version, = self.__cnx.execute("PRAGMA user_version").fetchone()
+        if version != schema.INFERENCE_VERSION:
+            self.__cnx.execute("DELETE FROM files")
+            self.__cnx.execute("PRAGMA user_version = {:d}".format(schema.INFERENCE_VERSION))
+        self.__cnx.commit()
+
+    def close(self) -> None:
+        self.__cnx.close()
+
+    def __enter__(self) -> 'SchemaCache':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def __store(self, path: str, info: FileInfo, index: RowIndex) -> None:
+        self.__cnx.execute("INSERT OR REPLACE INTO files (path, mtime, size, header, types, rows) "
+                           "VALUES (?, ?, ?, ?, ?, ?)",
+                           (path, info.mtime, info.size, json.dumps(info.header), json.dumps(info.types),
+                            info.rows))
+        self.__cnx.execute("INSERT OR REPLACE INTO row_index (path, mtime, size, step, offsets, data_end) "
+                           "VALUES (?, ?, ?, ?, ?, ?)",
+                           (path, info.mtime, info.size, index.step, index.offsets.tobytes(), index.end))
+
+    def __scan(self, filepath: str, path: str, stat: os.stat_result) -> Tuple[FileInfo, RowIndex]:
+        """ Чтение сведений о файле и запись их в кэш (без фиксации транзакции). """
+        info, index = scan_file(filepath, stat.st_size, stat.st_mtime, self.__encoding)
+        self.__store(path, info, index)
+        return info, index
+
+    @staticmethod
+    def __from_record(record: tuple) -> FileInfo:
+        mtime, size, header, types, rows = record
+        return FileInfo(tuple(json.loads(header)), tuple(json.loads(types)), rows, size, mtime)
+
+    def get(self, filepath: str) -> FileInfo:
+        """ Сведения об одном файле (пересчитываются, если файл изменился).
+
+        :param filepath: имя файла с путём
+        :raises FileNotFoundError: Файл не найден.
+        """
+        with self.__lock:
+            return self.__get(filepath)
+
+    def __get(self, filepath: str) -> FileInfo:
+        stat = os.stat(filepath)
+        path = os.path.abspath(filepath)
+        record = self.__cnx.execute("SELECT mtime, size, header, types, rows FROM files WHERE path = ?",
+                                    (path,)).fetchone()
+        if record and record[0] == stat.st_mtime and record[1] == stat.st_size:
+            return self.__from_record(record)
+
+        info, _ = self.__scan(filepath, path, stat)
+        self.__cnx.commit()
+        return info
+
+    def row_index(self, filepath: str) -> RowIndex:
+        """ Индекс строк файла (перестраивается, если файл изменился).
+
+        :param filepath: имя файла с путём
+        :raises FileNotFoundError: Файл не найден.
+        """
+        with self.__lock:
+            stat = os.stat(filepath)
+            path = os.path.abspath(filepath)
+            record = self.__cnx.execute("SELECT mtime, size, step, offsets, data_end FROM row_index WHERE path = ?",
+                                        (path,)).fetchone()
+            if record and record[0] == stat.st_mtime and record[1] == stat.st_size and record[2] == index_step:
+                offsets: array = array('q')
+                offsets.frombytes(record[3])
+                return RowIndex(record[2], offsets, record[4])
+
+            _, index = self.__scan(filepath, path, stat)
+            self.__cnx.commit()
+            return index
+
+    def count_sort(self, filepath: str, spec: str) -> int:
+        """ Учёт запроса с сортировкой файла.
+
+        :param filepath: имя файла с путём
+        :param spec: ключ сортировки (см. sort_index.spec_text)
+        :return: Число запросов с сортировкой файла по этому ключу, включая текущий.
+        """
+        with self.__lock:
+            path = os.path.abspath(filepath)
+            self.__cnx.execute("INSERT OR IGNORE INTO sort_history (path, spec, hits) VALUES (?, ?, 0)", (path, spec))
+            self.__cnx.execute("UPDATE sort_history SET hits = hits + 1 WHERE path = ? AND spec = ?", (path, spec))
+            hits, = self.__cnx.execute("SELECT hits FROM sort_history WHERE path = ? AND spec = ?",
+                                       (path, spec)).fetchone()
+            self.__cnx.commit()
+            return hits
+
+    def refresh(self, files_dir: str) -> Dict[str, FileInfo]:
+        """ Сведения обо всех файлах директории.
+
+        Файлы не открываются, если их mtime и размер совпадают с записанными в кэше;
+        записи об удалённых файлах удаляются.
+
+        :param files_dir: папка с файлами.
+        :return: Словарь {'имя файла': сведения}
+        """
+        with self.__lock:
+            return self.__refresh(files_dir)
+
+    def __refresh(self, files_dir: str) -> Dict[str, FileInfo]:
+        directory = os.path.abspath(files_dir)
+        prefix = os.path.join(directory, '')
+        stored: Dict[str, tuple] = {
+            path[len(prefix):]: (mtime, size, header, types, rows)
+            for path, mtime, size, header, types, rows in self.__cnx.execute(
+                "SELECT path, mtime, size, header, types, rows FROM files WHERE substr(path, 1, ?) = ?",
+                (len(prefix), prefix))
+            if os.sep not in path[len(prefix):]}
+
+        result: Dict[str, FileInfo] = {}
+        is_changed: bool = False
+        with os.scandir(files_dir) as entries:
+            for entry in entries:
+                if not entry.is_file():
+                    continue
+                stat = entry.stat()
+                record: Optional[tuple] = stored.pop(entry.name, None)
+                if record and record[0] == stat.st_mtime and record[1] == stat.st_size:
+                    result[entry.name] = self.__from_record(record)
+                    continue
+                result[entry.name], _ = self.__scan(entry.path, prefix + entry.name, stat)
+                is_changed = True
+
+        if stored:
+            # Файлы, удалённые из директории.
+            removed = [(prefix + name,) for name in stored]
+            self.__cnx.executemany("DELETE FROM files WHERE path = ?", removed)
+            self.__cnx.executemany("DELETE FROM row_index WHERE path = ?", removed)
+            self.__cnx.executemany("DELETE FROM sort_history WHERE path = ?", removed)
+            is_changed = True
+
+        if is_changed:
+            self.__cnx.commit()
+        return result
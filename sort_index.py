@@ -0,0 +1,186 @@
+""" Постоянные индексы сортировки для часто используемых ключей сортировки.
+
+Индекс - позиции начала строк файла (в байтах) в порядке ключа сортировки. Отсортированный результат читается
+по индексу строка за строкой, без сортировки. Индекс используется только для того же ключа: индекс 'a,b'
+не используется для сортировки 'a', иначе строки с равными 'a' шли бы в порядке 'b', а не в порядке файла,
+как при сортировке без индекса (при том же ETag и ключе кэша ответов).
+
+Файл индекса: <directory>/<sha1 пути к файлу>-<mtime_ns>-<размер>-<sha1 ключа>.idx, поэтому индекс изменённого
+файла просто не находится. В первой строке файла - описание (JSON): ключ, число строк, конец данных файла,
+дальше - позиции (array 'q').
+"""
+import csv
+import glob
+import hashlib
+import json
+import os
+import sys
+import tempfile
+from array import array
+from typing import BinaryIO, Iterator, List, Optional, Tuple
+from extsort import external_sort, row_size
+import schema
+
+# Описание ключа сортировки: (имя столбца, тип, признак сортировки по убыванию) для каждого столбца.
+SortSpec = List[Tuple[str, str, bool]]
+
+# Имя директории индексов сортировки в каталоге кэша.
+index_dir_name: str = "sort_index"
+# Число позиций, читаемых из файла индекса за раз.
+read_block_rows: int = 64 * 1024
+
+
+def spec_text(spec: SortSpec) -> str:
+    """ Запись ключа сортировки в виде параметра sort: 'имя:тип:asc|desc,...'. """
+    return ','.join('{}:{}:{}'.format(name, type_name, 'desc' if descending else 'asc')
+                    for name, type_name, descending in spec)
+
+
+def _file_prefix(directory: str, filepath: str, stat: os.stat_result) -> str:
+    return os.path.join(directory, '{}-{}-{}-'.format(hashlib.sha1(os.path.abspath(filepath).encode()).hexdigest(),
+                                                      stat.st_mtime_ns, stat.st_size))
+
+
+def _index_path(directory: str, filepath: str, stat: os.stat_result, spec: SortSpec) -> str:
+    return _file_prefix(directory, filepath, stat) + hashlib.sha1(spec_text(spec).encode()).hexdigest() + '.idx'
+
+
+def _read_description(path: str) -> Optional[dict]:
+    try:
+        with open(path, 'rb') as index_file:
+            return json.loads(index_file.readline())
+    except (OSError, ValueError):
+        return None
+
+
+def find_index(directory: str, filepath: str, stat: os.stat_result, spec: SortSpec) -> Optional[str]:
+    """ Индекс текущей версии файла по ключу spec (только по этому же ключу, см. описание модуля).
+
+    :return: Путь к файлу индекса или None.
+    """
+    path = _index_path(directory, filepath, stat, spec)
+    description = _read_description(path)
+    if description is not None and description['spec'] == [list(item) for item in spec]:
+        return path
+    return None
+
+
+def _iter_records(csvfile: BinaryIO, end: int, encoding: str) -> Iterator[Tuple[int, List[str]]]:
+    """ Записи файла (первая - заголовок) до позиции end вместе с позициями их начала. """
+    # Позиция начала первой строки, прочитанной модулем csv для текущей записи.
+    state: dict = {'position': 0, 'start': None}
+
+    def lines() -> Iterator[str]:
+        for line in csvfile:
+            if state['start'] is None:
+                state['start'] = state['position']
+            state['position'] += len(line)
+            if state['position'] > end:
+                return
+            yield line.decode(encoding)
+
+    csvreader = csv.reader(lines())
+    while True:
+        state['start'] = None
+        row = next(csvreader, None)
+        if row is None:
+            return
+        yield state['start'], row
+
+
+class _ShortRow(Exception):
+    """ В файле есть строка без значения столбца ключа. """
+
+
+def build_index(directory: str, filepath: str, stat: os.stat_result, end: int, spec: SortSpec, encoding: str,
+                memory_budget: int, tmp_dir: Optional[str] = None) -> Optional[str]:
+    """ Построение индекса сортировки файла.
+
+    Сортируются пары (ключ, позиция строки) - внешней сортировкой, в пределах memory_budget байт.
+    Порядок строк совпадает с порядком сортировки строк (get_cgi.sort), включая равные ключи.
+
+    :param directory: Каталог индексов.
+    :param filepath: Имя csv-файла с путём.
+    :param stat: Сведения о файле (версия индекса).
+    :param end: Конец данных файла (см. get_cgi.read_end).
+    :param spec: Ключ сортировки (типы указаны для всех столбцов).
+    :param encoding: Кодировка файла.
+    :param memory_budget: Объём памяти под сортируемые пары, байт.
+    :param tmp_dir: Директория для временных файлов сортировки (None - системная).
+    :return: Путь к файлу индекса или None, если в файле нет столбцов ключа или есть строки короче заголовка.
+    """
+    with open(filepath, 'rb') as csvfile:
+        records = _iter_records(csvfile, end, encoding)
+        _, header = next(records, (0, []))
+        try:
+            index: List[int] = [header.index(name) for name, _, _ in spec]
+        except ValueError:
+            return None
+        width: int = max(index) + 1
+        key = schema.make_sort_key(index, [type_name for _, type_name, _ in spec],
+                                   [descending for _, _, descending in spec])
+
+        def pairs() -> Iterator[Tuple[tuple, int]]:
+            for position, row in records:
+                if len(row) < width:
+                    raise _ShortRow()
+                yield key(row), position
+
+        positions = array('q')
+        try:
+            for _, position in external_sort(pairs(), lambda pair: pair[0], memory_budget, tmp_dir,
+                                             size=lambda pair: row_size(pair[0]) + sys.getsizeof(pair[1])):
+                positions.append(position)
+        except _ShortRow:
+            return None
+
+    os.makedirs(directory, exist_ok=True)
+    target = _index_path(directory, filepath, stat, spec)
+    with tempfile.NamedTemporaryFile(dir=directory, prefix='.build', delete=False) as tmp:
+        tmp.write(json.dumps({'spec': spec, 'rows': len(positions), 'end': end}, ensure_ascii=False).encode() + b'\n')
+        positions.tofile(tmp)
+    os.replace(tmp.name, target)
+    remove_stale(directory, filepath, stat)
+    return target
+
+
+def iter_positions(path: str, end: int) -> Optional[Iterator[int]]:
+    """ Позиции строк в порядке индекса.
+
+    :param path: Путь к файлу индекса.
+    :param end: Конец данных файла: индекс, построенный для другого конца данных, не используется.
+    :return: Итератор по позициям или None, если индекс не подходит.
+    """
+    index_file = open(path, 'rb')
+    try:
+        description = json.loads(index_file.readline())
+    except ValueError:
+        index_file.close()
+        return None
+    if description['end'] != end:
+        index_file.close()
+        return None
+
+    def positions() -> Iterator[int]:
+        with index_file:
+            while True:
+                block = array('q')
+                data = index_file.read(read_block_rows * block.itemsize)
+                if not data:
+                    return
+                block.frombytes(data)
+                yield from block
+
+    return positions()
+
+
+def remove_stale(directory: str, filepath: str, stat: os.stat_result) -> None:
+    """ Удаление индексов прежних версий файла. """
+    current = _file_prefix(directory, filepath, stat)
+    file_key = os.path.basename(current).split('-', 1)[0]
+    for path in glob.glob(os.path.join(directory, glob.escape(file_key) + '-*.idx')):
+        if not path.startswith(current):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
@@ -0,0 +1,182 @@
+""" Замер времени этапов обработки запроса и счётчики (строки, байты). Используется сервером и клиентом.
+
+Время этапа - собственное: время вложенных этапов вычитается из времени объемлющего. Это важно для потоковых
+ответов: строки файла разбираются и сортируются по мере сериализации ответа, то есть внутри неё, и без вычитания
+время разбора попало бы и в сериализацию.
+
+Выключенные замеры почти ничего не стоят: start() возвращает общий объект NULL, который ничего не измеряет,
+а итераторы возвращает без обёртки.
+"""
+import json
+import sys
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from itertools import islice
+from typing import Any, Callable, ContextManager, Dict, Iterable, Iterator, List, Optional
+from common import Answer
+
+# Замер времени этапов обработки запросов на сервере (get_cgi.handle, auth_cgi.handle).
+enabled: bool = False
+# Добавлять к ответу заголовок Server-Timing с временем этапов, пройденных до отправки заголовков.
+server_timing: bool = True
+# Файл журнала замеров: одна строка JSON на запрос (None - stderr, в режиме CGI это журнал ошибок веб-сервера).
+log_path: Optional[str] = None
+
+# Блокировка журнала: строки запросов из разных потоков не перемешиваются.
+_log_lock = threading.Lock()
+
+
+class Timings:
+    """ Время этапов и счётчики одного запроса. """
+
+    def __init__(self):
+        # Собственное время этапов, с: {'имя этапа': время}
+        self.spans: Dict[str, float] = {}
+        # Счётчики: {'имя': значение}
+        self.counters: Dict[str, int] = {}
+        self.__started: float = time.perf_counter()
+        # Время вложенных этапов для каждого открытого этапа
+        self.__nested: List[float] = []
+
+    def __enter(self) -> float:
+        self.__nested.append(0.0)
+        return time.perf_counter()
+
+    def __leave(self, name: str, started: float) -> None:
+        elapsed = time.perf_counter() - started
+        self.spans[name] = self.spans.get(name, 0.0) + elapsed - self.__nested.pop()
+        if self.__nested:
+            self.__nested[-1] += elapsed
+
+    def span(self, name: str) -> ContextManager[None]:
+        """ Этап - блок with. """
+        return self.__span(name)
+
+    @contextmanager
+    def __span(self, name: str) -> Iterator[None]:
+        started = self.__enter()
+        try:
+            yield
+        finally:
+            self.__leave(name, started)
+
+    def iterate(self, name: str, items: Iterable[Any], counter: Optional[str] = None, batch: int = 1) -> \
+            Iterator[Any]:
+        """ Этап - получение элементов итератора (время внутри next).
+
+        :param counter: Счётчик, увеличиваемый на единицу для каждого элемента (None - без счётчика).
+        :param batch: Число элементов, получаемых за один замер: для итераторов по строкам файла замер каждой
+            строки стоит дороже её получения. Элементы читаются вперёд не более чем на batch.
+        """
+        iterator = iter(items)
+        if counter is not None:
+            self.counters.setdefault(counter, 0)
+
+        def timed() -> Iterator[Any]:
+            try:
+                while True:
+                    started = self.__enter()
+                    try:
+                        block = list(islice(iterator, batch))
+                    finally:
+                        self.__leave(name, started)
+                    if not block:
+                        return
+                    if counter is not None:
+                        self.counters[counter] += len(block)
+                    yield from block
+            finally:
+                # Прерванное чтение закрывает и исходный итератор (например, запись в кэш ответов).
+                close = getattr(iterator, 'close', None)
+                if close:
+                    close()
+
+        return timed()
+
+    def count(self, name: str, value: int = 1) -> None:
+        """ Увеличение счётчика. """
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def counted(self, name: str, items: Iterable[Any], measure: Callable[[Any], int] = lambda item: 1) -> \
+            Iterator[Any]:
+        """ Элементы итератора с увеличением счётчика на measure(элемент) для каждого. """
+        self.counters.setdefault(name, 0)
+        for item in items:
+            self.counters[name] += measure(item)
+            yield item
+
+    def total(self) -> float:
+        """ Время с начала замеров, с. """
+        return time.perf_counter() - self.__started
+
+    def header_value(self) -> str:
+        """ Значение заголовка Server-Timing: 'db;dur=1.20, parse;dur=35.41' (мс). """
+        return ', '.join('{};dur={:.2f}'.format(name, seconds * 1000) for name, seconds in self.spans.items())
+
+    def record(self, fields: Dict[str, Any]) -> Dict[str, Any]:
+        """ Запись журнала: поля запроса, время этапов и общее (мс), счётчики. """
+        return dict(fields, spans={name: round(seconds * 1000, 3) for name, seconds in self.spans.items()},
+                    total=round(self.total() * 1000, 3), **self.counters)
+
+
+class _NullTimings(Timings):
+    """ Выключенные замеры. """
+
+    def span(self, name: str) -> ContextManager[None]:
+        return nullcontext()
+
+    def iterate(self, name: str, items: Iterable[Any], counter: Optional[str] = None, batch: int = 1) -> \
+            Iterable[Any]:
+        return items
+
+    def count(self, name: str, value: int = 1) -> None:
+        pass
+
+    def counted(self, name: str, items: Iterable[Any], measure: Callable[[Any], int] = lambda item: 1) -> \
+            Iterable[Any]:
+        return items
+
+
+# Выключенные замеры (общий объект).
+NULL: Timings = _NullTimings()
+
+
+def start() -> Timings:
+    """ Замеры нового запроса на сервере (NULL, если замеры выключены). """
+    return Timings() if enabled else NULL
+
+
+def write_log(record: Dict[str, Any]) -> None:
+    """ Запись строки журнала замеров. """
+    line = json.dumps(record, ensure_ascii=False) + '\n'
+    with _log_lock:
+        if log_path is None:
+            sys.stderr.write(line)
+            sys.stderr.flush()
+        else:
+            with open(log_path, 'a', encoding='utf-8') as log_file:
+                log_file.write(line)
+
+
+def finish(timings: Timings, response: Answer, fields: Dict[str, Any]) -> Answer:
+    """ Ответ с замерами: заголовок Server-Timing и строка журнала после отправки тела ответа.
+
+    Тело ответа обычно формируется по мере отправки, поэтому в заголовке - только этапы, пройденные до отправки
+    заголовков (проверка токена, поиск в кэше и т. п.), а все этапы и число отправленных байт - в журнале.
+
+    :param timings: Замеры запроса.
+    :param response: Ответ обработчика.
+    :param fields: Поля записи журнала, описывающие запрос.
+    """
+    if timings is NULL:
+        return response
+    headers = (response.headers + [('Server-Timing', timings.header_value())]) if server_timing else response.headers
+
+    def body() -> Iterator[bytes]:
+        try:
+            yield from timings.counted('bytes', response.body, len)
+        finally:
+            write_log(timings.record(dict(fields, status=response.status)))
+
+    return Answer(headers, body(), response.status)